@@ -1,25 +1,38 @@
 import math
+from array import array
 import colors
+import fast
 from common import *
 from frame import *
+from fixtrig import northclockwise2math
 
 
 class Clock:
     def __init__(self):
         self.last_minute = -1
         self.last_second = -1
+        self.quality = 0  # above 0 the cls clock only repaints when the second changes
+        self.mark = None  # called with (first led, count) of the leds each update changed, e.g. Output.mark_ring
 
         # cls clock
         self.color_h = [26, 26, 0, 127]
         self.color_m = [60, 0, 40, 0]
         self.color_s = [38, 215, 56, 0]
+        self.cls_leds = None  # buffer drawn into, None to mark everything
+        self.cls_hands = array('i', bytes(4 * 6))  # first led and count of each hand drawn last
 
         # neo clock
-        self.color_1 = colors.colors['cyan'][:]
-        self.color_2 = colors.colors['orange'][:]
+        self.color_1 = list(colors.colors['cyan'])
+        self.color_2 = list(colors.colors['orange'])
         self.color_old_hands = self.color_2[:]
         self.color_new_hands = self.color_1[:]
 
+        # what the neo clock drew last, everything else is redrawn incrementally
+        self.neo_leds = None  # buffer drawn into, None to redraw everything
+        self.neo_start = -1
+        self.neo_front = 0
+        self.neo_hands = (0, 0, 0, 0)  # hour and minute hand spans [lo, hi)
+
         self.params = {
             'mode': 'cls',
             # for cls clock
@@ -35,15 +48,20 @@ class Clock:
         self.color_2[:] = list(c2)
         self.color_old_hands[:] = self.color_2
         self.color_new_hands[:] = self.color_1
+        self.neo_leds = None
+        self.cls_leds = None
 
     def set_hand_colors(self, c1, c2, c3):
         self.color_h = list(c1)
         self.color_m = list(c2)
         self.color_s = list(c3)
+        self.cls_leds = None
 
     def update_params(self, params):
         for k, v in params.items():
             self.params[k] = v
+        self.neo_leds = None
+        self.cls_leds = None
 
     def update(self, h, m, s, ms, leds):
         '''
@@ -76,7 +94,7 @@ class Clock:
         if self.params['mode'] == 'neo':
             self.neo(frac_h, frac_m, frac_s, leds, minute_changed)
             repaint = True
-        elif self.params['continuous'] or second_changed:
+        elif self.params['continuous'] and self.quality == 0 or second_changed:
             self.cls(frac_h, frac_m, frac_s, leds)
             repaint = True
 
@@ -94,17 +112,29 @@ class Clock:
         a_m = m / 60. * 2. * math.pi
         a_s = s / 60. * 2. * math.pi
 
-        h_dist = unwind_angle(northclockwise2math(a_h))[0]
-        m_dist = unwind_angle(northclockwise2math(a_m))[0]
-        s_dist = unwind_angle(northclockwise2math(a_s))[0]
+        h_dist = geometry.unwind(northclockwise2math(a_h))
+        m_dist = geometry.unwind(northclockwise2math(a_m))
+        s_dist = geometry.unwind(northclockwise2math(a_s))
 
         # leds[:] = bytearray(n * list(colors.color_ambient)) # <-- extra right-hand side allocation fails due to memory issues
-        for i in range(n):
-            leds[i*4:i*4+4] = bytearray(self.color_1)
-
-        set_area2(m_dist, 6, bytearray(self.color_m), leds)
-        set_area2(h_dist, 8, bytearray(self.color_h), leds)
-        set_area2(s_dist, 1, bytearray(self.color_s), leds)
+        fast.fill(leds, self.color_1, n)
+
+        rasterize([(m_dist, 6, self.color_m), (h_dist, 8, self.color_h), (s_dist, 1, self.color_s)], leds)
+
+        # the background is the same every time, only where the hands were and are now changed
+        if self.mark is not None:
+            hands = self.cls_hands
+            if leds is not self.cls_leds:
+                self.cls_leds = leds
+                self.mark(0, n)
+            else:
+                for j in range(0, 6, 2):
+                    self.mark(hands[j], hands[j + 1])
+            hands[0], hands[1] = area_leds(m_dist, 6)
+            hands[2], hands[3] = area_leds(h_dist, 8)
+            hands[4], hands[5] = area_leds(s_dist, 1)
+            for j in range(0, 6, 2):
+                self.mark(hands[j], hands[j + 1])
 
         # smooth two-led second hand
         # fraction_led = s_dist * leds_per_cm
@@ -118,6 +148,10 @@ class Clock:
     def neo(self, h, m, s, leds, change_color):
         """
         Neo(n) Clock
+
+        Only a color change, a new start or another buffer redraw all leds.
+        Otherwise the leds between the last and the current seconds front and
+        the spans of hands that moved are drawn.
         """
 
         if change_color:  # switch colors
@@ -130,37 +164,76 @@ class Clock:
             else:  # random neo mode
                 self.color_2[:] = list(colors.random_saturated_2(self.color_1))
 
-        if self.params['start_at_minute']:  # start seconds at minute hand
+        at_minute = self.params['start_at_minute']
+        if at_minute:  # start seconds at minute hand
             m_h = int(m) / 60. * 2. * math.pi
-            m_i = int(unwind_angle(northclockwise2math(m_h))[0] * leds_per_cm)
+            m_i = int(geometry.unwind(northclockwise2math(m_h)) * leds_per_cm)
             start = m_i
         else:  # start seconds at at 12 o'clock
             m_h = m / 60. * 2. * math.pi
-            m_i = int(unwind_angle(northclockwise2math(m_h))[0] * leds_per_cm)
-            start = int(unwind_angle(northclockwise2math(0))[0] * leds_per_cm)
+            m_i = int(geometry.unwind(northclockwise2math(m_h)) * leds_per_cm)
+            start = int(geometry.unwind(northclockwise2math(0)) * leds_per_cm)
 
         a_h = h / 12. * 2. * math.pi
-        h_i = int(unwind_angle(northclockwise2math(a_h))[0] * leds_per_cm)
+        h_i = int(geometry.unwind(northclockwise2math(a_h)) * leds_per_cm)
 
         fraction_led = s / 60. * n
-        frac, frac_led_index = math.modf(fraction_led)
-        n_leds = int(frac_led_index)  # number of seconds leds (from top to seconds hand if not linear, else from start)
-        frac_led_index = (start + n_leds) % n
-
-        h_hand_range = range(h_i-5, h_i+5)
-        m_hand_range = range(m_i-3, m_i+3)
-        if self.params['start_at_minute']:
-            h_hand_range = range(h_i-3, h_i+3)
-
-        for i in range(start, start + n):
-            a_i = i % n
-            is_hand = a_i in h_hand_range or a_i in m_hand_range and not self.params['start_at_minute']
-            if i < start + n_leds:  # seconds passed
-                icolor = self.color_2 if not is_hand else self.color_new_hands
-            elif i > start + n_leds:  # seconds to be passed
-                icolor = self.color_1 if not is_hand else self.color_old_hands
-            elif is_hand:  # frac_led_index and hand (partially lit)
-                icolor = interpolate_rgbw(self.color_old_hands, self.color_new_hands, frac)
-            else:  # frac_led_index and not a hand (partially lit)
-                icolor = interpolate_rgbw(self.color_1, self.color_2, frac)
-            leds[a_i * 4:a_i * 4 + 4] = bytearray(icolor)
+        frac, front = math.modf(fraction_led)
+        front = int(front)  # number of seconds leds (from top to seconds hand if not linear, else from start)
+
+        # hands as spans of led indices, the minute hand is hidden when the seconds start there
+        if at_minute:
+            hands = (h_i-3, h_i+3, 0, 0)
+        else:
+            hands = (h_i-5, h_i+5, m_i-3, m_i+3)
+
+        if change_color or leds is not self.neo_leds or start != self.neo_start:
+            old_hands = hands
+            self.neo_leds = leds
+            self.neo_start = start
+            self.neo_hands = hands
+            for r in range(n):
+                self.neo_led(leds, (start + r) % n, r, front, frac)
+            if self.mark is not None:
+                self.mark(0, n)
+        else:
+            old_hands = self.neo_hands
+            self.neo_hands = hands
+            # seconds front, moves forward by a fraction of a led per tick
+            old_front = self.neo_front
+            r0, r1 = min(old_front, front), max(old_front, front) + 1
+            for r in range(r0, r1):
+                self.neo_led(leds, (start + r) % n, r, front, frac)
+            if self.mark is not None:
+                self.mark(start + r0, r1 - r0)
+        self.neo_front = front
+
+        if hands != old_hands:  # hands moved, draw where they were and where they are now
+            for lo, hi in ((old_hands[0], old_hands[1]), (old_hands[2], old_hands[3]),
+                           (hands[0], hands[1]), (hands[2], hands[3])):
+                lo, hi = max(0, lo), min(n, hi)
+                for a_i in range(lo, hi):
+                    self.neo_led(leds, a_i, (a_i - start) % n, front, frac)
+                if self.mark is not None and lo < hi:
+                    self.mark(lo, hi - lo)
+
+    def neo_led(self, leds, a_i, r, front, frac):
+        """
+        Draw led a_i, the r-th led after the start of the seconds.
+        """
+        h_lo, h_hi, m_lo, m_hi = self.neo_hands
+        is_hand = h_lo <= a_i < h_hi or m_lo <= a_i < m_hi
+        o = a_i * 4
+        if r < front:  # seconds passed
+            icolor = self.color_2 if not is_hand else self.color_new_hands
+        elif r > front:  # seconds to be passed
+            icolor = self.color_1 if not is_hand else self.color_old_hands
+        else:  # seconds front, partially lit
+            a, b = (self.color_old_hands, self.color_new_hands) if is_hand else (self.color_1, self.color_2)
+            for c in range(4):
+                leds[o + c] = int(interpolate(a[c], b[c], frac))
+            return
+        leds[o] = icolor[0]
+        leds[o + 1] = icolor[1]
+        leds[o + 2] = icolor[2]
+        leds[o + 3] = icolor[3]
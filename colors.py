@@ -1,73 +1,74 @@
-import utime
+import os
 import random
 
-h, m, s = utime.localtime()[3:6]
-random.seed(int(str(h) + str(m) + str(s)))
+# seed from the hardware rng, the clock is not synced yet at import
+random.seed(int.from_bytes(os.urandom(4), 'little'))
 
 color_ambient = [1, 0, 1, 8]
 
-saturated_rgb = {
-    'red': 'ff0000',
-    'orange': 'ff8800',
-    'yellow': 'ffff00',
-    'grass': '88ff00',
-    'green': '00ff00',
-    'mermaid': '00ff88',
-    'cyan': '00ffff',
-    'sky': '0088ff',
-    'blue': '0000ff',
-    'purple': '8800ff',
-    'magenta': 'ff00ff',
-    'rose': 'ff0088'
+# colors are stored as grbw bytes, the comments hold the original rgb hex values
+saturated = {
+    'red': b'\x00\xff\x00\x00',  # ff0000
+    'orange': b'\x88\xff\x00\x00',  # ff8800
+    'yellow': b'\xff\xff\x00\x00',  # ffff00
+    'grass': b'\xff\x88\x00\x00',  # 88ff00
+    'green': b'\xff\x00\x00\x00',  # 00ff00
+    'mermaid': b'\xff\x00\x88\x00',  # 00ff88
+    'cyan': b'\xff\x00\xff\x00',  # 00ffff
+    'sky': b'\x88\x00\xff\x00',  # 0088ff
+    'blue': b'\x00\x00\xff\x00',  # 0000ff
+    'purple': b'\x00\x88\xff\x00',  # 8800ff
+    'magenta': b'\x00\xff\xff\x00',  # ff00ff
+    'rose': b'\x00\xff\x88\x00'  # ff0088
 }
 
-accents_rgb = {
-    'river_blue': '00aaff',  # colors that go well with this below
-    'giants_orange': 'ff8811',
-    'fuchsia': 'f100fe',
-    'coral_pink': 'fe938c',
-    'coral': 'ff5619',
-    'yellow': 'ffcc919',
-    'bright_pink': 'F7567C',
-    'plum': '9c528b',
-    'plum_web': 'ec91d8',
-    'rose_bonbon': 'ff499e',
-    'dark_pastel_green': '4cb944',
-    'crimson': 'd72638'
+accents = {
+    'river_blue': b'\xaa\x00\xff\x00',  # 00aaff, colors that go well with this below
+    'giants_orange': b'\x88\xff\x11\x00',  # ff8811
+    'fuchsia': b'\x00\xf1\xfe\x00',  # f100fe
+    'coral_pink': b'\x93\xfe\x8c\x00',  # fe938c
+    'coral': b'\x56\xff\x19\x00',  # ff5619
+    'yellow': b'\xcc\xff\x91\x00',  # ffcc91
+    'bright_pink': b'\x56\xf7\x7c\x00',  # f7567c
+    'plum': b'\x52\x9c\x8b\x00',  # 9c528b
+    'plum_web': b'\x91\xec\xd8\x00',  # ec91d8
+    'rose_bonbon': b'\x49\xff\x9e\x00',  # ff499e
+    'dark_pastel_green': b'\xb9\x4c\x44\x00',  # 4cb944
+    'crimson': b'\x26\xd7\x38\x00'  # d72638
 }
 
 
-def hex2grb0(h):
-    h = h.lstrip('#')
-    x = [int(h[i:i+2], 16) for i in (2, 0, 4)]
-    x.append(0)
-    return x
-
-
 # create color map
 colors = {}
-for key in saturated_rgb.keys():
-    colors[key] = hex2grb0(saturated_rgb[key])
-for key in accents_rgb.keys():
-    colors[key] = hex2grb0(accents_rgb[key])
-
-
-gamma = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-         0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1,
-         1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2,
-         2, 3, 3, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 5, 5, 5,
-         5, 6, 6, 6, 6, 7, 7, 7, 7, 8, 8, 8, 9, 9, 9, 10,
-         10, 10, 11, 11, 11, 12, 12, 13, 13, 13, 14, 14, 15, 15, 16, 16,
-         17, 17, 18, 18, 19, 19, 20, 20, 21, 21, 22, 22, 23, 24, 24, 25,
-         25, 26, 27, 27, 28, 29, 29, 30, 31, 32, 32, 33, 34, 35, 35, 36,
-         37, 38, 39, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 50,
-         51, 52, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 66, 67, 68,
-         69, 70, 72, 73, 74, 75, 77, 78, 79, 81, 82, 83, 85, 86, 87, 89,
-         90, 92, 93, 95, 96, 98, 99, 101, 102, 104, 105, 107, 109, 110, 112, 114,
-         115, 117, 119, 120, 122, 124, 126, 127, 129, 131, 133, 135, 137, 138, 140, 142,
-         144, 146, 148, 150, 152, 154, 156, 158, 160, 162, 164, 167, 169, 171, 173, 175,
-         177, 180, 182, 184, 186, 189, 191, 193, 196, 198, 200, 203, 205, 208, 210, 213,
-         215, 218, 220, 223, 225, 228, 231, 233, 236, 239, 241, 244, 247, 249, 252, 255]
+colors.update(saturated)
+colors.update(accents)
+
+
+def grbw2hex(c):
+    return '{:02x}{:02x}{:02x}'.format(c[1], c[0], c[2])
+
+
+# the collections under their old names, rgb hex strings as before
+saturated_rgb = {key: grbw2hex(c) for key, c in saturated.items()}
+accents_rgb = {key: grbw2hex(c) for key, c in accents.items()}
+
+
+gamma = (b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+         b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01\x01\x01\x01'
+         b'\x01\x01\x01\x01\x01\x01\x01\x01\x01\x02\x02\x02\x02\x02\x02\x02'
+         b'\x02\x03\x03\x03\x03\x03\x03\x03\x04\x04\x04\x04\x04\x05\x05\x05'
+         b'\x05\x06\x06\x06\x06\x07\x07\x07\x07\x08\x08\x08\x09\x09\x09\x0a'
+         b'\x0a\x0a\x0b\x0b\x0b\x0c\x0c\x0d\x0d\x0d\x0e\x0e\x0f\x0f\x10\x10'
+         b'\x11\x11\x12\x12\x13\x13\x14\x14\x15\x15\x16\x16\x17\x18\x18\x19'
+         b'\x19\x1a\x1b\x1b\x1c\x1d\x1d\x1e\x1f\x20\x20\x21\x22\x23\x23\x24'
+         b'\x25\x26\x27\x27\x28\x29\x2a\x2b\x2c\x2d\x2e\x2f\x30\x31\x32\x32'
+         b'\x33\x34\x36\x37\x38\x39\x3a\x3b\x3c\x3d\x3e\x3f\x40\x42\x43\x44'
+         b'\x45\x46\x48\x49\x4a\x4b\x4d\x4e\x4f\x51\x52\x53\x55\x56\x57\x59'
+         b'\x5a\x5c\x5d\x5f\x60\x62\x63\x65\x66\x68\x69\x6b\x6d\x6e\x70\x72'
+         b'\x73\x75\x77\x78\x7a\x7c\x7e\x7f\x81\x83\x85\x87\x89\x8a\x8c\x8e'
+         b'\x90\x92\x94\x96\x98\x9a\x9c\x9e\xa0\xa2\xa4\xa7\xa9\xab\xad\xaf'
+         b'\xb1\xb4\xb6\xb8\xba\xbd\xbf\xc1\xc4\xc6\xc8\xcb\xcd\xd0\xd2\xd5'
+         b'\xd7\xda\xdc\xdf\xe1\xe4\xe7\xe9\xec\xef\xf1\xf4\xf7\xf9\xfc\xff')
 
 
 def complement(rgbw, keep_w=True):
@@ -81,18 +82,18 @@ def random_color(collection):
     """
     Get a random color from either saturated or accents collection.
     Returns:
-    list with four integers
+    bytes with the grbw channels
     """
     x = int(random.getrandbits(5) / (2 ** 5 - 1) * (len(collection) - 1))
     return colors[list(collection.keys())[x]]
 
 
 def random_saturated():
-    return random_color(saturated_rgb)
+    return random_color(saturated)
 
 
 def random_accent():
-    return random_color(accents_rgb)
+    return random_color(accents)
 
 
 def random_saturated_2(color_1):
@@ -40,3 +40,56 @@ def interpolate_rgbw(a, b, t):
     for i in range(4):
         c.append(int(interpolate(a[i], b[i], t)))
     return c
+
+
+class LRU:
+    """
+    Bookkeeping shared by the caches: entries by key, the use counter of their
+    last lookup and hit, miss and eviction counts. evict() drops the least
+    recently used entry with a linear scan, fine for the few dozen entries kept.
+    """
+
+    def __init__(self):
+        self.entries = {}  # key -> value
+        self.last_use = {}  # key -> use counter
+        self.uses = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """
+        Value stored for key or None, counts as a use.
+        """
+        self.uses += 1
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.last_use[key] = self.uses
+        return value
+
+    def store(self, key, value):
+        self.entries[key] = value
+        self.last_use[key] = self.uses
+
+    def evict(self):
+        """
+        Drop the least recently used entry and return its value.
+        """
+        oldest = None
+        for key in self.last_use:
+            if oldest is None or self.last_use[key] < self.last_use[oldest]:
+                oldest = key
+        del self.last_use[oldest]
+        self.evictions += 1
+        return self.entries.pop(oldest)
+
+    def clear(self):
+        self.entries = {}
+        self.last_use = {}
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
@@ -5,7 +5,7 @@
 # to your .zshrc/.bashrc:
 
 mkdir -p build
-for f in clock.py colors.py common.py frame.py paris.py solunar.py timing.py; do
+for f in clock.py colors.py common.py fast.py fixtrig.py frame.py hal.py indexed.py memstat.py output.py pacing.py paris.py preview.py solunar.py timing.py; do
     g="${f%.*}"
-    mpy-cross ${f} -o build/${g}.mpy
+    mpy-cross -march=xtensa ${f} -o build/${g}.mpy  # xtensa code for the viper functions in fast.py
 done
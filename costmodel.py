@@ -0,0 +1,325 @@
+# cost model of the render paths on the esp8266
+#
+#   python costmodel.py [-v]              count operations per frame on a host python and estimate
+#                                         the device time, exits with an error if a path is over budget
+#   import costmodel; costmodel.calibrate()   on the device, prints a calibration table to paste below
+#
+# host timings say little about a 160 MHz esp8266, so the render paths are run under a tracer
+# that counts what is expensive there: interpreted bytecodes, loop iterations, float operations
+# (software floats), math calls, python calls, allocations and slice copies. the calibration
+# table turns the counts into microseconds. float operations are recognized from the operand
+# types at load time, results of calls and attribute loads count as ints, so they are a lower bound.
+# the pure python kernels of fast.py are viper code on the device, their bytecodes count as native ops.
+
+import sys
+
+# microseconds per counted operation on the device, on top of the bytecodes it takes.
+# rough estimates, replace them with the output of calibrate() run on the device
+calibration = {
+    'bytecodes': 0.9,
+    'loop_iterations': 2.2,
+    'float_ops': 3.1,
+    'trig_calls': 38.,
+    'builtin_calls': 4.5,
+    'calls': 11.,
+    'allocs': 9.,
+    'slice_copies': 6.,
+    'native_ops': 0.05,
+}
+
+# estimated device microseconds per frame
+budgets = {
+    'clock_cls': 16000,
+    'clock_neo': 4000,
+    'spin': 3000,
+    'larson_scanner': 5000,
+    'draw_solunar_positions': 8000,
+    'sky_snapshot': 12000,
+}
+
+# functions whose calls are listed per frame
+watched = ('unwind_angle', 'unwind', 'sine', 'interpolate', 'interpolate_rgbw', 'set_area2', 'blend_area',
+           'northclockwise2math', 'get', 'flush', 'write_segment')
+
+trig = ('sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'sqrt', 'exp', 'log', 'pow', 'fmod', 'floor', 'modf')
+constructors = ('bytearray', 'bytes', 'list', 'tuple', 'dict', 'memoryview', 'range', 'enumerate', 'zip', 'float')
+
+warmup = 64
+frames = 8
+
+
+class OpCounter:
+    """
+    Counts device relevant operations of the code run between start() and stop().
+
+    Instructions are decoded with dis, which knows the bytecode of the running
+    interpreter. The opcodes differ between versions (e.g. BINARY_MULTIPLY up to
+    3.10 and BINARY_OP from 3.11, BINARY_SLICE from 3.12), both spellings are
+    recognized. Only the versions in supported have been checked to give the same counts.
+    """
+
+    supported = ((3, 9), (3, 10), (3, 11), (3, 12), (3, 13))
+
+    LOADS = ('LOAD_FAST', 'LOAD_FAST_CHECK', 'LOAD_FAST_AND_CLEAR')
+    TRUE_DIVIDE = ('/', '/=', 'BINARY_TRUE_DIVIDE', 'INPLACE_TRUE_DIVIDE')
+
+    def __init__(self):
+        self.counts = {}
+        self.calls = {}
+        self._code = {}  # code -> {offset: (opname, argval, argrepr)}
+        self._stack = []  # whether the values loaded last are floats
+        self._last = None
+        self._constructors = 0  # constructors loaded and not called yet
+        import fast
+        self.native = set(f.__code__ for name, f in vars(fast).items() if name.startswith('py_'))
+
+    def reset(self):
+        self.counts = {k: 0 for k in calibration}
+        self.calls = {}
+        self._constructors = 0
+
+    def start(self):
+        sys.setprofile(self._profile)
+        sys.settrace(self._trace)
+
+    def stop(self):
+        sys.settrace(None)
+        sys.setprofile(None)
+
+    def _profile(self, frame, event, arg):
+        if event != 'c_call' or frame.f_code in self.native:
+            return
+        name = getattr(arg, '__name__', '')
+        module = getattr(arg, '__module__', None) or getattr(getattr(arg, '__self__', None), '__name__', '')
+        if module == 'math' and name in trig:
+            self.counts['trig_calls'] += 1
+        elif name in constructors:
+            self.counts['allocs'] += 1
+        else:
+            self.counts['builtin_calls'] += 1
+
+    def _trace(self, frame, event, arg):
+        if event == 'call':
+            name = frame.f_code.co_name
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.counts['calls'] += 1
+            frame.f_trace_opcodes = True
+            frame.f_trace_lines = False
+        elif event == 'opcode':
+            self._opcode(frame)
+        return self._trace
+
+    def _decode(self, code):
+        import dis
+        ops = {}
+        for ins in dis.get_instructions(code):
+            ops[ins.offset] = (ins.opname, ins.argval, ins.argrepr)
+        self._code[code] = ops
+        return ops
+
+    def _push(self, value):
+        self._stack.append(isinstance(value, float))
+
+    def _pop(self):
+        return self._stack.pop() if self._stack else False
+
+    def _opcode(self, frame):
+        code = frame.f_code
+        if code in self.native:
+            self.counts['native_ops'] += 1
+            return
+        ops = self._code.get(code) or self._decode(code)
+        op, argval, argrepr = ops.get(frame.f_lasti, ('', None, ''))
+        counts = self.counts
+        counts['bytecodes'] += 1
+        if op in self.LOADS:
+            self._push(frame.f_locals.get(argval))
+        elif op == 'LOAD_FAST_LOAD_FAST':  # 3.13
+            self._push(frame.f_locals.get(argval[0]))
+            self._push(frame.f_locals.get(argval[1]))
+        elif op == 'LOAD_CONST':
+            self._push(argval)
+        elif op == 'LOAD_GLOBAL':
+            value = frame.f_globals.get(argval)
+            if value is None and argval in constructors:  # calling a type is no c_call event
+                self._constructors += 1
+            self._push(value)
+        elif op.startswith('CALL') and not op.startswith('CALL_INTRINSIC'):
+            if self._constructors:
+                self._constructors -= 1
+                counts['allocs'] += 1
+            self._stack = []
+        elif op == 'BINARY_OP' or (op.startswith(('BINARY_', 'INPLACE_')) and op not in ('BINARY_SUBSCR', 'BINARY_SLICE')):
+            b, a = self._pop(), self._pop()
+            is_float = a or b or argrepr in self.TRUE_DIVIDE or op in self.TRUE_DIVIDE
+            if is_float:
+                counts['float_ops'] += 1
+            self._stack.append(is_float)
+        elif op == 'COMPARE_OP':
+            if self._pop() | self._pop():
+                counts['float_ops'] += 1
+            self._stack.append(False)
+        elif op == 'UNARY_NEGATIVE':
+            if self._stack and self._stack[-1]:
+                counts['float_ops'] += 1
+        elif op == 'FOR_ITER':
+            counts['loop_iterations'] += 1
+            self._stack = []
+        elif op == 'BINARY_SLICE' or (op == 'BINARY_SUBSCR' and self._last == 'BUILD_SLICE'):
+            counts['slice_copies'] += 1
+            counts['allocs'] += 1  # a slice read is a new object
+            self._stack = []
+        elif op == 'STORE_SLICE' or (op == 'STORE_SUBSCR' and self._last == 'BUILD_SLICE'):
+            counts['slice_copies'] += 1
+            self._stack = []
+        elif op in ('BUILD_LIST', 'BUILD_TUPLE', 'BUILD_MAP'):
+            counts['allocs'] += 1
+            self._stack = []
+        elif op not in ('BUILD_SLICE', 'CACHE', 'EXTENDED_ARG', 'NOP', 'RESUME'):
+            self._stack = []
+        self._last = op
+
+
+def estimate_us(counts):
+    return sum(counts[k] * calibration[k] for k in calibration)
+
+
+def profile(render, counter):
+    for i in range(warmup):
+        render(i)
+    # one traced frame first, 3.12 only traces the opcodes of code that has been traced before
+    counter.reset()
+    counter.start()
+    try:
+        render(warmup)
+    finally:
+        counter.stop()
+    counter.reset()
+    counter.start()
+    try:
+        for i in range(frames):
+            render(warmup + i)
+    finally:
+        counter.stop()
+    per_frame = {k: v / frames for k, v in counter.counts.items()}
+    calls = {k: v / frames for k, v in counter.calls.items()}
+    return per_frame, calls
+
+
+def main(verbose=False):
+    from memcheck import render_paths
+
+    counter = OpCounter()
+    failed = []
+    keys = tuple(calibration)
+    print('{:4s} {:24s} '.format('', 'per frame') + ' '.join('{:>9s}'.format(k[:9]) for k in keys)
+          + ' {:>9s} {:>9s}'.format('est [us]', 'budget'))
+    for name, render in render_paths():
+        counts, calls = profile(render, counter)
+        us = estimate_us(counts)
+        ok = us <= budgets[name]
+        if not ok:
+            failed.append(name)
+        print('{:4s} {:24s} '.format('ok' if ok else 'FAIL', name) + ' '.join('{:9.0f}'.format(counts[k]) for k in keys)
+              + ' {:9.0f} {:9d}'.format(us, budgets[name]))
+        if verbose:
+            print('     calls: ' + ', '.join('{} {:g}'.format(f, calls[f]) for f in watched if f in calls))
+    return failed
+
+
+def calibrate(n=2000):
+    """
+    Time each kind of operation on the running interpreter and print a calibration table.
+    """
+    import math
+    import fast
+    from hal import utime
+
+    def timed(f):
+        t0 = utime.ticks_us()
+        f(n)
+        return utime.ticks_diff(utime.ticks_us(), t0) / n
+
+    def empty(n):
+        for i in range(n):
+            pass
+
+    def assign(n):
+        for i in range(n):
+            x = i
+            x = i
+            x = i
+            x = i
+
+    def int_mul(n):
+        a, b = 3, 7
+        for i in range(n):
+            x = a * b
+
+    def float_mul(n):
+        a, b = 3., 7.
+        for i in range(n):
+            x = a * b
+
+    def sin(n):
+        f = 0.5
+        for i in range(n):
+            x = math.sin(f)
+
+    def builtin(n):
+        f = -5
+        for i in range(n):
+            x = abs(f)
+
+    def g():
+        pass
+
+    def call(n):
+        for i in range(n):
+            g()
+
+    def alloc(n):
+        for i in range(n):
+            x = bytearray(4)
+
+    def slice_copy(n):
+        b = bytearray(16)
+        c = bytearray(4)
+        for i in range(n):
+            b[4:8] = c
+
+    def native(n):
+        fast.fill(b, c, n)
+
+    def interpreted(n):
+        fast.py_fill(b, c, n)
+
+    b = bytearray(4 * n)
+    c = bytearray(4)
+    loop = timed(empty)
+    bytecode = (timed(assign) - loop) / 8  # 4 x load and store
+    table = {
+        'bytecodes': bytecode,
+        'loop_iterations': loop - 2 * bytecode,  # for iter and jump
+        'float_ops': timed(float_mul) - timed(int_mul),
+        'trig_calls': timed(sin) - loop - 6 * bytecode,
+        'builtin_calls': timed(builtin) - loop - 5 * bytecode,
+        'calls': timed(call) - loop - 4 * bytecode,
+        'allocs': timed(alloc) - loop - 5 * bytecode,
+        'slice_copies': timed(slice_copy) - loop - 6 * bytecode,
+        'native_ops': bytecode * timed(native) / timed(interpreted),  # same ops as viper code
+    }
+    print('calibration = {')
+    for k in calibration:
+        print("    '{}': {:.2f},".format(k, max(0., table[k])))
+    print('}')
+    return table
+
+
+if __name__ == '__main__':
+    if sys.version_info[:2] not in OpCounter.supported:
+        print('python {}.{} is not supported by the op counter, use one of {}'.format(
+            sys.version_info[0], sys.version_info[1], ', '.join('{}.{}'.format(*v) for v in OpCounter.supported)))
+        sys.exit(2)
+    failed = main('-v' in sys.argv)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,160 @@
+# host tool: render the solunar and clock modes over a date range for many frame geometries and locations
+#
+#   python farm.py --geometry 36x54@0.6 --geometry 24x40@1.0 --location 48.860536,2.332237 \
+#                  --start 2022-01-01 --end 2022-12-31 --step 1 --modes solunar,cls --out frames
+#
+# work is split into one task per geometry, location, mode and day and spread over a process pool.
+# each task writes one packed frame file, an interrupted run skips the files already written when
+# started again (--force renders everything).
+#
+# frame file: header (see HEADER) followed by count frames of n * 4 grbw bytes
+
+import argparse
+import calendar
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+# magic, version, n, rows, cols, leds per cm, lat, long, start (unix seconds), step seconds, count
+HEADER = '<4sHHHHfffqII'
+MAGIC = b'SLMF'
+VERSION = 1
+
+modes = ('solunar', 'cls', 'neo')
+
+
+def parse_geometry(s):
+    size, lpc = s.split('@')
+    rows, cols = size.split('x')
+    return int(rows), int(cols), float(lpc)
+
+
+def parse_location(s):
+    lat, long = s.split(',')
+    return float(lat), float(long)
+
+
+def parse_date(s):
+    y, m, d = s.split('-')
+    return calendar.timegm((int(y), int(m), int(d), 0, 0, 0))
+
+
+def task_path(out, geometry, location, mode, day):
+    g = '{}x{}@{}'.format(*geometry)
+    loc = 'any' if location is None else '{:.4f},{:.4f}'.format(*location)
+    date = time.strftime('%Y-%m-%d', time.gmtime(day))
+    return os.path.join(out, g, loc, mode, date + '.frames')
+
+
+def init_worker(geometry, precision):
+    # configure the frame before the modes star-import it
+    import frame
+    frame.configure(*geometry)
+    import solunar
+    solunar.set_precision(precision)
+    solunar.ephemeris.enabled = False  # frames never repeat a time, the cache would only cost
+
+
+def render_day(task):
+    """
+    Render one day of one mode and write it to its frame file.
+
+    Returns:
+    ----------------
+    tuple : str, int
+        path and number of frames rendered
+    """
+    import frame
+    import paris
+    import solunar
+
+    path, geometry, location, mode, day, step, utc_offset = task
+    n = frame.n
+    count = 86400 // step
+    leds = bytearray(n * 4)
+    clock = paris.clk.Clock()
+    clock.set_background_colors(paris.color_ambient, paris.color_river)
+    clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], paris.color_accent)
+    clock.update_params({'mode': mode, 'continuous': True, 'start_at_minute': False, 'two_colors': True})
+
+    lat, long = location if location is not None else (0., 0.)
+    event = solunar.is_equinox_or_solstice(tuple(time.gmtime(day))[:8]) if mode == 'solunar' else -1
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack(HEADER, MAGIC, VERSION, n, frame.rows, frame.cols, frame.leds_per_cm,
+                            lat, long, day, step, count))
+        for k in range(count):
+            t = day + k * step
+            if mode == 'solunar':
+                paris.render_solunar(location, tuple(time.gmtime(t))[:8], event, leds)
+            else:
+                s = (t + utc_offset * 3600) % 86400
+                clock.update(s // 3600, s // 60 % 60, s % 60, 0, leds)
+            f.write(leds)
+    os.replace(tmp, path)
+    return path, count
+
+
+def tasks(args):
+    for geometry in args.geometry:
+        group = []
+        for mode in args.modes:
+            locations = args.location if mode == 'solunar' else [None]  # the clock does not depend on the location
+            for location in locations:
+                for day in range(args.start, args.end + 1, 86400):
+                    path = task_path(args.out, geometry, location, mode, day)
+                    if not args.force and os.path.exists(path):
+                        continue
+                    group.append((path, geometry, location, mode, day, args.step, args.utc_offset))
+        yield geometry, group
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='render solunar and clock frames for many geometries and locations')
+    parser.add_argument('--geometry', action='append', type=parse_geometry,
+                        help='ROWSxCOLS@LEDS_PER_CM, repeatable (default 36x54@0.6)')
+    parser.add_argument('--location', action='append', type=parse_location,
+                        help='LAT,LONG in degrees, repeatable (default paris)')
+    parser.add_argument('--start', type=parse_date, required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', type=parse_date, required=True, help='last day, YYYY-MM-DD')
+    parser.add_argument('--step', type=int, default=60, help='seconds between frames (default 60)')
+    parser.add_argument('--modes', type=lambda s: s.split(','), default=['solunar'],
+                        help='comma separated, any of ' + ', '.join(modes))
+    parser.add_argument('--utc-offset', type=int, default=0, help='hours added for the clock modes')
+    parser.add_argument('--precision', type=int, default=0, help='solunar precision tier')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default='frames')
+    parser.add_argument('--force', action='store_true', help='render again even if the frame file exists')
+    args = parser.parse_args(argv)
+    args.geometry = args.geometry or [(36, 54, 0.6)]
+    args.location = args.location or [(48.860536, 2.332237)]
+    for mode in args.modes:
+        if mode not in modes:
+            parser.error('unknown mode ' + mode)
+
+    ctx = multiprocessing.get_context('spawn')  # fresh interpreters, each configures its frame before importing
+    total_frames, total_files = 0, 0
+    t0 = time.perf_counter()
+    for geometry, group in tasks(args):
+        if not group:
+            continue
+        for path, *_ in group:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with ctx.Pool(args.workers, initializer=init_worker, initargs=(geometry, args.precision)) as pool:
+            for path, count in pool.imap_unordered(render_day, group):
+                total_frames += count
+                total_files += 1
+                dt = time.perf_counter() - t0
+                print('\r{} files, {} frames, {:.0f} frames/s'.format(total_files, total_frames, total_frames / dt),
+                      end='', file=sys.stderr)
+    dt = time.perf_counter() - t0
+    print(file=sys.stderr)
+    print('rendered {} files with {} frames in {:.1f} s ({:.0f} frames/s)'.format(
+        total_files, total_frames, dt, total_frames / dt if dt > 0 else 0.))
+
+
+if __name__ == '__main__':
+    main()
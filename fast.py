@@ -0,0 +1,222 @@
+# per-byte kernels of the render paths
+#
+# on micropython these are viper functions working on raw byte pointers, elsewhere
+# the pure python versions below are used. both compute exactly the same bytes,
+# speedcheck.py compares them and reports the speedup.
+# viper needs mpy-cross -march=xtensa when cross-compiling (see compile.sh).
+
+import sys
+from array import array
+
+native = sys.implementation.name == 'micropython'
+
+
+def py_fill(leds, color, count):
+    """
+    Set the first count leds to color.
+    """
+    c0, c1, c2, c3 = color[0], color[1], color[2], color[3]
+    for o in range(0, 4 * count, 4):
+        leds[o] = c0
+        leds[o + 1] = c1
+        leds[o + 2] = c2
+        leds[o + 3] = c3
+
+
+def py_fade(dst, src, count, t, dim):
+    """
+    One fade step of the first count bytes of dst towards src scaled by dim.
+
+    Parameters:
+    ----------------
+    t : int
+        step position in 1/256, below 3 dst is kept, above 253 src is taken
+    dim : int
+        dimmer in 1/256 applied to src
+    """
+    for i in range(count):
+        a = dst[i]
+        b = src[i] * dim >> 8
+        if t > 253:
+            dst[i] = b
+        elif t < 3:
+            pass
+        elif b >= a:
+            dst[i] = a + ((b - a) * t >> 8)
+        else:
+            dst[i] = a - ((a - b) * t >> 8)
+
+
+def py_fade_indexed(dst, index, palette, count, t, dim):
+    """
+    py_fade towards the palette colors of the first count leds of an indexed frame.
+    """
+    for i in range(count):
+        k = 4 * index[i]
+        for o in range(4 * i, 4 * i + 4):
+            a = dst[o]
+            b = palette[k] * dim >> 8
+            k += 1
+            if t > 253:
+                dst[o] = b
+            elif t < 3:
+                pass
+            elif b >= a:
+                dst[o] = a + ((b - a) * t >> 8)
+            else:
+                dst[o] = a - ((a - b) * t >> 8)
+
+
+def py_blend_area(leds, kernel, start, lo, n, primary):
+    """
+    Blend primary into the leds covered by a set_area2 kernel.
+
+    Parameters:
+    ----------------
+    kernel : bytearray
+        kernel from frame.KernelCache, the weights start at index 1
+    start : int
+        led index of the kernel index 0
+    lo : int
+        leds below are skipped
+    n : int
+        number of leds, indices wrap around
+    """
+    for k in range(1, len(kernel)):
+        i = start + k
+        w = kernel[k]
+        if w < 3 or i < lo:  # t < 0.01
+            continue
+        o = i % n * 4
+        for ch in range(o, o + 4):
+            a = leds[ch]
+            p = primary[ch - o]
+            if w > 252:  # t > 0.99
+                leds[ch] = p
+            elif p >= a:
+                leds[ch] = a + (p - a) * w // 255
+            else:
+                leds[ch] = a - (a - p) * w // 255
+
+
+if native:
+    import micropython
+
+    @micropython.viper
+    def vp_fill(leds: ptr8, color: ptr8, count: int):
+        c0 = color[0]
+        c1 = color[1]
+        c2 = color[2]
+        c3 = color[3]
+        o = 0
+        end = 4 * count
+        while o < end:
+            leds[o] = c0
+            leds[o + 1] = c1
+            leds[o + 2] = c2
+            leds[o + 3] = c3
+            o += 4
+
+    @micropython.viper
+    def vp_fade(dst: ptr8, src: ptr8, count: int, td: int):
+        t = td & 0x1ff
+        dim = td >> 9
+        if t < 3:
+            return
+        i = 0
+        while i < count:
+            a = dst[i]
+            b = (src[i] * dim) >> 8
+            if t > 253:
+                dst[i] = b
+            elif b >= a:
+                dst[i] = a + (((b - a) * t) >> 8)
+            else:
+                dst[i] = a - (((a - b) * t) >> 8)
+            i += 1
+
+    @micropython.viper
+    def vp_fade_indexed(dst: ptr8, index: ptr8, palette: ptr8, args: ptr32):
+        count = args[0]
+        t = args[1]
+        dim = args[2]
+        if t < 3:
+            return
+        i = 0
+        while i < count:
+            k = 4 * index[i]
+            o = 4 * i
+            end = o + 4
+            while o < end:
+                a = dst[o]
+                b = (palette[k] * dim) >> 8
+                if t > 253:
+                    dst[o] = b
+                elif b >= a:
+                    dst[o] = a + (((b - a) * t) >> 8)
+                else:
+                    dst[o] = a - (((a - b) * t) >> 8)
+                o += 1
+                k += 1
+            i += 1
+
+    @micropython.viper
+    def vp_blend_area(leds: ptr8, kernel: ptr8, primary: ptr8, args: ptr32):
+        end = args[0]
+        start = args[1]
+        lo = args[2]
+        n = args[3]
+        k = 1
+        while k < end:
+            i = start + k
+            w = kernel[k]
+            if w >= 3 and i >= lo:
+                while i < 0:
+                    i += n
+                while i >= n:
+                    i -= n
+                o = i * 4
+                ch = 0
+                while ch < 4:
+                    a = leds[o + ch]
+                    p = primary[ch]
+                    if w > 252:
+                        leds[o + ch] = p
+                    elif p >= a:
+                        x = (p - a) * w
+                        leds[o + ch] = a + ((x + 1 + (x >> 8)) >> 8)  # x // 255 for x < 65536
+                    else:
+                        x = (a - p) * w
+                        leds[o + ch] = a - ((x + 1 + (x >> 8)) >> 8)
+                    ch += 1
+            k += 1
+
+    # viper takes at most four arguments, the rest goes through this array
+    _args = array('i', (0, 0, 0, 0))
+
+    def _buffer(color):
+        return color if isinstance(color, (bytes, bytearray)) else bytes(color)
+
+    def fill(leds, color, count):
+        vp_fill(leds, _buffer(color), count)
+
+    def fade(dst, src, count, t, dim):
+        vp_fade(dst, src, count, dim << 9 | t)
+
+    def fade_indexed(dst, index, palette, count, t, dim):
+        _args[0] = count
+        _args[1] = t
+        _args[2] = dim
+        vp_fade_indexed(dst, index, palette, _args)
+
+    def blend_area(leds, kernel, start, lo, n, primary):
+        _args[0] = len(kernel)
+        _args[1] = start
+        _args[2] = lo
+        _args[3] = n
+        vp_blend_area(leds, kernel, _buffer(primary), _args)
+else:
+    fill = py_fill
+    fade = py_fade
+    fade_indexed = py_fade_indexed
+    blend_area = py_blend_area
@@ -0,0 +1,24 @@
+# angle helpers for the render side
+#
+# wrapping and the north clockwise to math conversion are plain arithmetic,
+# exact up to float rounding, instead of the sin/cos/atan2 round trip in common.py.
+# where a float sine or cosine is needed math is used, its c implementation
+# beats any table lookup written in python.
+
+import math
+
+PI = math.pi
+TWO_PI = 2. * math.pi
+
+
+def wrap_to_pi(a):
+    return a - TWO_PI * math.floor((a + PI) / TWO_PI)
+
+
+def wrap_to_0_2pi(a):
+    return a - TWO_PI * math.floor(a / TWO_PI)
+
+
+def northclockwise2math(a):
+    # clockwise from north to counter clockwise from east, wrapped to -pi, pi
+    return wrap_to_pi(2.5 * PI - a)
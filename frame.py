@@ -1,32 +1,197 @@
 import math
+from array import array
 from common import *
+from fast import blend_area
 
 # numbers of leds in width and height
 rows, cols = 36, 54
 # rows, cols = 3, 4
 
-# number of leds
-n = 2*(cols+rows)
-
 leds_per_cm = 0.6
-led_offset_cm = (1./leds_per_cm)/2.
-strip_length_cm = n / leds_per_cm
 
-# width and height of the frame in meters
-width = cols/leds_per_cm  # 90 cm
-height = rows/leds_per_cm  # 60 cm
+# n, width, height, cardinals, geometry etc. are derived in set_geometry(), called at the end of this module
+
+
+def configure(r, c, lpc):
+    """
+    Set up a rectangular frame of r by c leds and everything derived from it.
+    Modules importing * from frame keep the values they saw at import,
+    so reconfigure before importing them.
+    """
+    set_geometry(Geometry.rectangle(r, c, lpc))
+
+
+class Geometry:
+    """
+    Outline of the frame as a polygon of led runs in strip order.
+
+    Each run is a straight line (x0, y0, x1, y1) in cm relative to the frame
+    center carrying a number of evenly spaced leds. Consecutive runs do not
+    need to touch, which allows gaps, and the first run may start anywhere.
+
+    At construction a table of the distance on the strip for bins angles
+    around the center and a table of the radial intensity of each led are
+    computed, so unwinding an angle is a table lookup whatever the shape.
+    """
+
+    def __init__(self, runs, leds_per_cm, bins=256):
+        self.runs = runs
+        self.leds_per_cm = leds_per_cm
+        self.n = sum(r[4] for r in runs)
+        self.strip_length_cm = self.n / leds_per_cm
+        self.bins = bins
+        self.dist = array('f', [0.] * bins)
+        self.intensity = bytearray(self.n)
+        self.build()
+
+    @staticmethod
+    def rectangle(rows, cols, leds_per_cm, start=0, clockwise=True, bins=256):
+        """
+        Rectangular frame, strip starting at corner start (0 south east, 1 south west,
+        2 north west, 3 north east) and running clockwise or counterclockwise.
+        """
+        w2, h2 = cols / leds_per_cm / 2., rows / leds_per_cm / 2.
+        corners = [(w2, -h2), (-w2, -h2), (-w2, h2), (w2, h2)]  # clockwise from south east
+        counts = [cols, rows, cols, rows]  # south, west, north, east
+        if not clockwise:
+            corners = corners[:1] + corners[:0:-1]
+            counts = counts[::-1]
+        runs = []
+        for k in range(4):
+            i = (start + k) % 4 if clockwise else (4 - start + k) % 4
+            (x0, y0), (x1, y1) = corners[i], corners[(i + 1) % 4]
+            runs.append((x0, y0, x1, y1, counts[i]))
+        return Geometry(runs, leds_per_cm, bins)
+
+    @staticmethod
+    def ellipse(rx, ry, leds_per_cm, segments=72, start=-math.pi / 2., clockwise=True, bins=256):
+        """
+        Round or oval frame with radii rx, ry in cm, strip starting at angle start (south by default).
+        """
+        sign = -1. if clockwise else 1.
+        points = [(rx * math.cos(start + sign * 2. * math.pi * k / segments),
+                   ry * math.sin(start + sign * 2. * math.pi * k / segments)) for k in range(segments + 1)]
+        lengths = [math.sqrt((points[k + 1][0] - points[k][0]) ** 2 + (points[k + 1][1] - points[k][1]) ** 2)
+                   for k in range(segments)]
+        runs = []
+        placed, total = 0, 0.
+        for k in range(segments):
+            total += lengths[k]
+            count = int(round(total * leds_per_cm)) - placed  # distribute rounding errors over the runs
+            placed += count
+            runs.append(points[k] + points[k + 1] + (count,))
+        return Geometry(runs, leds_per_cm, bins)
+
+    def intersect(self, angle):
+        """
+        Strip position in leds where a ray from the center at angle hits the outline, None in gaps.
+        """
+        dx, dy = math.cos(angle), math.sin(angle)
+        best, best_t = None, 0.
+        first = 0
+        for x0, y0, x1, y1, count in self.runs:
+            ex, ey = x1 - x0, y1 - y0
+            denom = dx * ey - dy * ex
+            if math.fabs(denom) > 1e-9:
+                t = (x0 * ey - y0 * ex) / denom
+                s = (x0 * dy - y0 * dx) / denom
+                if t > 0. and -1e-9 <= s <= 1. + 1e-9 and (best is None or t < best_t):
+                    best, best_t = first + min(max(s, 0.), 1.) * count, t
+            first += count
+        return best
+
+    def position(self, i):
+        """
+        Position of the center of led i in cm relative to the frame center.
+        """
+        first = 0
+        for x0, y0, x1, y1, count in self.runs:
+            if i < first + count:
+                f = (i - first + 0.5) / count
+                return x0 + f * (x1 - x0), y0 + f * (y1 - y0)
+            first += count
+        return None
+
+    def build(self):
+        hits = [self.intersect(2. * math.pi * k / self.bins) for k in range(self.bins)]
+        for k in range(self.bins):
+            if hits[k] is None:  # gap, take the closest angle with leds
+                for j in range(1, self.bins // 2 + 1):
+                    if hits[(k - j) % self.bins] is not None:
+                        hits[k] = hits[(k - j) % self.bins]
+                        break
+                    if hits[(k + j) % self.bins] is not None:
+                        hits[k] = hits[(k + j) % self.bins]
+                        break
+            self.dist[k] = hits[k] / self.leds_per_cm
+
+        radii = []
+        for i in range(self.n):
+            x, y = self.position(i)
+            radii.append(math.sqrt(x * x + y * y))
+        r_min = min(radii)
+        for i in range(self.n):
+            self.intensity[i] = int(255. * r_min / radii[i] + 0.5)
+
+    def unwind(self, angle):
+        """
+        Distance in cm on the strip at angle (radians, math convention).
+        """
+        u = (angle % (2. * math.pi)) * self.bins / (2. * math.pi)
+        k = int(u)
+        d0 = self.dist[k % self.bins]
+        d1 = self.dist[(k + 1) % self.bins]
+        # the strip start lies between the two bins
+        half = self.strip_length_cm / 2.
+        if d1 - d0 > half:
+            d1 -= self.strip_length_cm
+        elif d0 - d1 > half:
+            d1 += self.strip_length_cm
+        return (d0 + (u - k) * (d1 - d0)) % self.strip_length_cm
+
+
+def set_geometry(g):
+    """
+    Use a custom frame geometry. Like configure, set it before importing the modes.
+
+    The size in leds and cm comes from the bounding box of the outline and every
+    led belongs to the side of the box it faces. A side may run across the strip
+    start, its (start, end) range in cardinals then ends past n.
+    """
+    global geometry, n, rows, cols, leds_per_cm, led_offset_cm, strip_length_cm, width, height, cardinals
+    geometry = g
+    n = g.n
+    leds_per_cm = g.leds_per_cm
+    led_offset_cm = (1./leds_per_cm)/2.
+    strip_length_cm = g.strip_length_cm
+
+    # width and height of the frame in cm
+    xs = [r[k] for r in g.runs for k in (0, 2)]
+    ys = [r[k] for r in g.runs for k in (1, 3)]
+    width, height = max(xs) - min(xs), max(ys) - min(ys)
+    cols, rows = int(round(width * leds_per_cm)), int(round(height * leds_per_cm))
 
-# led indices at intercardinal directions
-south_east = 0
-south_west = cols
-north_west = cols + rows
-north_east = 2 * cols + rows
+    sides = {'north': [], 'east': [], 'south': [], 'west': []}
+    cx, cy = (max(xs) + min(xs)) / 2., (max(ys) + min(ys)) / 2.
+    for i in range(n):
+        x, y = g.position(i)
+        x, y = (x - cx) / width, (y - cy) / height
+        if math.fabs(y) >= math.fabs(x):
+            sides['north' if y > 0. else 'south'].append(i)
+        else:
+            sides['east' if x > 0. else 'west'].append(i)
 
-# map from cardinal direction to tuple containing (center index, number of pixels, (start, end))
-cardinals = {'north': ((north_east + north_west) // 2, cols, (north_west, north_east)),
-             'east': ((north_east + n) // 2, rows, (north_east, n)),
-             'south': ((south_west + south_east) // 2, cols, (south_east, south_west)),
-             'west': ((south_west + north_west) // 2, rows, (south_west, north_west))}
+    # map from cardinal direction to tuple containing (center index, number of pixels, (start, end))
+    cardinals = {}
+    for name, side in sides.items():
+        members = set(side)
+        starts = [i for i in side if (i - 1) % n not in members]
+        if len(starts) != 1:
+            raise ValueError('the {} side is not one run of the strip'.format(name))
+        start, end = starts[0], starts[0] + len(side)
+        cardinals[name] = ((start + end) // 2 % n, len(side), (start, end))
+
+    kernels.clear()  # cached kernels depend on leds_per_cm
 
 
 def unwind_angle(angle):
@@ -45,82 +210,19 @@ def unwind_angle(angle):
     tuple : float, (float, float)
         distance in cm on strip and intersection coords
     """
-    side_map = {0: 'north', 1: 'east', 2: 'south', 3: 'west'}
-
-    axis = cross((0., 0., 1.), (math.cos(angle), math.sin(angle), 1.))
-
-    w2, h2 = width / 2., height / 2.
-    frame = [(-w2, h2, 1.),  # north west
-             (w2, h2, 1.),  # north east
-             (w2, -h2, 1.),  # south east
-             (-w2, -h2, 1.)]  # south west
-
-    for i in range(4):
-        # build vecs for north, east, south, west
-        line = cross(frame[i], frame[(i + 1) % 4])
-        # intersect
-        s = cross(axis, line)
-
-        if math.fabs(s[2]) < 1e-3:
-            # lines are parallel
-            continue
-
-        if math.fabs(s[0]) < 1e-3 and math.fabs(s[1]) < 1e-3:
-            # lines are equal
-            continue
-
-        if s[2] > 0.:
-            # intersect on opposite side
-            continue
-
-        # normalize
-        x, y = s[0] / s[2], s[1] / s[2]
+    dist = geometry.unwind(angle)
+    return dist, geometry.position(int(dist * leds_per_cm) % n)
 
-        # if intersection lies within the boundaries of the frame
-        if -w2 - 1e-3 < x < w2 + 1e-3 and -h2 - 1e-3 < y < h2 + 1e-3:
-            # unwind to distance on the strip
-            dist = 0
-            if side_map[i] == 'south':
-                dist = -x + width / 2.
-            elif side_map[i] == 'west':
-                dist = width + y + height / 2.
-            elif side_map[i] == 'north':
-                dist = width + height + x + width / 2.
-            elif side_map[i] == 'east':
-                dist = 2 * width + height - y + height / 2.
-            return dist, (x, y)
 
-    return None
+def get_distance_intensity(i):
+    return geometry.intensity[i] / 255.
 
 
-def get_distance_intensity(i):
-    side = ''
-    x = 0
-    y = 0
-    for e in cardinals:
-        side_range = cardinals[e][2]
-        if side_range[0] <= i and i < side_range[1]:
-            side = e
-            break
-    if side == 'south':
-        j = float(cols-i)
-        x = j/cols * width - width/2.
-        y = -height/2.
-    if side == 'west':
-        j = float(i-cols)
-        x = -width/2.
-        y = j/rows * height - height/2.
-    if side == 'north':
-        j = float(i-cols-rows)
-        x = j/cols * width - width/2.
-        y = height/2.
-    if side == 'east':
-        j = float(rows-(i-cols-rows-cols))
-        x = width/2.
-        y = j/cols * height - height/2.
-    norm = math.sqrt(x*x+y*y)
-    intensity = (height/2.) / norm
-    return intensity
+def get_led_position(i):
+    """
+    Position of the center of led i in cm relative to the frame center.
+    """
+    return geometry.position(i)
 
 
 def sine(c, w, x):
@@ -132,6 +234,79 @@ def sine(c, w, x):
     return (y+1.)/2.
 
 
+class KernelCache(LRU):
+    """
+    LRU cache of brush kernels for set_area2.
+
+    A kernel holds the 8 bit weights of the leds covered by an area of a given
+    size whose center lies at a given phase within its led. Its first byte is
+    the offset of the first covered led relative to that led (biased by 128).
+    Sizes are quantized to size_step cm and phases to 1/phases of a led.
+    Least recently used kernels are evicted once they take more than max_bytes.
+    """
+
+    overhead = 24  # rough per entry cost of the bytearray header and dict slots
+
+    def __init__(self, max_bytes=2048, phases=16, size_step=0.1):
+        LRU.__init__(self)
+        self.max_bytes = max_bytes
+        self.phases = phases
+        self.size_step = size_step
+        self.bytes = 0
+
+    def get(self, size, phase):
+        """
+        Parameters:
+        ----------------
+        size : float
+            width of the area in cm
+        phase : float
+            position of the area center within its led in [0, 1)
+
+        Returns:
+        ----------------
+        bytearray :
+            offset of the first led + 128 followed by the weights
+        """
+        sq = int(size / self.size_step + 0.5)
+        pq = int(phase * self.phases)
+        key = sq * self.phases + pq
+        kernel = self.lookup(key)
+        if kernel is not None:
+            return kernel
+        kernel = self.build(sq * self.size_step, (pq + 0.5) / self.phases)
+        cost = len(kernel) + self.overhead
+        while self.entries and self.bytes + cost > self.max_bytes:
+            self.bytes -= len(self.evict()) + self.overhead
+        self.store(key, kernel)
+        self.bytes += cost
+        return kernel
+
+    def build(self, size, phase):
+        half = size * leds_per_cm / 2.  # in leds
+        first = math.floor(phase - half) + 1
+        last = math.floor(phase + half)
+        kernel = bytearray(max(1, last - first + 2))
+        kernel[0] = first + 128
+        for k in range(1, len(kernel)):
+            kernel[k] = int(255. * sine(phase, 2. * half, first + k - 1) + 0.5)
+        return kernel
+
+    def clear(self):
+        LRU.clear(self)
+        self.bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate(), 'entries': len(self.entries), 'bytes': self.bytes}
+
+
+kernels = KernelCache()
+
+# everything derived from the frame constants
+configure(rows, cols, leds_per_cm)
+
+
 def set_area2(center, size, primary, leds):
     """
     Parameters:
@@ -142,19 +317,198 @@ def set_area2(center, size, primary, leds):
         width of the area in cm
     primary : tuple
         primary color
-    leds : array
+    leds : array or IndexedFrame
         current led colors of the whole strip
         used for interpolation
     """
+    kernel, start, lo = area_kernel(center, size)
+    if isinstance(leds, bytearray):
+        blend_area(leds, kernel, start, lo, n, primary)
+    else:  # indexed frame
+        leds.blend_area(kernel, start, lo, primary)
+
+
+def area_kernel(center, size):
+    """
+    Kernel of an area, led index of its index 0 and the first led in the area.
+    """
     # at least two leds to avoid flickering in motion
     size = max(2./leds_per_cm, size)
-    i0 = int((center-size/2.) * leds_per_cm)  # not yet in area
-    i1 = int((center+size/2.) * leds_per_cm)  # last one in area
-    for i in range(i0+1, i1+1):
-        w = i % n
-        k = sine(center, size, i/leds_per_cm)
-        current_color = leds[w*4:w*4+4]
-        leds[w*4:w*4+4] = bytearray(interpolate_rgbw(current_color, primary, k))
+    c = center * leds_per_cm
+    b = math.floor(c)
+    kernel = kernels.get(size, c - b)
+    start = b + kernel[0] - 129
+    lo = int(c - size * leds_per_cm / 2.) + 1  # first led in area, truncation as before for areas left of 0
+    return kernel, start, lo
+
+
+def area_leds(center, size):
+    """
+    First led in [0, n) and number of leds set_area2 may change for an area.
+    """
+    kernel, start, lo = area_kernel(center, size)
+    first = max(start + 1, lo)
+    return first % n, max(0, min(start + len(kernel) - first, n))
+
+
+class Spans:
+    """
+    Leds covered by the brushes of one rasterize() call, kept across calls.
+    """
+
+    def __init__(self, capacity=8):
+        self.count = 0
+        self.grow(capacity)
+        self.scratch = bytearray(64)  # rgbw colors of the leds of one range
+        self.color = bytearray(4)
+
+    def grow(self, capacity):
+        self.capacity = capacity
+        self.kernel = [None] * capacity
+        self.primary = [None] * capacity
+        self.start = array('i', bytes(4 * capacity))  # led index of kernel index 0
+        self.first = array('i', bytes(4 * capacity))  # first led covered, in [0, n)
+        self.length = array('i', bytes(4 * capacity))  # number of leds covered
+        self.begin = array('i', bytes(4 * capacity))  # first led relative to the cut
+        self.order = bytearray(capacity)  # spans by begin
+
+    def reset(self, brushes):
+        if brushes > self.capacity:
+            self.grow(brushes)
+        self.count = 0
+
+    def add(self, center, size, primary):
+        kernel, start, lo = area_kernel(center, size)
+        first = max(start + 1, lo)
+        length = min(start + len(kernel) - first, n)
+        if length <= 0:
+            return
+        j = self.count
+        self.kernel[j] = kernel
+        self.primary[j] = primary
+        self.start[j] = start - first  # relative to the first led until placed in a range
+        self.first[j] = first % n
+        self.length[j] = length
+        self.count = j + 1
+
+    def cut(self):
+        """
+        A led no span covers, -1 if they cover the whole strip.
+        """
+        first, length = self.first, self.length
+        for j in range(self.count):
+            e = (first[j] + length[j]) % n
+            for k in range(self.count):
+                if (e - first[k]) % n < length[k]:
+                    break
+            else:
+                return e
+        return -1
+
+    def sort(self, cut):
+        # insertion sort of the few spans by their first led after the cut
+        begin, order = self.begin, self.order
+        for j in range(self.count):
+            b = (self.first[j] - cut) % n
+            begin[j] = b
+            k = j
+            while k > 0 and begin[order[k - 1]] > b:
+                order[k] = order[k - 1]
+                k -= 1
+            order[k] = j
+
+    def buffer(self, size):
+        if size > len(self.scratch):
+            self.scratch = bytearray(size)
+        return self.scratch
+
+
+_spans = Spans()
+
+
+def rasterize(brushes, leds):
+    """
+    Blend several areas into leds, same result as set_area2() for each brush in order.
+
+    An indexed frame is expanded once per range of overlapping brushes, the brushes
+    are blended into the rgbw copy and every led is looked up in the palette once.
+    An rgbw buffer is blended in place by blend_area per brush.
+
+    Parameters:
+    ----------------
+    brushes : list
+        (center, size, primary) as taken by set_area2(), later brushes are blended over earlier ones
+    leds : array or IndexedFrame
+        current led colors of the whole strip
+    """
+    if isinstance(leds, bytearray):
+        for center, size, primary in brushes:
+            kernel, start, lo = area_kernel(center, size)
+            blend_area(leds, kernel, start, lo, n, primary)
+        return
+    spans = _spans
+    spans.reset(len(brushes))
+    for center, size, primary in brushes:
+        spans.add(center, size, primary)
+    count = spans.count
+    if not count:
+        return
+
+    # ranges start at a led no span covers, so none of them wraps around the strip
+    cut = spans.cut()
+    whole = cut < 0
+    if whole:
+        cut = 0
+    spans.sort(cut)
+
+    index, palette, c = leds.index, leds.palette, spans.color
+    begin, order = spans.begin, spans.order
+    r = 0
+    while r < count:
+        # next range of overlapping spans order[r0:r]
+        r0 = r
+        j = order[r]
+        x = begin[j]
+        x1 = x + spans.length[j]
+        r += 1
+        while r < count and begin[order[r]] <= x1:
+            j = order[r]
+            x1 = max(x1, begin[j] + spans.length[j])
+            r += 1
+        if whole:  # one range of all spans
+            x, x1, r = 0, n, count
+        m = x1 - x
+        scratch = spans.buffer(4 * m)
+        for y in range(m):
+            k = 4 * index[(x + y + cut) % n]
+            o = 4 * y
+            scratch[o], scratch[o + 1], scratch[o + 2], scratch[o + 3] = \
+                palette[k], palette[k + 1], palette[k + 2], palette[k + 3]
+        # blend the spans of the range in brush order
+        for q in range(r0 + 1, r):
+            j = order[q]
+            while q > r0 and order[q - 1] > j:
+                order[q] = order[q - 1]
+                q -= 1
+            order[q] = j
+        for q in range(r0, r):
+            j = order[q]
+            lo = begin[j] - x  # first led of the span in the range
+            blend_area(scratch, spans.kernel[j], lo + spans.start[j], lo, m, spans.primary[j])
+        for y in range(m):
+            o = 4 * y
+            c[0], c[1], c[2], c[3] = scratch[o], scratch[o + 1], scratch[o + 2], scratch[o + 3]
+            index[(x + y + cut) % n] = leds.lookup(c)
+
+
+def set_led(leds, i, color):
+    """
+    Set led i of an rgbw buffer or an indexed frame.
+    """
+    if isinstance(leds, bytearray):
+        leds[i * 4:i * 4 + 4] = bytearray(color)
+    else:
+        leds.set(i, color)
 
 
 if __name__ == '__main__':
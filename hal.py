@@ -0,0 +1,83 @@
+# hardware abstraction so the render paths also run on a host python
+# on the device this only re-exports utime and machine
+
+try:
+    import utime
+    from machine import Pin, Timer, RTC, bitstream
+    host = False
+except ImportError:
+    import time as _time
+    host = True
+
+    class utime:
+        # ticks wrap like on the esp8266
+        TICKS_PERIOD = 1 << 30
+        _t0 = _time.monotonic_ns()
+
+        @staticmethod
+        def ticks_ms():
+            return (_time.monotonic_ns() - utime._t0) // 1000000 % utime.TICKS_PERIOD
+
+        @staticmethod
+        def ticks_us():
+            return (_time.monotonic_ns() - utime._t0) // 1000 % utime.TICKS_PERIOD
+
+        @staticmethod
+        def ticks_add(ticks, delta):
+            return (ticks + delta) % utime.TICKS_PERIOD
+
+        @staticmethod
+        def ticks_diff(a, b):
+            half = utime.TICKS_PERIOD // 2
+            return (a - b + half) % utime.TICKS_PERIOD - half
+
+        @staticmethod
+        def sleep_ms(ms):
+            _time.sleep(max(0, ms) / 1000.)
+
+        @staticmethod
+        def time():
+            return int(_time.time())
+
+        @staticmethod
+        def localtime(secs=None):
+            return tuple(_time.gmtime(secs))[:8]
+
+    class Pin:
+        IN, OUT = 0, 1
+
+        def __init__(self, id, mode=-1):
+            self.id = id
+
+    class Timer:
+        """
+        Inert timer, host drivers call fire() themselves.
+        """
+        ONE_SHOT, PERIODIC = 0, 1
+
+        def __init__(self, id=-1):
+            self.period = 0
+            self.mode = Timer.PERIODIC
+            self.callback = None
+
+        def init(self, period=-1, mode=PERIODIC, callback=None):
+            self.period = period
+            self.mode = mode
+            self.callback = callback
+
+        def deinit(self):
+            self.callback = None
+
+        def fire(self):
+            callback = self.callback
+            if callback:
+                if self.mode == Timer.ONE_SHOT:  # disarmed before the callback, which may init it again
+                    self.callback = None
+                callback(self)
+
+    class RTC:
+        def datetime(self, dt=None):
+            return dt
+
+    def bitstream(pin, encoding, timing, buffer):
+        pass
@@ -0,0 +1,110 @@
+class IndexedFrame:
+    """
+    Led colors stored as one palette index per led.
+
+    Meant for fade targets of static modes which only use a few colors. A
+    full palette is compacted first, if it is still full the closest color
+    already in the palette is used instead of a new one.
+    """
+
+    def __init__(self, n, capacity=48):
+        self.n = n
+        self.capacity = capacity
+        self.index = bytearray(n)
+        self.palette = bytearray(4 * capacity)
+        self.count = 1  # color 0 is off
+        self.overflows = 0  # colors replaced by the closest one
+        self._color = bytearray(4)
+
+    def fill(self, color):
+        p = self.palette
+        p[0], p[1], p[2], p[3] = color[0], color[1], color[2], color[3]
+        self.count = 1
+        for i in range(self.n):
+            self.index[i] = 0
+
+    def lookup(self, color):
+        """
+        Palette index of color, added if new.
+        """
+        c0, c1, c2, c3 = color[0], color[1], color[2], color[3]
+        p = self.palette
+        for k in range(0, 4 * self.count, 4):
+            if p[k] == c0 and p[k + 1] == c1 and p[k + 2] == c2 and p[k + 3] == c3:
+                return k >> 2
+        if self.count == self.capacity:
+            self.compact()
+        if self.count == self.capacity:
+            self.overflows += 1
+            return self.closest(color)
+        k = 4 * self.count
+        p[k], p[k + 1], p[k + 2], p[k + 3] = c0, c1, c2, c3
+        self.count += 1
+        return self.count - 1
+
+    def closest(self, color):
+        best, best_d = 0, 1024
+        p = self.palette
+        for k in range(0, 4 * self.count, 4):
+            d = abs(p[k] - color[0]) + abs(p[k + 1] - color[1]) + abs(p[k + 2] - color[2]) + abs(p[k + 3] - color[3])
+            if d < best_d:
+                best, best_d = k >> 2, d
+        return best
+
+    def compact(self):
+        # drop colors no led refers to anymore
+        used = bytearray(self.capacity)
+        for i in range(self.n):
+            used[self.index[i]] = 1
+        remap = bytearray(self.capacity)
+        p = self.palette
+        count = 0
+        for k in range(self.count):
+            if used[k]:
+                p[4 * count:4 * count + 4] = p[4 * k:4 * k + 4]
+                remap[k] = count
+                count += 1
+        self.count = count
+        for i in range(self.n):
+            self.index[i] = remap[self.index[i]]
+
+    def set(self, i, color):
+        self.index[i] = self.lookup(color)
+
+    def get(self, i):
+        k = 4 * self.index[i]
+        return self.palette[k:k + 4]
+
+    def blend_area(self, kernel, start, lo, primary):
+        """
+        Same blend as fast.blend_area on an rgbw buffer.
+        """
+        p = self.palette
+        c = self._color
+        for k in range(1, len(kernel)):
+            i = start + k
+            w = kernel[k]
+            if w < 3 or i < lo:  # t < 0.01
+                continue
+            i %= self.n
+            o = 4 * self.index[i]
+            for ch in range(4):
+                a = p[o + ch]
+                q = primary[ch]
+                if w > 252:  # t > 0.99
+                    c[ch] = q
+                elif q >= a:
+                    c[ch] = a + (q - a) * w // 255
+                else:
+                    c[ch] = a - (a - q) * w // 255
+            self.index[i] = self.lookup(c)
+
+    def expand(self, out):
+        """
+        Write the rgbw colors of all leds to out.
+        """
+        p = self.palette
+        for i in range(self.n):
+            k = 4 * self.index[i]
+            o = 4 * i
+            out[o], out[o + 1], out[o + 2], out[o + 3] = p[k], p[k + 1], p[k + 2], p[k + 3]
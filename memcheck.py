@@ -0,0 +1,88 @@
+# host harness: renders the steady-state paths and fails when a frame allocates more than its budget
+#
+#   python memcheck.py [-v]
+#
+# budgets are bytes per frame as measured by memstat on a host python (transient peak above the
+# frame start), they are meant to catch regressions, not to predict device numbers.
+
+import sys
+
+from hal import utime
+from memstat import meter
+import paris
+import solunar
+import clock as clk
+
+warmup = 64
+frames = 32
+
+budgets = {
+    'clock_cls': 512,
+    'clock_neo': 512,
+    'spin': 512,
+    'larson_scanner': 512,
+    'draw_solunar_positions': 512,
+    'sky_snapshot': 512,
+}
+
+
+def render_paths():
+    cls = clk.Clock()
+    cls.update_params({'mode': 'cls', 'continuous': True})
+    neo = clk.Clock()
+    neo.update_params({'mode': 'neo', 'start_at_minute': False, 'two_colors': True})
+    date_time = (2022, 6, 21, 18, 0, 0, 1, 172)
+
+    def clock_cls(i):
+        cls.update(10, 8, i % 60, 40 * i % 1000, paris.leds0)
+
+    def clock_neo(i):
+        neo.update(10, 8, 30 + i % 30, 40 * i % 1000, paris.leds0)
+
+    def spin(i):
+        # one timer period per frame whatever the host takes, traced frames are much slower
+        paris.default.last_millis = utime.ticks_add(utime.ticks_ms(), -50)
+        paris.spin((0, 0, 0, 200), 0.25)
+
+    def larson_scanner(i):
+        paris.larson_scanner((255, 0, 0, 0), (0, 0, 0, 4))
+
+    def draw_solunar_positions(i):
+        paris.draw_solunar_positions(paris.coords, date_time, paris.leds1)
+
+    def sky_snapshot(i):
+        # uncached, a new minute every frame
+        solunar.sky_horizontal(paris.coords, 8207.25 + i / 1440., solunar.bodies)
+
+    return [('clock_cls', clock_cls), ('clock_neo', clock_neo), ('spin', spin),
+            ('larson_scanner', larson_scanner), ('draw_solunar_positions', draw_solunar_positions),
+            ('sky_snapshot', sky_snapshot)]
+
+
+def measure(name, render):
+    for i in range(warmup):
+        render(i)
+    meter.reset()
+    for i in range(frames):
+        with meter.frame(name):
+            render(i)
+    return meter.stats[name]
+
+
+def main(verbose=False):
+    meter.enable()
+    failed = []
+    for name, render in render_paths():
+        s = measure(name, render)
+        ok = s.max_alloc <= budgets[name]
+        if not ok:
+            failed.append(name)
+        if verbose or not ok:
+            print('{:4s} {:24s} {} budget={}'.format('ok' if ok else 'FAIL', name, s, budgets[name]))
+    meter.enable(False)
+    return failed
+
+
+if __name__ == '__main__':
+    failed = main('-v' in sys.argv)
+    sys.exit(1 if failed else 0)
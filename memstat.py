@@ -0,0 +1,166 @@
+# heap instrumentation per rendered frame
+#
+# on the device the gc is paused for the duration of a frame so the change of
+# gc.mem_alloc() is exactly what the frame allocated (heap blocks are 16 bytes).
+# on a host python tracemalloc is used instead: there, alloc is the transient
+# peak above the start of the frame and blocks the net change of allocated blocks.
+
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BLOCK_SIZE = 16
+
+
+class FrameStats:
+    def __init__(self):
+        self.frames = 0
+        self.alloc = 0  # bytes allocated over all frames
+        self.max_alloc = 0  # worst frame
+        self.blocks = 0
+        self.collections = 0
+        self.min_free = -1  # lowest gc.mem_free() seen after a frame (device only)
+
+    def per_frame(self):
+        return self.alloc // self.frames if self.frames else 0
+
+    def __repr__(self):
+        return 'frames={} alloc/frame={} max={} blocks={} gc={} min_free={}'.format(
+            self.frames, self.per_frame(), self.max_alloc, self.blocks, self.collections, self.min_free)
+
+
+class Meter:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self._mode = None
+        self._next = None
+        self._depth = 0
+        self._start = 0
+        self._blocks = 0
+        self._collections = 0
+        self._gc_was_enabled = True
+
+    def enable(self, on=True):
+        self.enabled = on
+        if tracemalloc and on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            gc.callbacks.append(self._on_gc)
+        elif tracemalloc and not on and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            gc.callbacks.remove(self._on_gc)
+
+    def reset(self):
+        """
+        Clear the stats and close a frame left open, e.g. by a render that raised before end().
+        """
+        self.stats = {}
+        if self._depth and not tracemalloc and self._gc_was_enabled:
+            gc.enable()
+        self._depth = 0
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._collections += 1
+
+    def frame(self, mode):
+        """
+        Meter one frame of mode as context manager, the frame is ended also when the render raises:
+
+            with meter.frame('spin'):
+                ...
+        """
+        self._next = mode
+        return self
+
+    def __enter__(self):
+        self.begin(self._next)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end()
+
+    def begin(self, mode):
+        if not self.enabled:
+            return
+        self._depth += 1
+        if self._depth > 1:  # nested, the outermost frame counts
+            return
+        self._mode = mode
+        if tracemalloc:
+            tracemalloc.reset_peak()
+            self._start = tracemalloc.get_traced_memory()[0]
+            self._blocks = sys.getallocatedblocks()
+            self._collections = 0
+        else:
+            self._gc_was_enabled = gc.isenabled()
+            gc.disable()
+            self._start = gc.mem_alloc()
+
+    def end(self):
+        if not self.enabled or self._depth == 0:
+            return
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        s = self.stats.get(self._mode)
+        if s is None:
+            s = self.stats[self._mode] = FrameStats()
+        if tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            alloc = peak - self._start
+            s.blocks += sys.getallocatedblocks() - self._blocks
+            s.collections += self._collections
+        else:
+            alloc = gc.mem_alloc() - self._start
+            if alloc < 0:  # heap ran full and was collected anyway
+                s.collections += 1
+                alloc = 0
+            s.blocks += alloc // BLOCK_SIZE
+            if self._gc_was_enabled:
+                gc.enable()
+            free = gc.mem_free()
+            if s.min_free < 0 or free < s.min_free:
+                s.min_free = free
+        s.frames += 1
+        s.alloc += alloc
+        s.max_alloc = max(s.max_alloc, alloc)
+
+    def report(self):
+        for mode in sorted(self.stats):
+            print('{:24s} {}'.format(mode, self.stats[mode]))
+
+
+meter = Meter()
+
+
+def measure_import(name):
+    """
+    Bytes allocated and milliseconds spent importing a module (host: tracemalloc, device: gc).
+    """
+    from hal import utime
+    if name in sys.modules:
+        del sys.modules[name]
+    gc.collect()
+    if tracemalloc:
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+    else:
+        before = gc.mem_alloc()
+    t0 = utime.ticks_us()
+    __import__(name)
+    dt = utime.ticks_diff(utime.ticks_us(), t0)
+    gc.collect()
+    if tracemalloc:
+        after = tracemalloc.get_traced_memory()[0]
+        if not tracing:
+            tracemalloc.stop()
+    else:
+        after = gc.mem_alloc()
+    return after - before, dt / 1000.
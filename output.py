@@ -0,0 +1,235 @@
+from hal import Pin, bitstream
+
+# sk6812 high/low times in ns for a 0 and a 1 bit
+timing = (400, 850, 800, 450)
+
+# leds per block of the running channel sums
+BLOCK = 16
+
+
+def bitstream_driver(pin, buffer):
+    # low-level driving of a NeoPixel changed from esp.neopixel_write to machine.bitstream
+    bitstream(pin, 0, timing, buffer)
+
+
+class Recorder:
+    """
+    Host driver keeping the last buffer written to each pin.
+    """
+
+    def __init__(self):
+        self.frames = {}
+        self.writes = 0
+
+    def __call__(self, pin, buffer):
+        self.frames[pin.id] = bytes(buffer)
+        self.writes += 1
+
+
+class Segment:
+    """
+    Leds [start, end) of the frame on their own data pin.
+    If reverse is set, the strip is fed from the end.
+    """
+
+    def __init__(self, pin, start, end, reverse=False):
+        self.pin = Pin(pin, Pin.OUT) if isinstance(pin, int) else pin
+        self.start = start
+        self.end = end
+        self.reverse = reverse
+        self.scratch = bytearray(4 * (end - start)) if reverse else None
+        self.view = None  # slice of the current buffer, kept to avoid allocations per write
+        self.dirty = True
+
+
+class Output:
+    """
+    Writes a frame buffer to one or more led strips.
+
+    Segments are given as (pin, start, end[, reverse]) tuples and written in
+    the given chain order. flush() writes only segments marked dirty, show()
+    writes all of them. Renderers that redraw only parts of the frame mark()
+    what they changed and flush(), full redraws show().
+
+    The current draw of each frame is estimated from channel sums kept per
+    block of leds, only blocks marked dirty are summed again. If a limit is
+    set and the estimate exceeds it, all channels are scaled down through a
+    lookup table on their way to the strip, the frame buffer stays untouched.
+    """
+
+    def __init__(self, segments, driver=bitstream_driver, ma_per_channel=20, idle_ma=1):
+        """
+        Parameters:
+        ----------------
+        ma_per_channel : int
+            current of one led channel at full brightness
+        idle_ma : int
+            current of one led with all channels off
+        """
+        self.segments = [Segment(*s) for s in segments]
+        self.driver = driver
+        self.buffer = None  # buffer written last
+        self.tap = None  # called with the buffer and the lut after each write, e.g. shared.SharedFrame.publish
+
+        # current estimation
+        self.n = max(s.end for s in self.segments)
+        self.ma_per_channel = ma_per_channel
+        self.idle_ma = idle_ma
+        n_blocks = (self.n + BLOCK - 1) // BLOCK
+        self.block_sums = [0] * n_blocks
+        self.block_dirty = bytearray(b'\x01' * n_blocks)
+        self.block_views = None  # views of the blocks of the current buffer
+        self.channel_sum = 0  # sum of all channel values of the current frame
+        self.current_ma = 0  # estimated current of the frame as given
+        self.max_current_ma = 0
+
+        # brightness limiter
+        self.limit_ma = 0  # 0 for no limit
+        self.scale = 256  # applied brightness in 1/256
+        self.lut = None  # channel value mapping while limited
+        self.limited_frames = 0
+
+    def set_limit(self, limit_ma):
+        """
+        Limit the estimated current to limit_ma by dimming all channels, 0 to disable.
+        """
+        self.limit_ma = limit_ma
+        for s in self.segments:
+            if limit_ma and s.scratch is None:  # limited output is written from a copy
+                s.scratch = bytearray(4 * (s.end - s.start))
+        self.set_scale(256)
+
+    def set_scale(self, scale):
+        if scale == self.scale:
+            return
+        self.scale = scale
+        if scale >= 256:
+            self.lut = None
+        else:
+            lut = self.lut or bytearray(256)
+            for v in range(256):
+                lut[v] = v * scale >> 8
+            self.lut = lut
+        # every segment has to be written with the new scale, the channel sums of the frame stay the same
+        for s in self.segments:
+            s.dirty = True
+
+    @property
+    def output_ma(self):
+        """
+        Estimated current after limiting.
+        """
+        idle = self.idle_ma * self.n
+        return idle + (self.current_ma - idle) * self.scale // 256
+
+    def mark(self, i0, i1):
+        """
+        Mark leds [i0, i1) as changed.
+        """
+        for s in self.segments:
+            if i0 < s.end and s.start < i1:
+                s.dirty = True
+        if i0 < i1:
+            for b in range(i0 // BLOCK, (i1 - 1) // BLOCK + 1):
+                self.block_dirty[b] = 1
+
+    def mark_ring(self, i0, count):
+        """
+        Mark count leds from i0 on as changed, wrapping around the strip.
+        """
+        if count >= self.n:
+            self.mark_all()
+            return
+        i0 %= self.n
+        if i0 + count > self.n:
+            self.mark(i0, self.n)
+            self.mark(0, i0 + count - self.n)
+        else:
+            self.mark(i0, i0 + count)
+
+    def mark_all(self):
+        for s in self.segments:
+            s.dirty = True
+        for b in range(len(self.block_dirty)):
+            self.block_dirty[b] = 1
+
+    def update_current(self):
+        """
+        Sum the dirty blocks again and update the current estimate and the brightness scale.
+        """
+        total = self.channel_sum
+        sums = self.block_sums
+        dirty = self.block_dirty
+        views = self.block_views
+        for b in range(len(sums)):
+            if dirty[b]:
+                v = sum(views[b])
+                total += v - sums[b]
+                sums[b] = v
+                dirty[b] = 0
+        self.channel_sum = total
+        idle = self.idle_ma * self.n
+        ma = idle + total * self.ma_per_channel // 255
+        self.current_ma = ma
+        if ma > self.max_current_ma:
+            self.max_current_ma = ma
+        if self.limit_ma:
+            if ma > self.limit_ma:
+                scale = max(0, (self.limit_ma - idle) * 256 // (ma - idle)) & ~3  # coarse steps, fewer table rebuilds
+                self.limited_frames += 1
+            else:
+                scale = 256
+            self.set_scale(scale)
+
+    def flush(self, buffer):
+        if buffer is not self.buffer:  # other buffer than last time, everything changed
+            self.buffer = buffer
+            for s in self.segments:
+                if not s.reverse:
+                    whole = s.start == 0 and 4 * s.end == len(buffer)
+                    s.view = buffer if whole else memoryview(buffer)[4 * s.start:4 * s.end]
+            mv = memoryview(buffer)
+            self.block_views = [mv[4 * i:4 * min(i + BLOCK, self.n)] for i in range(0, self.n, BLOCK)]
+            self.mark_all()
+        self.update_current()
+        wrote = False
+        for s in self.segments:
+            if s.dirty:
+                self.write_segment(s, buffer)
+                s.dirty = False
+                wrote = True
+        if wrote and self.tap is not None:
+            self.tap(buffer, self.lut)
+
+    def show(self, buffer):
+        self.mark_all()
+        self.flush(buffer)
+
+    def write_segment(self, s, buffer):
+        lut = self.lut
+        if lut is not None:
+            out = s.scratch
+            if s.reverse:
+                j = 4 * s.end
+                for k in range(0, len(out), 4):
+                    j -= 4
+                    out[k] = lut[buffer[j]]
+                    out[k + 1] = lut[buffer[j + 1]]
+                    out[k + 2] = lut[buffer[j + 2]]
+                    out[k + 3] = lut[buffer[j + 3]]
+            else:
+                j = 4 * s.start
+                for k in range(len(out)):
+                    out[k] = lut[buffer[j + k]]
+        elif s.reverse:
+            out = s.scratch
+            j = 4 * s.end
+            for k in range(0, len(out), 4):
+                j -= 4
+                out[k] = buffer[j]
+                out[k + 1] = buffer[j + 1]
+                out[k + 2] = buffer[j + 2]
+                out[k + 3] = buffer[j + 3]
+        else:
+            out = s.view
+        self.driver(s.pin, out)
@@ -0,0 +1,115 @@
+# adaptive frame pacing
+#
+# the mode timers tick at a fixed base period. a Pacer measures what each frame
+# really costs (render and write) and when that eats too much of the period it
+# first switches to a cheaper quality level and then renders only every k-th tick.
+# with headroom again the frame rate comes back first, then the quality.
+
+from hal import utime
+
+
+class Pacer:
+    def __init__(self, period_ms, levels=1, max_divider=8, budget=50, headroom=20, hold=16):
+        """
+        Parameters:
+        ----------------
+        period_ms : int
+            base period of the timer driving the mode
+        levels : int
+            number of quality levels, 0 is the best
+        max_divider : int
+            lowest frame rate as a fraction of the base rate
+        budget : int
+            percentage of the frame period a frame may cost before stepping down
+        headroom : int
+            percentage of the frame period below which a frame steps up again
+        hold : int
+            frames between two adjustments
+        """
+        self.levels = levels
+        self.max_divider = max_divider
+        self.budget = budget
+        self.headroom = headroom
+        self.hold = hold
+        self.set_period(period_ms)
+
+    def set_period(self, period_ms):
+        self.period_us = period_ms * 1000
+        self.reset()
+
+    def reset(self):
+        self.level = 0
+        self.divider = 1  # render every divider-th tick
+        self.cost_us = -1  # smoothed cost of a frame, -1 until measured
+        self.max_cost_us = 0
+        self._ticks = 0
+        self._frames = 0
+        self._t0 = 0
+
+    @property
+    def period_ms(self):
+        return self.period_us * self.divider // 1000
+
+    def load(self):
+        """
+        Percentage of the current frame period spent rendering.
+        """
+        return 100 * max(0, self.cost_us) // (self.period_us * self.divider)
+
+    def tick(self):
+        """
+        Returns:
+        ----------------
+        bool :
+            whether this timer tick should render a frame
+        """
+        self._ticks += 1
+        if self._ticks < self.divider:
+            return False
+        self._ticks = 0
+        return True
+
+    def begin(self):
+        self._t0 = utime.ticks_us()
+
+    def end(self):
+        cost = utime.ticks_diff(utime.ticks_us(), self._t0)
+        if self.cost_us < 0:
+            self.cost_us = cost
+        else:
+            self.cost_us += (cost - self.cost_us) >> 3  # ema over roughly 8 frames, integers only
+        if cost > self.max_cost_us:
+            self.max_cost_us = cost
+        self._frames += 1
+        if self._frames >= self.hold:
+            self._frames = 0
+            self.adapt()
+
+    def adapt(self):
+        cost = 100 * self.cost_us
+        period = self.period_us * self.divider
+        if cost > self.budget * period:
+            if self.level < self.levels - 1:
+                self.level += 1
+            elif self.divider < self.max_divider:
+                self.divider += 1
+            else:
+                return
+        elif self.divider > 1 and cost < self.headroom * (period - self.period_us):
+            self.divider -= 1
+        elif self.level > 0 and cost < self.headroom * period:
+            self.level -= 1
+        else:
+            return
+        self.cost_us = -1  # measure the new setting from scratch
+
+    def callback(self, frame):
+        """
+        Timer callback rendering frame() at the paced rate.
+        """
+        def paced(t):
+            if self.tick():
+                self.begin()
+                frame()
+                self.end()
+        return paced
@@ -1,116 +1,68 @@
-from machine import Pin, Timer, bitstream
-import utime
 import math
 
 from common import *
 from frame import *
+from fixtrig import northclockwise2math
+from hal import Timer, utime
 import timing
 import colors
+import fast
 import solunar
 import clock as clk
+from memstat import meter
+from output import Output, bitstream_driver
+from pacing import Pacer
+from indexed import IndexedFrame
 
 utc_offset = 2
 
 # solunar
-equinox_or_solstice = -1
 coords = (48.860536, 2.332237)  # paris
 # coords = (50.038333, 8.193611)  # home
 
+# planets drawn by the solunar modes besides sun and moon at night, see set_planets()
+sky_bodies = ('sun', 'moon')
+planet_colors = {'venus': (30, 30, 20, 90), 'mars': (20, 120, 0, 0), 'jupiter': (50, 60, 10, 30)}
+
 # some colors matching the frame
 color_off = bytearray(4)
 color_ambient = bytearray((1, 0, 1, 8))
 color_river = bytearray([int(0.06 * x) for x in colors.colors['river_blue']])
 color_accent = bytearray([int(0.4 * x) for x in colors.colors['crimson']])
 
-# global dimmer
-dimmer = 0.5
-
-# displayed led colors
-leds0 = bytearray(n * 4)
-
-# led colors to be faded to
-leds1 = bytearray(n * 4)
-
-# update timer
-timer = Timer(-1)
-
-# keep track if dynamic, timer-based mode is running or a static
-static = True
-
-# check if second changed to start counting millis
-start_second = 0
-last_second = -1
-last_minute = -1
-
-# spin globals
-last_angle = 0
-last_millis = 0
-
-# larson scanner globals
-larson_bounds = (0, n)
-larson_index = 0
-larson_dir = 1
-larson_last_dir = -1
-
-clock = clk.Clock()
-clock.set_background_colors(color_ambient, color_river)
-clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
+# led colors to be faded to, static modes use few colors so by default one palette index per led
+indexed_target = True
 
+# live preview of the displayed leds (see preview.py), 0 to disable
+preview_port = 0
+preview_fps = 5
 
-# ##############################################################################
-
-
-def neopixel_write(pin, buffer):
-    # low-level driving of a NeoPixel changed from esp.neopixel_write to machine.bitstream
-    bitstream(pin, 0, (400, 850, 800, 450), buffer)
+spin_tails = (24, 12)  # tail length per quality level
+larson_sizes = (12, 6)  # kernel radius per quality level
 
+# led strip segments (pin, first led, last led + 1[, reverse]) in chain order,
+# e.g. one data pin per side of the frame:
+# segments = [(13,) + cardinals['south'][2], (12,) + cardinals['west'][2],
+#             (14,) + cardinals['north'][2], (5,) + cardinals['east'][2]]
+segments = [(13, 0, n)]
 
-# init neopixels
-pin = Pin(13, Pin.OUT)
-neopixel_write(pin, leds0)
+# estimated current the leds may draw, the output dims all channels above it (0 for no limit)
+current_limit_ma = 12000
 
 
 # ##############################################################################
 
 
-def fade(steps=32, sleep=0):
-    for i in range(steps):
-        t = (i + 1.) / steps
-        for j in range(n * 4):  # iterate all
-            leds0[j] = int(interpolate(leds0[j], dimmer*leds1[j], t))
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(sleep)
-
-
-def apply_dimmer(value):
-    global dimmer
-    dimmer = clamp(value, 0., 1.)
-
-    # apply in static mode only
-    if static:
-        fade()
-
-
 def clear(leds):
-    # leds1[:] = bytearray(n * 4)  <-- causes memory issues
-    for i in range(n*4):
-        leds[i] = 0
+    init(leds, color_off)
 
 
 def init(leds, color):
     # leds0[:] = bytearray(n * background)  <-- causes memory issues
-    for i in range(n):
-        leds[i*4:i*4+4] = bytearray(color)
-
-
-def off():
-    clear(leds1)
-    fade()
-
-
-def ambient():
-    paris(leds1)
-    fade()
+    if isinstance(leds, IndexedFrame):
+        leds.fill(color)
+    else:
+        fast.fill(leds, color, n)
 
 
 def paris(leds):
@@ -120,17 +72,9 @@ def paris(leds):
     set_area2(143/leds_per_cm, 5, color_river, leds)
 
 
-def set_circular_background(color):
-    for i in range(n):
-        intensity = get_distance_intensity(i)
-        icolor = [int(intensity * c) for c in color]
-        leds1[i * 4:i * 4 + 4] = bytearray(icolor)
-    fade()
-
-
 def set_area(center, size, primary, secondary, leds):
     if size == 1:
-        leds[center * 4:center * 4 + 4] = bytearray(primary)
+        set_led(leds, center, primary)
         return
 
     half = int(size / 2)
@@ -141,414 +85,758 @@ def set_area(center, size, primary, secondary, leds):
         x = center - i - d
         t = math.fabs((x - sign(x) * d) / (half - (size + 1) % 2))
         color = interpolate_rgbw(primary, secondary, t)
-        index = i % n
-        leds[index * 4:index * 4 + 4] = bytearray(color)
-
-
-def set_sides(north, east, south, west, linear=False):
-
-    clear(leds1)
-
-    if linear:
-        for i in range(*cardinals['north'][2]):
-            leds1[i * 4:i * 4 + 4] = bytearray(north)
-        for i in range(*cardinals['east'][2]):
-            leds1[i * 4:i * 4 + 4] = bytearray(east)
-        for i in range(*cardinals['south'][2]):
-            leds1[i * 4:i * 4 + 4] = bytearray(south)
-        for i in range(*cardinals['west'][2]):
-            leds1[i * 4:i * 4 + 4] = bytearray(west)
-    else:
-        set_area2(cardinals['north'][0] / leds_per_cm, width, north, leds1)
-        set_area2(cardinals['east'][0] / leds_per_cm, height, east, leds1)
-        set_area2(cardinals['south'][0] / leds_per_cm, width, south, leds1)
-        set_area2(cardinals['west'][0] / leds_per_cm, height, west, leds1)
-
-    fade()
-
-# ##############################################################################
-
-
-def set_vertical(c1, c2):
-    set_area(cols//2 + n//2, n//2, c1, c1, leds1)
-    set_area(cols//2, n//2, c2, c2, leds1)
-    fade()
-
-
-def set_horizontal(c1, c2):
-    set_area(cols+rows//2, n//2, c1, c1, leds1)
-    set_area(cols+rows+cols+rows//2, n//2, c2, c2, leds1)
-    fade()
-
-
-def set_vertical_interp(c1, c2):
-    set_area(cardinals['north'][0], cardinals['north'][1], c1, c1, leds1)
-    set_area(cardinals['south'][0], cardinals['south'][1], c2, c2, leds1)
-    for i in range(rows):
-        color_linear = interpolate_rgbw(c1, c2, (i + 1.) / rows)
-        color = bytearray(color_linear)
-        i_east = north_east + i
-        i_west = north_west - i - 1
-        leds1[i_east * 4:i_east * 4 + 4] = color
-        leds1[i_west * 4:i_west * 4 + 4] = color
-    fade()
-
-
-# ##############################################################################
-
-
-def ramp_up():
-    """
-    Start animation.
-    Draws into leds0 array so the next animation will fade from there to leds1.
-    """
-
-    center = cardinals['south'][0]
-    size = (cols + 2 * rows)
-    d = (size + 1) % 2
-    ramp_color_1 = bytearray((0, 0, 0, 5))
-    ramp_color_2 = bytearray((0, 0, 0, 50))
-    ramp_color_3 = bytearray((0, 0, 0, 200))
-
-    clear(leds0)
-    set_area2(center/leds_per_cm, width/3, ramp_color_2, leds0)
-    neopixel_write(pin, leds0)
-
-    utime.sleep_ms(200)
-
-    for i in range(size // 2):
-        i1 = (center - (i % n) - d) % n
-        i2 = (center + (i % n)) % n
-        leds0[i1 * 4:i1 * 4 + 4] = ramp_color_1
-        leds0[i2 * 4:i2 * 4 + 4] = ramp_color_1
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(12)
-
-    for i in range(16):
-        color = interpolate_rgbw(ramp_color_1, ramp_color_3, (i + 1.) / 16.)
-        set_area2(cardinals['north'][0]/leds_per_cm, width, color, leds0)
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(2)
-
-    fade()
-
-
-# ##############################################################################
-
-
-def test_led(led_id, brightness=1, n_times=2, timeout_ms=300):
-    for _ in range(n_times):
-        for i in range(4):
-            clear(leds0)
-            index = (led_id*4) + i
-            leds0[index] = brightness
-            neopixel_write(pin, leds0)
-            utime.sleep_ms(timeout_ms)
-    off()
-
-
-def cycle_channels(brightness=255, n_cycles=1, timeout_ms=100):
-    for i in range(n * 4 * n_cycles):
-        clear(leds0)
-        index = i % (n * 4)
-        leds0[index] = brightness
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(timeout_ms)
-    off()
-
-
-def cycle_color(color, n_cycles=1, timeout_ms=100):
-    for i in range(n * n_cycles):
-        clear(leds0)
-        index = (i % n) * 4
-        leds0[index:index + 4] = bytearray(color)
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(timeout_ms)
-    off()
-
-
-def cycle_circular(size=1):
-    n_samples = 360
-    color_1 = [0, 0, 0, 0]  # background color
-    color_2 = [0, 164, 0, 0]  # pointer color
-    for i in range(n_samples):
-        angle = 2/3.*math.pi + i/n_samples * 3/4.*math.pi
-        # angle = 2/3.*math.pi + i/n_samples * 2*math.pi
-        cm_on_strip, (x, y) = unwind_angle(northclockwise2math(angle))
-        fraction_led = cm_on_strip * leds_per_cm
-        frac, frac_led_index = math.modf(fraction_led)
-        frac_led_index = int(frac_led_index)
-        init(leds0, color_1)
-        id0 = frac_led_index * 4
-        id1 = ((frac_led_index+1) % n) * 4
-
-        # 1 smooth
-        # leds0[id0:id0+4] = bytearray((0, 0, 0, int((1-frac)*64)))
-        # leds0[id1:id1+4] = bytearray((0, 0, 0, int(frac*64)))
-
-        # 2 blending in: not so super smooth, but ok
-        # leds0[id0:id0+4] = bytearray(interpolate_rgbw(color_2, color_1, frac))
-        # leds0[id1:id1+4] = bytearray(interpolate_rgbw(color_1, color_2, frac))
-
-        # 3
-        set_area2(cm_on_strip, size, color_2, leds0)
-
-        neopixel_write(pin, leds0)
-        utime.sleep_ms(1)
-    off()
+        set_led(leds, i % n, color)
 
 
-# ##############################################################################
+def set_planets(names=('venus', 'mars', 'jupiter')):
+    global sky_bodies
+    sky_bodies = ('sun', 'moon') + tuple(names)
 
 
 def draw_solunar_positions(lat_long_deg, utc_time, leds):
+    sky = solunar.calc_sky(lat_long_deg, utc_time, sky_bodies)
+    solar_azim, solar_elev = sky[0]
+    lunar_azim, lunar_elev = sky[1]
+    if solar_elev < 0.:  # planets only at night
+        for k in range(2, len(sky)):
+            azim, elev = sky[k]
+            if elev > 0.:
+                set_area2(geometry.unwind(northclockwise2math(azim)), 2, planet_colors[sky_bodies[k]], leds)
+    draw_bodies(solar_azim, solar_elev, lunar_azim, lunar_elev, leds)
+
+
+def draw_bodies(solar_azim, solar_elev, lunar_azim, lunar_elev, leds):
+    brushes = []
     # moon
-    lunar_azim, lunar_elev = solunar.calc_lunar_position(lat_long_deg, utc_time)
-    lunar_result = unwind_angle(northclockwise2math(lunar_azim))
-    if lunar_result and lunar_elev > 0.:
-        distance = lunar_result[0]
+    if lunar_elev > 0.:
+        distance = geometry.unwind(northclockwise2math(lunar_azim))
         f1 = clamp(math.degrees(lunar_elev), 0., 18.5) / 18.5
         f2 = clamp(math.degrees(lunar_elev), 0., 6.) / 6.
         color = interpolate_rgbw((10, 10, 20, 80), (64, 64, 200, 0), f1)
-        set_area2(distance, 1 + f2 * 10, (0, 0, 0, 5), leds)
-        set_area2(distance, 1 + f2 * 5, color, leds)
+        brushes.append((distance, 1 + f2 * 10, (0, 0, 0, 5)))
+        brushes.append((distance, 1 + f2 * 5, color))
     # sun
-    solar_azim, solar_elev = solunar.calc_solar_position(lat_long_deg, utc_time)
-    solar_result = unwind_angle(northclockwise2math(solar_azim))
-    if solar_result and solar_elev > 0.:
-        distance = solar_result[0]
+    if solar_elev > 0.:
+        distance = geometry.unwind(northclockwise2math(solar_azim))
         f1 = clamp(math.degrees(solar_elev), 0., 23.45) / 23.45
         f2 = clamp(math.degrees(solar_elev), 0., 6.) / 6.
         g = int(interpolate(50, 180, f1))
-        set_area2(distance, 1 + f2 * 14, (50, 255, 0, 0), leds)
-        set_area2(distance, 1 + f2 * 7, (g, 255, 0, 0), leds)
+        brushes.append((distance, 1 + f2 * 14, (50, 255, 0, 0)))
+        brushes.append((distance, 1 + f2 * 7, (g, 255, 0, 0)))
+    rasterize(brushes, leds)
 
 
-def paris_solunar():
-    paris(leds1)
-    for i in range(equinox_or_solstice + 1):
+def render_solunar(lat_long_deg, utc_time, event, leds):
+    paris(leds)
+    for i in range(event + 1):
         cardinal = list(cardinals.values())[i]
-        set_area2(cardinal[0]/leds_per_cm, 5, color_accent, leds1)
-    draw_solunar_positions(coords, utime.localtime(), leds1)
-    fade()
-
-
-def solunar_demo():
-    paris(leds1)
-    fade()
-    year, month, day, hour, minute, second, weekday, yearday = utime.localtime()
-
-    for h in range(24):
-        for m in range(0, 60):
-            # clear
-            paris(leds0)
-
-            # hour
-            angle = (h % 12 + m / 60.) / 12. * 2. * math.pi
-            distance = unwind_angle(northclockwise2math(angle))[0]
-            set_area2(distance, 4, [158, 81, 188, 0], leds0)
-
-            # solar/lunar
-            draw_solunar_positions(coords, (year, month, day, h, m, 0, weekday, yearday), leds0)
-
-            # apply
-            neopixel_write(pin, leds0)
+        set_area2(cardinal[0]/leds_per_cm, 5, color_accent, leds)
+    draw_solunar_positions(lat_long_deg, utc_time, leds)
 
-    paris(leds1)
-    fade()
 
+def render_circular(color, leds):
+    clear(leds)  # an indexed frame starts with an empty palette
+    for i in range(n):
+        intensity = get_distance_intensity(i)
+        set_led(leds, i, [int(intensity * c) for c in color])
 
-# ##############################################################################
 
+def render_sides(north, east, south, west, linear, leds):
+    clear(leds)
+    if linear:
+        for i in range(*cardinals['north'][2]):
+            set_led(leds, i % n, north)
+        for i in range(*cardinals['east'][2]):
+            set_led(leds, i % n, east)
+        for i in range(*cardinals['south'][2]):
+            set_led(leds, i % n, south)
+        for i in range(*cardinals['west'][2]):
+            set_led(leds, i % n, west)
+    else:
+        set_area2(cardinals['north'][0] / leds_per_cm, width, north, leds)
+        set_area2(cardinals['east'][0] / leds_per_cm, height, east, leds)
+        set_area2(cardinals['south'][0] / leds_per_cm, width, south, leds)
+        set_area2(cardinals['west'][0] / leds_per_cm, height, west, leds)
 
-def update_clock():
-    global start_second, last_second
-    h, m, s = utime.localtime()[3:6]
-    h = (h + utc_offset) % 24
-    if last_second != s:  # no milliseconds in utime, count manually
-        start_second = utime.ticks_ms()
-    last_second = s
-    ms = int(clamp(utime.ticks_ms() - start_second, 0, 1000))
 
-    if clock.update(h, m, s, ms, leds0):
-        neopixel_write(pin, leds0)
+def render_halves(center1, c1, center2, c2, leds):
+    clear(leds)
+    set_area(center1, n//2, c1, c1, leds)
+    set_area(center2, n//2, c2, c2, leds)
 
 
-def clock_demo():
-    for h in range(24):
-        for m in range(0, 60):
-            for s in range(0, 60):
-                for ms in range(0, 1000, 250):
-                    clock.update(h, m, s, ms, leds0)
-                    neopixel_write(pin, leds0)
+def render_vertical_interp(c1, c2, leds):
+    clear(leds)
+    set_area(cardinals['north'][0], cardinals['north'][1], c1, c1, leds)
+    set_area(cardinals['south'][0], cardinals['south'][1], c2, c2, leds)
+    for side in ('east', 'west'):
+        start, end = cardinals[side][2]
+        count = end - start
+        downwards = get_led_position(start % n)[1] > get_led_position((end - 1) % n)[1]
+        for k in range(count):
+            t = (k + 1.) / count if downwards else (count - k) / count
+            set_led(leds, (start + k) % n, bytearray(interpolate_rgbw(c1, c2, t)))
 
 
 # ##############################################################################
 
 
-def spin(color, frequency):
-    global last_millis, last_angle
-
-    tail = 24
-
-    now_millis = utime.ticks_ms()
-    dt = (now_millis - last_millis) / 1000.
-    last_millis = now_millis
-
-    angle = wrap_to_0_2pi(last_angle + dt * frequency * 2. * math.pi)
-    cm_on_strip, (x, y) = unwind_angle(northclockwise2math(angle))
-    intensity = (min(height, width) / 2.) / math.sqrt(x*x+y*y)
-    fraction_led = cm_on_strip * leds_per_cm
-    last_angle = angle
-
-    frac, frac_led_index = math.modf(fraction_led)
-    frac_led_index = int(frac_led_index)
-
-    background = [0, 0, 0, 0]
-    beam_color = [int(intensity * c) for c in color]
-
-    init(leds0, background)
-
-    for i in range(tail):
-        index = (frac_led_index - i) % n
-        t = 1. - float(i) / tail
-        fading = interpolate_rgbw(background, beam_color, t)
-        leds0[index * 4:index * 4 + 4] = bytearray(fading)
-
-    neopixel_write(pin, leds0)
-
-
-def larson_scanner(primary, secondary):
-    global larson_index, larson_dir, larson_last_dir
-
-    size = 12
-
-    init(leds1, secondary)
-    leds1[larson_index * 4:larson_index * 4 + 4] = bytearray(primary)
-
-    for i in range(size):
-        b = larson_index + 1 + i
-        a = larson_index - 1 - i
-        t = (i+1.) / size
-        fading = interpolate_rgbw(secondary, primary, 1-t)
-        if larson_bounds[0] <= a and a < larson_bounds[1]:
-            leds1[a * 4:a * 4 + 4] = bytearray(fading)
-        if larson_bounds[0] <= b and b < larson_bounds[1]:
-            leds1[b * 4:b * 4 + 4] = bytearray(fading)
-
-    neopixel_write(pin, leds1)
-
-    larson_last_dir = larson_dir
-    larson_index += larson_dir
-    if larson_dir == 1 and larson_index == larson_bounds[1] - 1:
-        larson_dir = -1
-    elif larson_dir == -1 and larson_index == larson_bounds[0]:
-        larson_dir = 1
+class Map:
+    """
+    State of one map: its buffers, output, timers, clock, location and the running mode.
 
+    The device runs the one instance created below, whose methods are also available
+    as the module functions. Host tools like simulate.py create as many as they like.
 
-# ##############################################################################
+    Caches that only depend on their arguments are shared by the maps of a process:
+    solunar.ephemeris and the last almanac (keyed by location and time), the kernels
+    and brush spans of frame and the argument array of fast, as are the settings
+    solunar.precision and use_fits. They are not reentrant, maps draw one after the
+    other, as timer callbacks and the event loop of simulate.py do.
+    """
 
+    def __init__(self, coords=coords, utc_offset=utc_offset, segments=segments, current_limit_ma=current_limit_ma,
+                 time=None, driver=bitstream_driver, almanac_path='almanac'):
+        """
+        Parameters:
+        ----------------
+        time : timing.SoftClock
+            clock the modes read, timing.clock if None
+        almanac_path : str
+            file the daily almanac is kept in, None to not use the flash
+        """
+        self.coords = coords
+        self.utc_offset = utc_offset
+        self.time = time or timing.clock
+        self.almanac_path = almanac_path
+
+        # solunar
+        self.equinox_or_solstice = -1
+        self.almanac = None  # of the current local day
+        self.almanac_job = None  # steps of the almanac of a new day, see solunar.almanac_steps()
+        self.almanac_timer = Timer(-1)
+
+        # global dimmer
+        self.dimmer = 0.5
+
+        # displayed led colors
+        self.leds0 = bytearray(n * 4)
+
+        # led colors to be faded to
+        self.leds1 = IndexedFrame(n) if indexed_target else bytearray(n * 4)
+
+        # update timer
+        self.timer = Timer(-1)
+
+        # background clock resync
+        self.sync_timer = Timer(-1)
+        self.sync_period = 0  # 0 while the timer is not running
+
+        self.preview = None
+        self.preview_timer = Timer(-1)
+
+        self.shared = None  # frames published to other processes, see share()
+
+        # keep track if dynamic, timer-based mode is running or a static
+        self.static = True
+
+        # spin
+        self.last_angle = 0
+        self.last_millis = 0
+        self.spin_tail = spin_tails[0]
+        self.spin_color = None  # color the ramp was built for
+        self.spin_ramp = bytearray(4 * spin_tails[0])  # tail colors from the head backwards at full intensity
+        self.spin_head = -1  # led index of the head drawn last, -1 to redraw everything
+
+        # larson scanner
+        self.larson_bounds = (0, n)
+        self.larson_index = 0
+        self.larson_dir = 1
+        self.larson_size = larson_sizes[0]
+        self.larson_colors = (None, None)  # colors the kernel was built for
+        self.larson_kernel = bytearray(4 * (larson_sizes[0] + 1))  # colors by distance from the center
+        self.larson_drawn = False
+
+        # frame pacing of the timer driven modes
+        self.clock_pacer = Pacer(100, levels=2)  # level 1 drops the continuous second hand
+        self.spin_pacer = Pacer(50, levels=len(spin_tails))
+        self.larson_pacer = Pacer(100, levels=len(larson_sizes))
+
+        self.clock = clk.Clock()
+        self.clock.set_background_colors(color_ambient, color_river)
+        self.clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
+
+        # init neopixels
+        self.output = Output(segments, driver)
+        self.output.set_limit(current_limit_ma)
+        self.output.show(self.leds0)
+        self.clock.mark = self.output.mark_ring
+
+    def timers(self):
+        return self.timer, self.sync_timer, self.preview_timer, self.almanac_timer
+
+    # ##########################################################################
+
+    def draw(self, render, *args):
+        """
+        Draw the colors to fade to with render(*args, leds1).
+
+        When they do not fit the palette of an indexed frame, leds1 is replaced by an
+        rgbw buffer and drawn again, the snapped colors are never shown. It stays rgbw,
+        the memory is needed whenever that mode runs again anyway.
+        """
+        leds1 = self.leds1
+        if isinstance(leds1, IndexedFrame):
+            leds1.overflows = 0
+            render(*args, leds1)
+            if not leds1.overflows:
+                return
+            self.leds1 = leds1 = None  # free the indexed frame before allocating the larger buffer
+            leds1 = self.leds1 = bytearray(n * 4)
+        render(*args, leds1)
+
+    def fade(self, steps=32, sleep=0):
+        leds0, leds1 = self.leds0, self.leds1
+        indexed = isinstance(leds1, IndexedFrame)
+        dim = int(self.dimmer * 256)
+        for i in range(steps):
+            with meter.frame('fade'):
+                t = (i + 1) * 256 // steps
+                if indexed:
+                    fast.fade_indexed(leds0, leds1.index, leds1.palette, n, t, dim)
+                else:
+                    fast.fade(leds0, leds1, n * 4, t, dim)  # iterate all
+                self.output.show(leds0)
+            utime.sleep_ms(sleep)
+
+    def apply_dimmer(self, value):
+        self.dimmer = clamp(value, 0., 1.)
+
+        # apply in static mode only
+        if self.static:
+            self.fade()
+
+    def off(self):
+        self.draw(clear)
+        self.fade()
+
+    def ambient(self):
+        self.draw(paris)
+        self.fade()
+
+    def set_circular_background(self, color):
+        self.draw(render_circular, color)
+        self.fade()
+
+    def set_sides(self, north, east, south, west, linear=False):
+        self.draw(render_sides, north, east, south, west, linear)
+        self.fade()
+
+    # ##########################################################################
+
+    def set_vertical(self, c1, c2):
+        self.draw(render_halves, cardinals['north'][0], c1, cardinals['south'][0], c2)
+        self.fade()
+
+    def set_horizontal(self, c1, c2):
+        self.draw(render_halves, cardinals['west'][0], c1, cardinals['east'][0], c2)
+        self.fade()
+
+    def set_vertical_interp(self, c1, c2):
+        self.draw(render_vertical_interp, c1, c2)
+        self.fade()
+
+    # ##########################################################################
+
+    def ramp_up(self):
+        """
+        Start animation.
+        Draws into leds0 array so the next animation will fade from there to leds1.
+        """
+        leds0, output = self.leds0, self.output
+
+        center = cardinals['south'][0]
+        size = (cols + 2 * rows)
+        d = (size + 1) % 2
+        ramp_color_1 = bytearray((0, 0, 0, 5))
+        ramp_color_2 = bytearray((0, 0, 0, 50))
+        ramp_color_3 = bytearray((0, 0, 0, 200))
 
-def set_color(led_index, color, clear_others=False):
-    led_index = clamp(led_index, 0, n-1)
-    if clear_others:
         clear(leds0)
-    leds0[led_index*4:led_index*4+4] = bytearray(color)
-    neopixel_write(pin, leds0)
-
-
-# ##############################################################################
-
-
-def run_solunar():
-    global static, equinox_or_solstice
-
-    # calculate once if today is equinox or solstice
-    equinox_or_solstice = solunar.is_equinox_or_solstice(utime.localtime())
-
-    paris_solunar()
-
-    static = False
-    timer.init(period=60000, mode=Timer.PERIODIC, callback=lambda t: paris_solunar())
-
-
-def run_cls_clock(continuous=False):
-    global static
-
-    clock.update_params({'mode': 'cls', 'continuous': continuous})
-    clock.set_background_colors(color_ambient, color_river)
-    clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
-
-    timing.update_time()
-
-    static = False
-    timer.init(period=100, mode=Timer.PERIODIC, callback=lambda t: update_clock())
-
-
-def run_neo_clock(start_at_minute=False, two_colors=False, ambient=False):
-    global static, last_minute
-
-    clock.update_params({'mode': 'neo',
-                         'start_at_minute': start_at_minute,
-                         'two_colors': two_colors,
-                         'ambient': ambient})
-
-    if ambient:
-        clock.set_background_colors(color_ambient, color_river)
-        clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
-    else:
-        clock.set_background_colors(colors.colors['cyan'], colors.colors['orange'])
-
-    timing.update_time()
-    s = utime.localtime()[5]  # seconds
-    while True:  # wait for the next full second
-        if utime.localtime()[5] != s:
-            last_minute = utime.localtime()[4]  # prevents color update on first neo draw
-            break
-        utime.sleep_ms(10)
-
-    static = False
-    timer.init(period=100, mode=Timer.PERIODIC, callback=lambda t: update_clock())
-
-
-def run_spin(color, frequency=0.25):
-    global static
-
-    static = False
-    timer.init(period=50, mode=Timer.PERIODIC, callback=lambda t: spin(color, frequency))
-
-
-def run_larson_scanner(cardinal, primary, secondary):
-    global static, larson_bounds, larson_index, larson_dir, larson_last_dir
-
-    larson_bounds = cardinals[cardinal][2]
-    larson_index = larson_bounds[0]
-    larson_dir = 1
-    larson_last_dir = -1
-
-    n_leds = cardinals[cardinal][1]
-    seconds = 2.
-    dt = seconds / n_leds * 1000.
-
-    static = False
-    timer.init(period=int(round(dt)), mode=Timer.PERIODIC, callback=lambda t: larson_scanner(primary, secondary))
-
-
-def stop_timer():
-    global static
-    if not static:
-        leds0[:] = leds1  # copy currently displayed colors to start array for next fade
-        static = True  # back to static mode
-    timer.deinit()
+        set_area2(center/leds_per_cm, width/3, ramp_color_2, leds0)
+        output.show(leds0)
+
+        utime.sleep_ms(200)
+
+        for i in range(size // 2):
+            i1 = (center - (i % n) - d) % n
+            i2 = (center + (i % n)) % n
+            leds0[i1 * 4:i1 * 4 + 4] = ramp_color_1
+            leds0[i2 * 4:i2 * 4 + 4] = ramp_color_1
+            output.show(leds0)
+            utime.sleep_ms(12)
+
+        for i in range(16):
+            color = interpolate_rgbw(ramp_color_1, ramp_color_3, (i + 1.) / 16.)
+            set_area2(cardinals['north'][0]/leds_per_cm, width, color, leds0)
+            output.show(leds0)
+            utime.sleep_ms(2)
+
+        self.fade()
+
+    # ##########################################################################
+
+    def test_led(self, led_id, brightness=1, n_times=2, timeout_ms=300):
+        for _ in range(n_times):
+            for i in range(4):
+                clear(self.leds0)
+                index = (led_id*4) + i
+                self.leds0[index] = brightness
+                self.output.show(self.leds0)
+                utime.sleep_ms(timeout_ms)
+        self.off()
+
+    def cycle_channels(self, brightness=255, n_cycles=1, timeout_ms=100):
+        for i in range(n * 4 * n_cycles):
+            clear(self.leds0)
+            index = i % (n * 4)
+            self.leds0[index] = brightness
+            self.output.show(self.leds0)
+            utime.sleep_ms(timeout_ms)
+        self.off()
+
+    def cycle_color(self, color, n_cycles=1, timeout_ms=100):
+        for i in range(n * n_cycles):
+            clear(self.leds0)
+            index = (i % n) * 4
+            self.leds0[index:index + 4] = bytearray(color)
+            self.output.show(self.leds0)
+            utime.sleep_ms(timeout_ms)
+        self.off()
+
+    def cycle_circular(self, size=1):
+        leds0 = self.leds0
+        n_samples = 360
+        color_1 = [0, 0, 0, 0]  # background color
+        color_2 = [0, 164, 0, 0]  # pointer color
+        for i in range(n_samples):
+            angle = 2/3.*math.pi + i/n_samples * 3/4.*math.pi
+            # angle = 2/3.*math.pi + i/n_samples * 2*math.pi
+            cm_on_strip, (x, y) = unwind_angle(northclockwise2math(angle))
+            fraction_led = cm_on_strip * leds_per_cm
+            frac, frac_led_index = math.modf(fraction_led)
+            frac_led_index = int(frac_led_index)
+            init(leds0, color_1)
+            id0 = frac_led_index * 4
+            id1 = ((frac_led_index+1) % n) * 4
+
+            # 1 smooth
+            # leds0[id0:id0+4] = bytearray((0, 0, 0, int((1-frac)*64)))
+            # leds0[id1:id1+4] = bytearray((0, 0, 0, int(frac*64)))
+
+            # 2 blending in: not so super smooth, but ok
+            # leds0[id0:id0+4] = bytearray(interpolate_rgbw(color_2, color_1, frac))
+            # leds0[id1:id1+4] = bytearray(interpolate_rgbw(color_1, color_2, frac))
+
+            # 3
+            set_area2(cm_on_strip, size, color_2, leds0)
+
+            self.output.show(leds0)
+            utime.sleep_ms(1)
+        self.off()
+
+    # ##########################################################################
+
+    def update_almanac(self):
+        # computed once per local day, kept on flash across reboots
+        self.almanac = solunar.daily_almanac(self.coords, self.time.localtime(self.utc_offset)[:3], self.utc_offset,
+                                             self.almanac_path)
+        self.equinox_or_solstice = self.almanac.event
+
+    def start_almanac(self):
+        # compute the almanac of a new day in short steps of their own timer, not within a frame
+        self.almanac_job = solunar.almanac_steps(self.coords, self.time.localtime(self.utc_offset)[:3],
+                                                 self.utc_offset, self.almanac_path)
+        self.almanac_timer.init(period=50, mode=Timer.PERIODIC, callback=lambda t: self.step_almanac())
+
+    def step_almanac(self):
+        a = next(self.almanac_job)
+        if a is not None:
+            self.almanac_timer.deinit()
+            self.almanac_job = None
+            self.almanac = a
+            self.equinox_or_solstice = a.event
+
+    def paris_solunar(self):
+        if self.almanac is None:
+            self.update_almanac()
+        elif self.almanac_job is None and self.time.localtime(self.utc_offset)[:3] != self.almanac.date:  # new day
+            self.start_almanac()  # the day before is shown until it is done
+        with meter.frame('solunar'):
+            self.draw(render_solunar, self.coords, self.time.localtime(), self.equinox_or_solstice)
+        self.fade()
+
+    def solunar_demo(self):
+        leds0 = self.leds0
+        self.draw(paris)
+        self.fade()
+        year, month, day, hour, minute, second, weekday, yearday = self.time.localtime()
+
+        for h in range(24):
+            for m in range(0, 60):
+                # clear
+                paris(leds0)
+
+                # hour
+                angle = (h % 12 + m / 60.) / 12. * 2. * math.pi
+                distance = geometry.unwind(northclockwise2math(angle))
+                set_area2(distance, 4, [158, 81, 188, 0], leds0)
+
+                # solar/lunar
+                draw_solunar_positions(self.coords, (year, month, day, h, m, 0, weekday, yearday), leds0)
+
+                # apply
+                self.output.show(leds0)
+
+        self.draw(paris)
+        self.fade()
+
+    def timelapse(self, start, end, step_s=3600, fps=25, path=None):
+        """
+        Play sun and moon over a date range, e.g. a year of sun paths in a minute
+        with timelapse((2024, 1, 1), (2025, 1, 1), 6 * 3600, 24).
+        Frames that cannot be shown in time are dropped to hold the frame rate.
+
+        Parameters:
+        ----------------
+        start, end : tuple
+            utc year, month, day[, hour, minute, second], end excluded
+        step_s : int
+            seconds between frames
+        fps : int
+            target frame rate
+        path : str
+            ephemeris file written by solunar.save_ephemeris(), which also sets start, end and step,
+            None to compute the positions while playing
+
+        Returns:
+        ----------------
+        dict :
+            frames shown and dropped and the frame rate achieved
+        """
+        leds0 = self.leds0
+        source = solunar.EphemerisFile(path) if path else solunar.EphemerisStream(self.coords, start, end, step_s)
+        self.draw(paris)
+        self.fade()
+
+        shown, dropped = 0, 0
+        t0 = utime.ticks_ms()
+        k = 0
+        while k < source.count:
+            with meter.frame('timelapse'):
+                paris(leds0)
+
+                # hour
+                s = (source.day_seconds(k) + self.utc_offset * 3600) % 86400
+                distance = geometry.unwind(northclockwise2math(s / 43200. * 2. * math.pi))
+                set_area2(distance, 4, [158, 81, 188, 0], leds0)
+
+                solar_azim, solar_elev, lunar_azim, lunar_elev = source.get(k)
+                draw_bodies(solar_azim, solar_elev, lunar_azim, lunar_elev, leds0)
+                self.output.show(leds0)
+            shown += 1
+
+            # frame due now, skip the ones already late
+            due = min(utime.ticks_diff(utime.ticks_ms(), t0) * fps // 1000, source.count)
+            if due > k + 1:
+                dropped += due - k - 1
+                k = due
+            else:
+                k += 1
+                wait = k * 1000 // fps - utime.ticks_diff(utime.ticks_ms(), t0)
+                if wait > 0:
+                    utime.sleep_ms(wait)
+
+        elapsed = utime.ticks_diff(utime.ticks_ms(), t0)
+        if path:
+            source.close()
+        self.draw(paris)
+        self.fade()
+        return {'frames': shown, 'dropped': dropped, 'fps': shown * 1000. / max(elapsed, 1), 'target_fps': fps}
+
+    # ##########################################################################
+
+    def update_clock(self):
+        with meter.frame('clock'):
+            self.clock.quality = self.clock_pacer.level
+            h, m, s, ms = self.time.time_of_day(self.utc_offset)
+            if self.clock.update(h, m, s, ms, self.leds0):  # marks what it drew
+                self.output.flush(self.leds0)
+
+    def clock_demo(self):
+        for h in range(24):
+            for m in range(0, 60):
+                for s in range(0, 60):
+                    for ms in range(0, 1000, 250):
+                        self.clock.update(h, m, s, ms, self.leds0)
+                        self.output.show(self.leds0)
+
+    # ##########################################################################
+
+    def spin(self, color, frequency):
+        with meter.frame('spin'):
+            leds0 = self.leds0
+            tail = spin_tails[self.spin_pacer.level]
+            if tail != self.spin_tail:  # quality changed, rebuild the ramp
+                self.spin_tail = tail
+                self.spin_color = None
+
+            now_millis = utime.ticks_ms()
+            dt = utime.ticks_diff(now_millis, self.last_millis) / 1000.
+            self.last_millis = now_millis
+
+            angle = (self.last_angle + dt * frequency * 2. * math.pi) % (2. * math.pi)
+            self.last_angle = angle
+            head = int(geometry.unwind(northclockwise2math(angle)) * leds_per_cm) % n
+
+            spin_ramp = self.spin_ramp
+            spin_head = self.spin_head
+            if color is not self.spin_color:  # new color, rebuild the ramp and redraw
+                self.spin_color = color
+                for i in range(tail):
+                    t = 1. - float(i) / tail
+                    for c in range(4):
+                        spin_ramp[i * 4 + c] = int(interpolate(0, color[c], t))
+                clear(leds0)
+                self.output.mark_all()
+                spin_head = -1
+            elif head == spin_head:  # beam still on the same led
+                return
+
+            if spin_head >= 0:
+                # clear the end of the old tail that is not covered by the new one
+                steps = (head - spin_head) % n
+                if steps > tail:
+                    steps = tail
+                for i in range(tail - steps, tail):
+                    o = (spin_head - i) % n * 4
+                    leds0[o] = leds0[o + 1] = leds0[o + 2] = leds0[o + 3] = 0
+                self.output.mark_ring(spin_head - tail + 1, steps)
+
+            k = geometry.intensity[head]  # beam dimmer towards the corners
+            for i in range(tail):
+                o = (head - i) % n * 4
+                j = i * 4
+                leds0[o] = spin_ramp[j] * k // 255
+                leds0[o + 1] = spin_ramp[j + 1] * k // 255
+                leds0[o + 2] = spin_ramp[j + 2] * k // 255
+                leds0[o + 3] = spin_ramp[j + 3] * k // 255
+            self.output.mark_ring(head - tail + 1, tail)
+            self.spin_head = head
+
+            self.output.flush(leds0)
+
+    def larson_scanner(self, primary, secondary):
+        with meter.frame('larson_scanner'):
+            leds0 = self.leds0
+            kernel = self.larson_kernel
+            size = larson_sizes[self.larson_pacer.level]
+            if size != self.larson_size:  # quality changed, rebuild the kernel
+                self.larson_size = size
+                self.larson_colors = (None, None)
+            step = self.larson_pacer.divider  # leds moved per frame, keeps the speed at lower frame rates
+
+            if primary is not self.larson_colors[0] or secondary is not self.larson_colors[1]:
+                self.larson_colors = (primary, secondary)
+                kernel[0:4] = bytearray(primary)
+                for i in range(size):
+                    t = (i+1.) / size
+                    kernel[4 * (i + 1):4 * (i + 2)] = bytearray(interpolate_rgbw(secondary, primary, 1-t))
+                self.larson_drawn = False
+
+            if not self.larson_drawn:  # the kernel fades to the background, afterwards redrawing the window is enough
+                init(leds0, secondary)
+                self.output.mark_all()
+                self.larson_drawn = True
+
+            index = self.larson_index
+            b0, b1 = self.larson_bounds
+            i0 = max(b0, index - size - step + 1)
+            i1 = min(b1, index + size + step)
+            for i in range(i0, i1):
+                o = i % n * 4
+                j = min(abs(i - index), size) * 4
+                leds0[o] = kernel[j]
+                leds0[o + 1] = kernel[j + 1]
+                leds0[o + 2] = kernel[j + 2]
+                leds0[o + 3] = kernel[j + 3]
+            self.output.mark_ring(i0, i1 - i0)  # the side may run across the strip start
+
+            self.output.flush(leds0)
+
+            direction = self.larson_dir
+            for _ in range(step):
+                index += direction
+                if direction == 1 and index == b1 - 1:
+                    direction = -1
+                elif direction == -1 and index == b0:
+                    direction = 1
+            self.larson_index = index
+            self.larson_dir = direction
+
+    # ##########################################################################
+
+    def set_color(self, led_index, color, clear_others=False):
+        led_index = clamp(led_index, 0, n-1)
+        if clear_others:
+            clear(self.leds0)
+        self.leds0[led_index*4:led_index*4+4] = bytearray(color)
+        self.output.show(self.leds0)
+
+    # ##########################################################################
+
+    def run_solunar(self):
+        self.update_almanac()
+        self.paris_solunar()
+
+        self.static = False
+        self.timer.init(period=60000, mode=Timer.PERIODIC, callback=lambda t: self.paris_solunar())
+
+    def run_cls_clock(self, continuous=False):
+        self.clock.update_params({'mode': 'cls', 'continuous': continuous})
+        self.clock.set_background_colors(color_ambient, color_river)
+        self.clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
+
+        if not self.time.synced:
+            self.time.wait()
+
+        self.clock_pacer.levels = 2
+        self.clock_pacer.reset()
+        self.static = False
+        self.timer.init(period=100, mode=Timer.PERIODIC, callback=self.clock_pacer.callback(self.update_clock))
+
+    def run_neo_clock(self, start_at_minute=False, two_colors=False, ambient=False):
+        self.clock.update_params({'mode': 'neo',
+                                  'start_at_minute': start_at_minute,
+                                  'two_colors': two_colors,
+                                  'ambient': ambient})
+
+        if ambient:
+            self.clock.set_background_colors(color_ambient, color_river)
+            self.clock.set_hand_colors([26, 26, 0, 127], [60, 0, 40, 0], color_accent)
+        else:
+            self.clock.set_background_colors(colors.colors['cyan'], colors.colors['orange'])
+
+        if not self.time.synced:
+            self.time.wait()
+
+        self.clock_pacer.levels = 1  # the neo clock has no cheaper drawing, only its frame rate adapts
+        self.clock_pacer.reset()
+
+        self.static = False
+        self.timer.init(period=100, mode=Timer.PERIODIC, callback=self.clock_pacer.callback(self.update_clock))
+
+    def run_spin(self, color, frequency=0.25):
+        self.spin_color = None  # start with a full redraw
+        self.spin_pacer.reset()
+        self.static = False
+        self.timer.init(period=50, mode=Timer.PERIODIC,
+                        callback=self.spin_pacer.callback(lambda: self.spin(color, frequency)))
+
+    def run_larson_scanner(self, cardinal, primary, secondary):
+        self.larson_bounds = cardinals[cardinal][2]
+        self.larson_index = self.larson_bounds[0]
+        self.larson_dir = 1
+        self.larson_drawn = False
+
+        n_leds = cardinals[cardinal][1]
+        seconds = 2.
+        dt = int(round(seconds / n_leds * 1000.))
+
+        self.larson_pacer.set_period(dt)
+        self.static = False
+        self.timer.init(period=dt, mode=Timer.PERIODIC,
+                        callback=self.larson_pacer.callback(lambda: self.larson_scanner(primary, secondary)))
+
+    def stop_timer(self):
+        if not self.static:
+            self.static = True  # back to static mode, every mode leaves its displayed colors in leds0 to fade from
+        self.timer.deinit()
+
+    # ##########################################################################
+
+    def start_preview(self, port=8080, fps=5):
+        from preview import Preview  # only costs memory when used
+        self.preview = Preview(port, fps)
+        # polls the buffer last written, the render paths never wait for the clients
+        self.preview_timer.init(period=1000 // fps, mode=Timer.PERIODIC,
+                                callback=lambda t: self.preview.poll(self.output.buffer))
+
+    def share(self, name='solarmap', path=None):
+        """
+        Host only: publish every frame written to the strip into shared memory (see shared.py).
+        """
+        from shared import SharedFrame
+        self.shared = SharedFrame(name, n, path)
+        self.output.tap = self.shared.publish
+
+    def service_time(self):
+        # poll often while an ntp reply is awaited, its arrival time anchors the clock
+        period = 10 if self.time.service() else 1000
+        if period != self.sync_period:
+            self.sync_period = period
+            self.sync_timer.init(period=period, mode=Timer.PERIODIC, callback=lambda t: self.service_time())
+
+    def run(self, is_online):
+        self.draw(paris)
+        self.ramp_up()
+        if is_online:
+            self.service_time()
+            if preview_port:
+                self.start_preview(preview_port, preview_fps)
+            self.run_solunar()
+        else:
+            self.set_sides((0, 0, 0, 0), (50, 50, 0, 80), (0, 0, 0, 0), (50, 50, 0, 80), False)
 
 
 # ##############################################################################
 
 
-def run(is_online):
-    paris(leds1)
-    ramp_up()
-    if is_online:
-        run_solunar()
-    else:
-        set_sides((0, 0, 0, 0), (50, 50, 0, 80), (0, 0, 0, 0), (50, 50, 0, 80), False)
+# the map of the device, its buffers and modes as module globals for main.py and the webrepl
+default = Map()
+
+# leds1 is the initial fade target, default.draw() may replace it by an rgbw buffer
+leds0, leds1, output, clock = default.leds0, default.leds1, default.output, default.clock
+clock_pacer, spin_pacer, larson_pacer = default.clock_pacer, default.spin_pacer, default.larson_pacer
+
+fade = default.fade
+apply_dimmer = default.apply_dimmer
+off = default.off
+ambient = default.ambient
+set_circular_background = default.set_circular_background
+set_sides = default.set_sides
+set_vertical = default.set_vertical
+set_horizontal = default.set_horizontal
+set_vertical_interp = default.set_vertical_interp
+ramp_up = default.ramp_up
+test_led = default.test_led
+cycle_channels = default.cycle_channels
+cycle_color = default.cycle_color
+cycle_circular = default.cycle_circular
+paris_solunar = default.paris_solunar
+solunar_demo = default.solunar_demo
+timelapse = default.timelapse
+update_clock = default.update_clock
+clock_demo = default.clock_demo
+spin = default.spin
+larson_scanner = default.larson_scanner
+set_color = default.set_color
+run_solunar = default.run_solunar
+run_cls_clock = default.run_cls_clock
+run_neo_clock = default.run_neo_clock
+run_spin = default.run_spin
+run_larson_scanner = default.run_larson_scanner
+stop_timer = default.stop_timer
+start_preview = default.start_preview
+share = default.share
+run = default.run
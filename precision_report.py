@@ -0,0 +1,79 @@
+# host tool: per-call cost and accuracy of the solunar precision tiers
+#
+#   python precision_report.py [year] [lat] [long]
+#
+# errors are measured against the most accurate tier over a year while the body is above
+# the horizon, the azimuth error is also given in leds on the frame defined in frame.py.
+
+import calendar
+import math
+import sys
+import time
+
+import solunar
+from common import wrap_to_pi, northclockwise2math
+from frame import unwind_angle, leds_per_cm, strip_length_cm
+
+step_minutes = 47
+timing_calls = 2000
+
+
+def dates(year):
+    t = calendar.timegm((year, 1, 1, 0, 0, 0))
+    end = calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+    while t < end:
+        yield tuple(time.gmtime(t))[:8]
+        t += step_minutes * 60
+
+
+def positions(coords, year, tier):
+    solunar.set_precision(tier)
+    return [(solunar.calc_solar_position(coords, dt), solunar.calc_lunar_position(coords, dt)) for dt in dates(year)]
+
+
+def cost_us(coords, tier):
+    solunar.set_precision(tier)
+    dt = (2022, 6, 21, 12, 0, 0, 1, 172)
+    t0 = time.perf_counter()
+    for _ in range(timing_calls):
+        solunar.calc_solar_position(coords, dt)
+        solunar.calc_lunar_position(coords, dt)
+    return (time.perf_counter() - t0) / timing_calls * 1e6
+
+
+def led_error(a, b):
+    da = abs(unwind_angle(northclockwise2math(a))[0] - unwind_angle(northclockwise2math(b))[0])
+    return min(da, strip_length_cm - da) * leds_per_cm
+
+
+def main(year=2022, coords=(48.860536, 2.332237)):
+    solunar.ephemeris.enabled = False  # every call computes, for the timings and the exact times
+    top = len(solunar.tiers) - 1
+    reference = positions(coords, year, top)
+    print('tier        cost/call [us]  body   max azim [deg]  max elev [deg]  max leds')
+    cheapest = None
+    for tier in range(top + 1):
+        cost = cost_us(coords, tier)
+        worst = 0.
+        for b, body in enumerate(('sun', 'moon')):
+            azim, elev, leds = 0., 0., 0.
+            for p, r in zip(positions(coords, year, tier), reference):
+                (a, e), (ra, re) = p[b], r[b]
+                if re <= 0.:
+                    continue
+                azim = max(azim, abs(wrap_to_pi(a - ra)))
+                elev = max(elev, abs(e - re))
+                leds = max(leds, led_error(a, ra))
+            worst = max(worst, leds)
+            print('{:d} {:8s} {:16.1f}  {:5s} {:14.4f} {:15.4f} {:9.2f}'.format(
+                tier, solunar.tiers[tier], cost, body, math.degrees(azim), math.degrees(elev), leds))
+        if cheapest is None and worst < 1.:
+            cheapest = tier
+    print('cheapest tier below one led:', solunar.tiers[cheapest] if cheapest is not None else None)
+    solunar.set_precision(0)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 2022,
+         (float(args[1]), float(args[2])) if len(args) > 2 else (48.860536, 2.332237))
@@ -0,0 +1,228 @@
+# live preview of the displayed leds as server-sent events
+#
+#   http://<map>:8080/         page drawing the frame in a browser
+#   http://<map>:8080/stream   event stream
+#
+# the stream starts with a layout event holding the led positions in cm, followed by
+# messages of changed led ranges 'first_led hex;first_led hex;...' with 4 grbw bytes per led.
+# all sockets are non-blocking, poll() never waits for a client. a client whose socket does
+# not take a whole message skips frames until it has caught up and then gets a full frame.
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+try:
+    import uerrno as errno
+except ImportError:
+    import errno
+
+import frame
+from hal import utime
+
+page = b'''HTTP/1.0 200 OK\r
+Content-Type: text/html\r
+Connection: close\r
+\r
+<!DOCTYPE html><html><head><title>solar map</title></head>
+<body style="background:#111;margin:0"><canvas id="c" width="900" height="600"></canvas><script>
+var c = document.getElementById('c'), g = c.getContext('2d'), pos = [], leds = [];
+var s = new EventSource('/stream');
+s.addEventListener('layout', function(e) {
+  pos = e.data.split(';').map(function(p) { return p.split(',').map(Number); });
+});
+s.onmessage = function(e) {
+  e.data.split(';').forEach(function(r) {
+    var q = r.split(' '), i = +q[0], h = q[1];
+    for (var k = 0; k < h.length; k += 8, i++) {
+      var v = [0, 2, 4, 6].map(function(j) { return parseInt(h.substr(k + j, 2), 16); });
+      leds[i] = 'rgb(' + Math.min(255, v[1] + v[3]) + ',' + Math.min(255, v[0] + v[3]) + ',' + Math.min(255, v[2] + v[3]) + ')';
+    }
+  });
+  var w = 1, h = 1;
+  pos.forEach(function(p) { w = Math.max(w, Math.abs(p[0])); h = Math.max(h, Math.abs(p[1])); });
+  var k = 0.45 * Math.min(c.width / w, c.height / h);
+  g.fillStyle = '#111'; g.fillRect(0, 0, c.width, c.height);
+  pos.forEach(function(p, i) {
+    g.fillStyle = leds[i] || '#000';
+    g.beginPath(); g.arc(c.width / 2 + k * p[0], c.height / 2 - k * p[1], 4, 0, 7); g.fill();
+  });
+};
+</script></body></html>
+'''
+
+stream_header = b'HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n'
+
+
+class Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.request = b''
+        self.streaming = False
+        self.pending = None  # rest of the message the socket did not take
+        self.close_after = False
+        self.needs_key = True
+
+
+class Preview:
+    """
+    Streams a led buffer to browsers, only the changed led ranges and at most fps frames per second.
+    """
+
+    def __init__(self, port=8080, fps=5, max_clients=3, gap=2):
+        """
+        Parameters:
+        ----------------
+        gap : int
+            unchanged leds between two changed ranges up to which they are sent as one
+        """
+        self.period_ms = 1000 // fps
+        self.max_clients = max_clients
+        self.gap = gap
+        self.n = frame.n
+        self.last = bytearray(4 * self.n)  # frame the deltas are relative to
+        self.last_ticks = utime.ticks_ms()
+        self.clients = []
+        self.frames = 0
+        self.skipped = 0  # frames not sent to a client that fell behind
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(socket.getaddrinfo('0.0.0.0', port)[0][-1])
+        self.server.listen(2)
+        self.server.setblocking(False)
+
+    def close(self):
+        for c in self.clients:
+            c.sock.close()
+        self.clients = []
+        self.server.close()
+
+    def poll(self, buffer):
+        """
+        Accept and serve clients and send the changes of buffer if a frame is due. Never blocks.
+        """
+        self.accept()
+        for c in list(self.clients):
+            self.service(c)
+        now = utime.ticks_ms()
+        if buffer is None or utime.ticks_diff(now, self.last_ticks) < self.period_ms:
+            return
+        self.last_ticks = now
+        delta, key = None, None
+        for c in self.clients:
+            if not c.streaming:
+                continue
+            if c.pending is not None:  # fell behind, skip
+                c.needs_key = True
+                self.skipped += 1
+            elif c.needs_key:
+                key = key or self.message([(0, self.n)], buffer)
+                c.needs_key = False
+                self.send(c, key)
+            else:
+                if delta is None:
+                    delta = self.message(self.changes(buffer), buffer)
+                if delta:
+                    self.send(c, delta)
+        self.last[:] = buffer
+        self.frames += 1
+
+    def accept(self):
+        try:
+            sock, addr = self.server.accept()
+        except OSError:
+            return
+        if len(self.clients) >= self.max_clients:
+            sock.close()
+            return
+        sock.setblocking(False)
+        self.clients.append(Client(sock))
+
+    def service(self, c):
+        if c.pending is not None:
+            self.send(c, c.pending)
+            if c.pending is None and c.close_after:
+                self.drop(c)
+            return
+        if c.streaming:
+            return
+        try:
+            data = c.sock.recv(256)
+        except OSError:
+            return
+        if not data:
+            self.drop(c)
+            return
+        c.request += data
+        if b'\r\n\r\n' not in c.request and len(c.request) < 1024:
+            return
+        parts = c.request.split(b' ', 2)
+        path = parts[1] if len(parts) > 1 else b'/'
+        c.request = b''
+        if path.startswith(b'/stream'):
+            c.streaming = True
+            self.send(c, stream_header + self.layout())
+        else:
+            c.close_after = True
+            self.send(c, page)
+            if c.pending is None:
+                self.drop(c)
+
+    def send(self, c, msg):
+        try:
+            k = c.sock.send(msg)
+        except OSError as e:
+            if e.args[0] != errno.EAGAIN:
+                self.drop(c)
+                return
+            k = 0
+        k = k or 0
+        c.pending = memoryview(msg)[k:] if k < len(msg) else None
+
+    def drop(self, c):
+        c.sock.close()
+        if c in self.clients:
+            self.clients.remove(c)
+
+    def changes(self, buffer):
+        """
+        Ranges [i0, i1) of leds that differ from the last frame.
+        """
+        ranges = []
+        last = self.last
+        start, end = -1, -1
+        for i in range(self.n):
+            o = 4 * i
+            if (buffer[o] != last[o] or buffer[o + 1] != last[o + 1]
+                    or buffer[o + 2] != last[o + 2] or buffer[o + 3] != last[o + 3]):
+                if start < 0:
+                    start = i
+                elif i - end > self.gap:
+                    ranges.append((start, end))
+                    start = i
+                end = i + 1
+        if start >= 0:
+            ranges.append((start, end))
+        return ranges
+
+    @staticmethod
+    def message(ranges, buffer):
+        if not ranges:
+            return b''
+        mv = memoryview(buffer)
+        parts = [str(i0).encode() + b' ' + binascii.hexlify(mv[4 * i0:4 * i1]) for i0, i1 in ranges]
+        return b'data: ' + b';'.join(parts) + b'\n\n'
+
+    def layout(self):
+        pos = []
+        for i in range(self.n):
+            x, y = frame.get_led_position(i)
+            pos.append('{:.1f},{:.1f}'.format(x, y))
+        return b'event: layout\ndata: ' + ';'.join(pos).encode() + b'\n\n'
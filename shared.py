@@ -0,0 +1,197 @@
+# host only: the displayed leds in shared memory, readable by other processes without copies
+#
+#   paris.share('solarmap')          renderer: publish every frame the output writes
+#   python shared.py solarmap        reader: print the frame rate seen in the region
+#
+# region: header (see HEADER) followed by n * 4 grbw bytes of the frame shown last, after the
+# brightness limit of the output (see output.Output.set_limit) was applied. the header
+# holds a sequence number that is odd while a frame is written (seqlock) and a frame counter.
+# readers take the sequence number, use the frame and check the sequence number again, a
+# changed number means the frame was torn and has to be read again.
+#
+# regions are named multiprocessing.shared_memory blocks, or files mapped with mmap if a path
+# is given, e.g. in /dev/shm for tools not written in python.
+
+import mmap
+import struct
+import time
+from multiprocessing import shared_memory
+
+# magic, version, n, sequence, frame counter, publish time (monotonic ns)
+HEADER = '<4sHHIIQ'
+MAGIC = b'SLMS'
+VERSION = 1
+
+SEQ = 8  # offsets in the header
+FRAMES = 12
+DATA = struct.calcsize(HEADER)
+
+
+def attach(name, create=False, size=0):
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    if not create:
+        # only the creator unlinks, python before 3.13 would also do it for every reader on exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class SharedFrame:
+    """
+    One frame of n leds in a shared memory region, written by one process and read by any number.
+    """
+
+    def __init__(self, name=None, n=None, path=None):
+        """
+        Parameters:
+        ----------------
+        name : str
+            name of the shared memory block, ignored if path is given
+        n : int
+            number of leds to create the region for, None to attach to an existing one
+        path : str
+            file to map instead of a shared memory block
+        """
+        self.create = n is not None
+        self.shm, self.file = None, None
+        if not self.create:
+            n = self._attached_n(name, path)
+        self.n = n
+        size = DATA + 4 * n
+        if path:
+            self.file = open(path, 'w+b' if self.create else 'r+b')
+            if self.create:
+                self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+            self.buf = memoryview(self.map)
+        else:
+            self.shm = attach(name, self.create, size)
+            self.buf = self.shm.buf
+        self.frame = self.buf[DATA:size]  # zero-copy view, check the sequence number around its use
+        self.seq = 0
+        self.frames = 0
+        if self.create:
+            struct.pack_into(HEADER, self.buf, 0, MAGIC, VERSION, n, 0, 0, 0)
+        elif bytes(self.buf[:4]) != MAGIC:
+            self.close()
+            raise ValueError('no shared frame')
+
+    @staticmethod
+    def _attached_n(name, path):
+        if path:
+            with open(path, 'rb') as f:
+                header = f.read(DATA)
+        else:
+            shm = attach(name)
+            header = bytes(shm.buf[:DATA])
+            shm.close()
+        return struct.unpack(HEADER, header)[2]
+
+    def close(self):
+        self.frame.release()
+        self.buf.release()
+        if self.shm is not None:
+            self.shm.close()
+            if self.create:
+                self.shm.unlink()
+        if self.file is not None:
+            self.map.close()
+            self.file.close()
+
+    # writer
+
+    def publish(self, buffer, lut=None):
+        """
+        Copy buffer into the region as the next frame.
+
+        Parameters:
+        ----------------
+        lut : bytearray
+            channel value mapping the strip is written through, None if unlimited
+        """
+        buf = self.buf
+        self.seq += 1  # odd, readers retry
+        struct.pack_into('<I', buf, SEQ, self.seq)
+        frame = self.frame
+        frame[:] = buffer
+        if lut is not None:
+            for k in range(len(frame)):  # in place, translate() would allocate a frame per publish
+                frame[k] = lut[frame[k]]
+        self.frames += 1
+        struct.pack_into('<IQ', buf, FRAMES, self.frames, time.monotonic_ns())
+        self.seq += 1
+        struct.pack_into('<I', buf, SEQ, self.seq)
+
+    # reader
+
+    def begin(self):
+        """
+        Wait until no frame is being written.
+
+        Returns:
+        ----------------
+        int :
+            sequence number to pass to retry() once done with the frame view
+        """
+        while True:
+            seq = struct.unpack_from('<I', self.buf, SEQ)[0]
+            if not seq & 1:
+                return seq
+            time.sleep(0)
+
+    def retry(self, seq):
+        """
+        Whether the frame changed since begin() returned seq, i.e. what was read may be torn.
+        """
+        return struct.unpack_from('<I', self.buf, SEQ)[0] != seq
+
+    def read(self, out):
+        """
+        Copy a consistent frame to out.
+
+        Returns:
+        ----------------
+        int :
+            frame counter of the frame copied
+        """
+        while True:
+            seq = self.begin()
+            out[:] = self.frame
+            frames = struct.unpack_from('<I', self.buf, FRAMES)[0]
+            if not self.retry(seq):
+                return frames
+
+
+def watch(name=None, path=None, seconds=5.):
+    """
+    Read the region as fast as possible and print the frames published and the torn reads.
+    """
+    shared = SharedFrame(name, path=path)
+    out = bytearray(4 * shared.n)
+    first = last = shared.read(out)
+    reads, torn, lit = 0, 0, 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        seq = shared.begin()
+        lit = sum(shared.frame)  # works on the shared memory directly
+        if shared.retry(seq):
+            torn += 1
+            continue
+        reads += 1
+        last = struct.unpack_from('<I', shared.buf, FRAMES)[0]
+    dt = time.perf_counter() - t0
+    print('{} leds, {} frames published ({:.0f}/s), {} reads, {} torn, channel sum {}'.format(
+        shared.n, last - first, (last - first) / dt, reads, torn, lit))
+    shared.close()
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('usage: python shared.py NAME | /path/to/file')
+        sys.exit(1)
+    arg = sys.argv[1]
+    if '/' in arg:
+        watch(path=arg)
+    else:
+        watch(arg)
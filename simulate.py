@@ -0,0 +1,183 @@
+# host tool: run many virtual maps at once to load test the control and preview infrastructure
+#
+#   python simulate.py --instances 200 --seconds 60 --modes cls,neo,spin,larson,solunar \
+#                      [--workers 4] [--preview-port 9000]
+#
+# every instance is a paris.Map with its own buffers, output, timers, clock, location and mode.
+# the caches of solunar, frame and fast are shared by the instances of a process, see paris.Map.
+# the timers of all instances of a process are driven by one asyncio event loop, --workers spreads
+# the instances over that many processes. with --preview-port instance i serves its live preview
+# on port + i. at the end the timer fires, late fires and strip writes of all instances are reported.
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+
+import timing
+from hal import utime
+
+modes = ('solunar', 'cls', 'neo', 'spin', 'larson')
+
+
+class VirtualClock(timing.SoftClock):
+    """
+    Clock running offset_s ahead of the host clock, synced without network.
+    """
+
+    def __init__(self, offset_s=0.):
+        super().__init__()
+        self.offset_s = offset_s
+        self.sync()
+
+    def sync(self):
+        now = time.time() + self.offset_s
+        self.set(int(now), int(now * 1000) % 1000, utime.ticks_ms())
+        self.next_sync = utime.ticks_add(utime.ticks_ms(), self.interval_ms)
+        return True
+
+    def start_sync(self):
+        self.sync()
+
+
+class CountingDriver:
+    """
+    Strip driver counting the writes of one instance instead of sending them.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def __call__(self, pin, buffer):
+        self.writes += 1
+        self.bytes += len(buffer)
+
+
+class Stats:
+    def __init__(self):
+        self.fires = 0
+        self.late = 0  # fires more than one period behind schedule
+        self.max_lag = 0.  # seconds
+
+
+def start_mode(m, mode, rng):
+    if mode == 'solunar':
+        m.run_solunar()
+    elif mode == 'cls':
+        m.run_cls_clock(continuous=True)
+    elif mode == 'neo':
+        m.run_neo_clock(two_colors=True)
+    elif mode == 'spin':
+        m.run_spin((0, 0, 0, 200), rng.uniform(0.1, 0.5))
+    else:
+        m.run_larson_scanner(rng.choice(('north', 'east', 'south', 'west')), (255, 0, 0, 0), (0, 0, 0, 4))
+
+
+async def drive(timer, stats, phase):
+    """
+    Fire a hal.Timer at its period for as long as it has a callback.
+    A one-shot timer fires once after its period and then waits to be initialized again.
+    """
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(phase)
+    due = loop.time()
+    while True:
+        if timer.callback is None:
+            await asyncio.sleep(0.1)
+            due = loop.time()
+            continue
+        period = timer.period / 1000.
+        due += period
+        delay = due - loop.time()
+        if delay > 0.:
+            await asyncio.sleep(delay)
+        else:
+            stats.max_lag = max(stats.max_lag, -delay)
+            if -delay > period:
+                stats.late += 1
+                due = loop.time()  # no burst of fires to catch up
+            await asyncio.sleep(0)
+        timer.fire()
+        stats.fires += 1
+
+
+async def simulate(first, count, args):
+    import paris
+
+    rng = random.Random(first)
+    maps, drivers, stats, tasks = [], [], Stats(), []
+    for i in range(first, first + count):
+        driver = CountingDriver()
+        lat, long = rng.uniform(-60., 60.), rng.uniform(-180., 180.)
+        m = paris.Map(coords=(lat, long), utc_offset=int(round(long / 15.)),
+                      time=VirtualClock(rng.uniform(0., 86400.)), driver=driver, almanac_path=None)
+        start_mode(m, args.modes[i % len(args.modes)], rng)
+        if args.preview_port:
+            m.start_preview(args.preview_port + i, args.preview_fps)
+        for timer in m.timers():
+            tasks.append(asyncio.ensure_future(drive(timer, stats, rng.uniform(0., 0.1))))
+        maps.append(m)
+        drivers.append(driver)
+
+    await asyncio.sleep(args.seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for m in maps:
+        m.stop_timer()
+        if m.preview is not None:
+            m.preview.close()
+    return (count, stats.fires, stats.late, stats.max_lag,
+            sum(d.writes for d in drivers), sum(d.bytes for d in drivers))
+
+
+def worker(job):
+    first, count, args = job
+    return asyncio.run(simulate(first, count, args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run many virtual maps for load testing')
+    parser.add_argument('--instances', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=30.)
+    parser.add_argument('--modes', type=lambda s: s.split(','), default=list(modes),
+                        help='comma separated, assigned round robin, any of ' + ', '.join(modes))
+    parser.add_argument('--workers', type=int, default=1, help='processes the instances are spread over')
+    parser.add_argument('--preview-port', type=int, default=0, help='first preview port, 0 for no previews')
+    parser.add_argument('--preview-fps', type=int, default=5)
+    args = parser.parse_args(argv)
+    for mode in args.modes:
+        if mode not in modes:
+            parser.error('unknown mode ' + mode)
+
+    workers = max(1, min(args.workers, args.instances))
+    jobs = []
+    for w in range(workers):
+        first = args.instances * w // workers
+        jobs.append((first, args.instances * (w + 1) // workers - first, args))
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        results = [worker(jobs[0])]
+    else:
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            results = pool.map(worker, jobs)
+    dt = time.perf_counter() - t0
+
+    instances = sum(r[0] for r in results)
+    fires = sum(r[1] for r in results)
+    late = sum(r[2] for r in results)
+    max_lag = max(r[3] for r in results)
+    writes = sum(r[4] for r in results)
+    written = sum(r[5] for r in results)
+    print('{} instances on {} process{} for {:.1f} s'.format(instances, workers, 'es' if workers > 1 else '', dt))
+    print('timer fires  {:9d} ({:.0f}/s), late {} ({:.1%}), max lag {:.0f} ms'.format(
+        fires, fires / dt, late, late / max(fires, 1), max_lag * 1000.))
+    print('strip writes {:9d} ({:.0f}/s, {:.0f} kB/s)'.format(writes, writes / dt, written / dt / 1000.))
+    return results
+
+
+if __name__ == '__main__':
+    main()
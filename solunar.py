@@ -3,71 +3,179 @@
 # - Jean Meeus, Astronomical Algorithms, Second Edition, 1998
 
 import math
-from common import wrap_to_pi, wrap_to_0_2pi
+import struct
+from common import LRU, wrap_to_pi, wrap_to_0_2pi
 
 epsilon = math.radians(23.4393)  # obliquity of the ecliptic (tilt of the earth's axis of rotation)
 
-table_27c = [[485, 324.96, 1934.136],
-             [203, 337.23, 32964.467],
-             [199, 342.08, 20.186],
-             [182, 27.85, 445267.112],
-             [156, 73.14, 45036.886],
-             [136, 171.52, 22518.443],
-             [77, 222.54, 65928.934],
-             [74, 296.72, 3034.906],
-             [70, 243.58, 9037.513],
-             [58, 119.81, 33718.147],
-             [52, 297.17, 150.678],
-             [50, 21.02, 2281.226],
-             [45, 247.54, 29929.562],
-             [44, 325.15, 31555.956],
-             [29, 60.93, 4443.417],
-             [18, 155.12, 67555.328],
-             [17, 288.79, 4562.452],
-             [16, 198.04, 62894.029],
-             [14, 199.76, 31436.921],
-             [12, 95.39, 14577.848],
-             [12, 287.11, 31931.756],
-             [12, 320.81, 34777.259],
-             [9, 227.73, 1222.114],
-             [8, 15.45, 16859.074]]
-
-
-equinox_solstices = [[2451623.80984, 365242.37404,  0.05169, -0.00411, -0.00057],  # Mar equinox  (beginning of astronomical spring)
-                     [2451716.56767, 365241.62603,  0.00325, 0.00888, -0.00030],   # Jun solstice (beginning of astronomical summer)
-                     [2451810.21715, 365242.01767, -0.11575, 0.00337, 0.00078],    # Sep equinox  (beginning of astronomical autumn)
-                     [2451900.05952, 365242.74049, -0.06223, -0.00823, 0.00032]]   # Dec solstice (beginning of astronomical winter)
+# tables are packed into bytes so they stay a single compact object
+# (and in flash when frozen into the firmware) instead of lists of floats
+
+# periodic terms for the equinoxes and solstices (Meeus, table 27.C),
+# rows of '<HHI': A, B in 1/100 deg, C in 1/1000 deg
+#   485 324.96 1934.136    203 337.23 32964.467   199 342.08 20.186      182 27.85 445267.112
+#   156 73.14 45036.886    136 171.52 22518.443   77 222.54 65928.934    74 296.72 3034.906
+#   70 243.58 9037.513     58 119.81 33718.147    52 297.17 150.678      50 21.02 2281.226
+#   45 247.54 29929.562    44 325.15 31555.956    29 60.93 4443.417      18 155.12 67555.328
+#   17 288.79 4562.452     16 198.04 62894.029    14 199.76 31436.921    12 95.39 14577.848
+#   12 287.11 31931.756    12 320.81 34777.259    9 227.73 1222.114      8 15.45 16859.074
+table_27c = (b'\xe5\x01\xf0\x7e\x38\x83\x1d\x00\xcb\x00\xbb\x83\x73\xff\xf6\x01'
+             b'\xc7\x00\xa0\x85\xda\x4e\x00\x00\xb6\x00\xe1\x0a\xa8\x3c\x8a\x1a'
+             b'\x9c\x00\x92\x1c\x56\x35\xaf\x02\x88\x00\x00\x43\xab\x9a\x57\x01'
+             b'\x4d\x00\xee\x56\xe6\xfe\xed\x03\x4a\x00\xe8\x73\x1a\x4f\x2e\x00'
+             b'\x46\x00\x26\x5f\xc9\xe6\x89\x00\x3a\x00\xcd\x2e\x83\x7f\x02\x02'
+             b'\x34\x00\x15\x74\x96\x4c\x02\x00\x32\x00\x36\x08\x0a\xcf\x22\x00'
+             b'\x2d\x00\xb2\x60\x5a\xb0\xc8\x01\x2c\x00\x03\x7f\x74\x81\xe1\x01'
+             b'\x1d\x00\xcd\x17\x19\xcd\x43\x00\x12\x00\x98\x3c\x00\xd0\x06\x04'
+             b'\x11\x00\xcf\x70\x14\x9e\x45\x00\x10\x00\x5c\x4d\xcd\xaf\xbf\x03'
+             b'\x0e\x00\x08\x4e\x79\xb0\xdf\x01\x0c\x00\x43\x25\xb8\x70\xde\x00'
+             b'\x0c\x00\x27\x70\x6c\x3d\xe7\x01\x0c\x00\x51\x7d\xab\xa8\x12\x02'
+             b'\x09\x00\xf5\x58\xe2\xa5\x12\x00\x08\x00\x09\x06\xc2\x3f\x01\x01')
+
+# mean equinoxes and solstices for the years 2000 to 3000 (Meeus, table 27.B),
+# rows of '<5f': JDE0 = a + b*Y + c*Y^2 + d*Y^3 + e*Y^4 with a in days since J2000 (a - 2451545)
+#   Mar equinox   (beginning of astronomical spring)  78.80984 365242.37404  0.05169 -0.00411 -0.00057
+#   Jun solstice  (beginning of astronomical summer) 171.56767 365241.62603  0.00325  0.00888 -0.00030
+#   Sep equinox   (beginning of astronomical autumn) 265.21715 365242.01767 -0.11575  0.00337  0.00078
+#   Dec solstice  (beginning of astronomical winter) 355.05952 365242.74049 -0.06223 -0.00823  0.00032
+equinox_solstices = (b'\xa3\x9e\x9d\x42\x4c\x57\xb2\x48\xe5\xb8\x53\x3d\x2e\xad\x86\xbb\x0d\x6c\x15\xba'
+                     b'\x53\x91\x2b\x43\x34\x57\xb2\x48\xf4\xfd\x54\x3b\x6b\x7d\x11\x3c\x52\x49\x9d\xb9'
+                     b'\xcc\x9b\x84\x43\x41\x57\xb2\x48\x56\x0e\xed\xbd\x38\xdb\x5c\x3b\xea\x78\x4c\x3a'
+                     b'\x9e\x87\xb1\x43\x58\x57\xb2\x48\xe2\xe4\x7e\xbd\x1f\xd7\x06\xbc\xac\xc5\xa7\x39')
+
+# periodic terms for the longitude and distance of the moon (Meeus, table 47.A),
+# rows of '<bbbbii': multiples of D, M, M', F, sum l in 1e-6 deg, sum r in 1e-3 km
+#   0 0 1 0 6288774 -20905355   2 0 -1 0 1274027 -3699111   2 0 0 0 658314 -2955968   0 0 2 0 213618 -569925
+#   0 1 0 0 -185116 48888   0 0 0 2 -114332 -3149   2 0 -2 0 58793 246158   2 -1 -1 0 57066 -152138
+#   2 0 1 0 53322 -170733   2 -1 0 0 45758 -204586   0 1 -1 0 -40923 -129620   1 0 0 0 -34720 108743
+#   0 1 1 0 -30383 104755   2 0 0 -2 15327 10321   0 0 1 2 -12528 0   0 0 1 -2 10980 79661
+#   4 0 -1 0 10675 -34782   0 0 3 0 10034 -23210   4 0 -2 0 8548 -21636   2 1 -1 0 -7888 24208
+#   2 1 0 0 -6766 30824   1 0 -1 0 -5163 -8379   1 1 0 0 4987 -16675   2 -1 1 0 4036 -12831
+#   2 0 2 0 3994 -10445   4 0 0 0 3861 -11650   2 0 -3 0 3665 14403   0 1 -2 0 -2689 -7003
+#   2 0 -1 2 -2602 0   2 -1 -2 0 2390 10056   1 0 1 0 -2348 6322   2 -2 0 0 2236 -9884
+#   0 1 2 0 -2120 5751   0 2 0 0 -2069 0   2 -2 -1 0 2048 -4950   2 0 1 -2 -1773 4130
+#   2 0 0 2 -1595 0   4 -1 -1 0 1215 -3958   0 0 2 2 -1110 0   3 0 -1 0 -892 3258
+#   2 1 1 0 -810 2616   4 -1 -2 0 759 -1897   0 2 -1 0 -713 -2117   2 2 -1 0 -700 2354
+#   2 1 -2 0 691 0   2 -1 0 -2 596 0   4 0 1 0 549 -1423   0 0 4 0 537 -1117
+#   4 -1 0 0 520 -1571   1 0 -2 0 -487 -1739   2 1 0 -2 -399 0   0 0 2 -2 -381 -4421
+#   1 1 1 0 351 0   3 0 -2 0 -340 0   4 0 -3 0 330 0   2 -1 2 0 327 0
+#   0 2 1 0 -323 1165   1 1 -1 0 299 0   2 0 3 0 294 0   2 0 -1 -2 0 8752
+table_47a = (b'\x00\x00\x01\x00\x86\xf5\x5f\x00\x75\x02\xc1\xfe\x02\x00\xff\x00\xab\x70\x13\x00\x59\x8e\xc7\xff'
+             b'\x02\x00\x00\x00\x8a\x0b\x0a\x00\x40\xe5\xd2\xff\x00\x00\x02\x00\x72\x42\x03\x00\xbb\x4d\xf7\xff'
+             b'\x00\x01\x00\x00\xe4\x2c\xfd\xff\xf8\xbe\x00\x00\x00\x00\x00\x02\x64\x41\xfe\xff\xb3\xf3\xff\xff'
+             b'\x02\x00\xfe\x00\xa9\xe5\x00\x00\x8e\xc1\x03\x00\x02\xff\xff\x00\xea\xde\x00\x00\xb6\xad\xfd\xff'
+             b'\x02\x00\x01\x00\x4a\xd0\x00\x00\x13\x65\xfd\xff\x02\xff\x00\x00\xbe\xb2\x00\x00\xd6\xe0\xfc\xff'
+             b'\x00\x01\xff\x00\x25\x60\xff\xff\xac\x05\xfe\xff\x01\x00\x00\x00\x60\x78\xff\xff\xc7\xa8\x01\x00'
+             b'\x00\x01\x01\x00\x51\x89\xff\xff\x33\x99\x01\x00\x02\x00\x00\xfe\xdf\x3b\x00\x00\x51\x28\x00\x00'
+             b'\x00\x00\x01\x02\x10\xcf\xff\xff\x00\x00\x00\x00\x00\x00\x01\xfe\xe4\x2a\x00\x00\x2d\x37\x01\x00'
+             b'\x04\x00\xff\x00\xb3\x29\x00\x00\x22\x78\xff\xff\x00\x00\x03\x00\x32\x27\x00\x00\x56\xa5\xff\xff'
+             b'\x04\x00\xfe\x00\x64\x21\x00\x00\x7c\xab\xff\xff\x02\x01\xff\x00\x30\xe1\xff\xff\x90\x5e\x00\x00'
+             b'\x02\x01\x00\x00\x92\xe5\xff\xff\x68\x78\x00\x00\x01\x00\xff\x00\xd5\xeb\xff\xff\x45\xdf\xff\xff'
+             b'\x01\x01\x00\x00\x7b\x13\x00\x00\xdd\xbe\xff\xff\x02\xff\x01\x00\xc4\x0f\x00\x00\xe1\xcd\xff\xff'
+             b'\x02\x00\x02\x00\x9a\x0f\x00\x00\x33\xd7\xff\xff\x04\x00\x00\x00\x15\x0f\x00\x00\x7e\xd2\xff\xff'
+             b'\x02\x00\xfd\x00\x51\x0e\x00\x00\x43\x38\x00\x00\x00\x01\xfe\x00\x7f\xf5\xff\xff\xa5\xe4\xff\xff'
+             b'\x02\x00\xff\x02\xd6\xf5\xff\xff\x00\x00\x00\x00\x02\xff\xfe\x00\x56\x09\x00\x00\x48\x27\x00\x00'
+             b'\x01\x00\x01\x00\xd4\xf6\xff\xff\xb2\x18\x00\x00\x02\xfe\x00\x00\xbc\x08\x00\x00\x64\xd9\xff\xff'
+             b'\x00\x01\x02\x00\xb8\xf7\xff\xff\x77\x16\x00\x00\x00\x02\x00\x00\xeb\xf7\xff\xff\x00\x00\x00\x00'
+             b'\x02\xfe\xff\x00\x00\x08\x00\x00\xaa\xec\xff\xff\x02\x00\x01\xfe\x13\xf9\xff\xff\x22\x10\x00\x00'
+             b'\x02\x00\x00\x02\xc5\xf9\xff\xff\x00\x00\x00\x00\x04\xff\xff\x00\xbf\x04\x00\x00\x8a\xf0\xff\xff'
+             b'\x00\x00\x02\x02\xaa\xfb\xff\xff\x00\x00\x00\x00\x03\x00\xff\x00\x84\xfc\xff\xff\xba\x0c\x00\x00'
+             b'\x02\x01\x01\x00\xd6\xfc\xff\xff\x38\x0a\x00\x00\x04\xff\xfe\x00\xf7\x02\x00\x00\x97\xf8\xff\xff'
+             b'\x00\x02\xff\x00\x37\xfd\xff\xff\xbb\xf7\xff\xff\x02\x02\xff\x00\x44\xfd\xff\xff\x32\x09\x00\x00'
+             b'\x02\x01\xfe\x00\xb3\x02\x00\x00\x00\x00\x00\x00\x02\xff\x00\xfe\x54\x02\x00\x00\x00\x00\x00\x00'
+             b'\x04\x00\x01\x00\x25\x02\x00\x00\x71\xfa\xff\xff\x00\x00\x04\x00\x19\x02\x00\x00\xa3\xfb\xff\xff'
+             b'\x04\xff\x00\x00\x08\x02\x00\x00\xdd\xf9\xff\xff\x01\x00\xfe\x00\x19\xfe\xff\xff\x35\xf9\xff\xff'
+             b'\x02\x01\x00\xfe\x71\xfe\xff\xff\x00\x00\x00\x00\x00\x00\x02\xfe\x83\xfe\xff\xff\xbb\xee\xff\xff'
+             b'\x01\x01\x01\x00\x5f\x01\x00\x00\x00\x00\x00\x00\x03\x00\xfe\x00\xac\xfe\xff\xff\x00\x00\x00\x00'
+             b'\x04\x00\xfd\x00\x4a\x01\x00\x00\x00\x00\x00\x00\x02\xff\x02\x00\x47\x01\x00\x00\x00\x00\x00\x00'
+             b'\x00\x02\x01\x00\xbd\xfe\xff\xff\x8d\x04\x00\x00\x01\x01\xff\x00\x2b\x01\x00\x00\x00\x00\x00\x00'
+             b'\x02\x00\x03\x00\x26\x01\x00\x00\x00\x00\x00\x00\x02\x00\xff\xfe\x00\x00\x00\x00\x30\x22\x00\x00')
+
+# periodic terms for the latitude of the moon (Meeus, table 47.B),
+# rows of '<bbbbi': multiples of D, M, M', F, sum b in 1e-6 deg
+#   0 0 0 1 5128122   0 0 1 1 280602   0 0 1 -1 277693   2 0 0 -1 173237   2 0 -1 1 55413
+#   2 0 -1 -1 46271   2 0 0 1 32573   0 0 2 1 17198   2 0 1 -1 9266   0 0 2 -1 8822
+#   2 -1 0 -1 8216   2 0 -2 -1 4324   2 0 1 1 4200   2 1 0 -1 -3359   2 -1 -1 1 2463
+#   2 -1 0 1 2211   2 -1 -1 -1 2065   0 1 -1 -1 -1870   4 0 -1 -1 1828   0 1 0 1 -1794
+#   0 0 0 3 -1749   0 1 -1 1 -1565   1 0 0 1 -1491   0 1 1 1 -1475   0 1 1 -1 -1410
+#   0 1 0 -1 -1344   1 0 0 -1 -1335   0 0 3 1 1107   4 0 0 -1 1021   4 0 -1 1 833
+#   0 0 1 -3 777   4 0 -2 1 671   2 0 0 -3 607   2 0 2 -1 596   2 -1 1 -1 491
+#   2 0 -2 1 -451   0 0 3 -1 439   2 0 2 1 422   2 0 -3 -1 421   2 1 -1 1 -366
+#   2 1 0 1 -351   4 0 0 1 331   2 -1 1 1 315   2 -2 0 -1 302   0 0 1 3 -283
+#   2 1 1 -1 -229   1 1 0 -1 223   1 1 0 1 223   0 1 -2 -1 -220   2 1 -1 -1 -220
+#   1 0 1 1 -185   2 -1 -2 -1 181   0 1 2 1 -177   4 0 -2 -1 176   4 -1 -1 -1 166
+#   1 0 1 -1 -164   4 0 1 -1 132   1 0 -1 -1 -119   4 -1 0 -1 115   2 -2 0 1 107
+table_47b = (b'\x00\x00\x00\x01\xba\x3f\x4e\x00\x00\x00\x01\x01\x1a\x48\x04\x00\x00\x00\x01\xff\xbd\x3c\x04\x00'
+             b'\x02\x00\x00\xff\xb5\xa4\x02\x00\x02\x00\xff\x01\x75\xd8\x00\x00\x02\x00\xff\xff\xbf\xb4\x00\x00'
+             b'\x02\x00\x00\x01\x3d\x7f\x00\x00\x00\x00\x02\x01\x2e\x43\x00\x00\x02\x00\x01\xff\x32\x24\x00\x00'
+             b'\x00\x00\x02\xff\x76\x22\x00\x00\x02\xff\x00\xff\x18\x20\x00\x00\x02\x00\xfe\xff\xe4\x10\x00\x00'
+             b'\x02\x00\x01\x01\x68\x10\x00\x00\x02\x01\x00\xff\xe1\xf2\xff\xff\x02\xff\xff\x01\x9f\x09\x00\x00'
+             b'\x02\xff\x00\x01\xa3\x08\x00\x00\x02\xff\xff\xff\x11\x08\x00\x00\x00\x01\xff\xff\xb2\xf8\xff\xff'
+             b'\x04\x00\xff\xff\x24\x07\x00\x00\x00\x01\x00\x01\xfe\xf8\xff\xff\x00\x00\x00\x03\x2b\xf9\xff\xff'
+             b'\x00\x01\xff\x01\xe3\xf9\xff\xff\x01\x00\x00\x01\x2d\xfa\xff\xff\x00\x01\x01\x01\x3d\xfa\xff\xff'
+             b'\x00\x01\x01\xff\x7e\xfa\xff\xff\x00\x01\x00\xff\xc0\xfa\xff\xff\x01\x00\x00\xff\xc9\xfa\xff\xff'
+             b'\x00\x00\x03\x01\x53\x04\x00\x00\x04\x00\x00\xff\xfd\x03\x00\x00\x04\x00\xff\x01\x41\x03\x00\x00'
+             b'\x00\x00\x01\xfd\x09\x03\x00\x00\x04\x00\xfe\x01\x9f\x02\x00\x00\x02\x00\x00\xfd\x5f\x02\x00\x00'
+             b'\x02\x00\x02\xff\x54\x02\x00\x00\x02\xff\x01\xff\xeb\x01\x00\x00\x02\x00\xfe\x01\x3d\xfe\xff\xff'
+             b'\x00\x00\x03\xff\xb7\x01\x00\x00\x02\x00\x02\x01\xa6\x01\x00\x00\x02\x00\xfd\xff\xa5\x01\x00\x00'
+             b'\x02\x01\xff\x01\x92\xfe\xff\xff\x02\x01\x00\x01\xa1\xfe\xff\xff\x04\x00\x00\x01\x4b\x01\x00\x00'
+             b'\x02\xff\x01\x01\x3b\x01\x00\x00\x02\xfe\x00\xff\x2e\x01\x00\x00\x00\x00\x01\x03\xe5\xfe\xff\xff'
+             b'\x02\x01\x01\xff\x1b\xff\xff\xff\x01\x01\x00\xff\xdf\x00\x00\x00\x01\x01\x00\x01\xdf\x00\x00\x00'
+             b'\x00\x01\xfe\xff\x24\xff\xff\xff\x02\x01\xff\xff\x24\xff\xff\xff\x01\x00\x01\x01\x47\xff\xff\xff'
+             b'\x02\xff\xfe\xff\xb5\x00\x00\x00\x00\x01\x02\x01\x4f\xff\xff\xff\x04\x00\xfe\xff\xb0\x00\x00\x00'
+             b'\x04\xff\xff\xff\xa6\x00\x00\x00\x01\x00\x01\xff\x5c\xff\xff\xff\x04\x00\x01\xff\x84\x00\x00\x00'
+             b'\x01\x00\xff\xff\x89\xff\xff\xff\x04\xff\x00\xff\x73\x00\x00\x00\x02\xfe\x00\x01\x6b\x00\x00\x00')
+
+# precision tiers of the solar and lunar models, from cheapest to most accurate
+#   0 fast:   mean element formulas from aa.quae.nl
+#   1 medium: Meeus low accuracy sun, leading terms of the Meeus lunar series and lunar parallax
+#   2 full:   all terms of Meeus tables 47.A/B, nutation, aberration and apparent sidereal time
+tiers = ('fast', 'medium', 'full')
+precision = 0
+
+# number of lunar longitude and latitude terms per tier
+lunar_terms = ((0, 0), (14, 10), (60, 60))
 
 
 def is_equinox_or_solstice(date_time):
     year, month, day, hour, minute, second, weekday, yearday = date_time
     julian_day_number = calc_julian_date(year, month, day, hour, minute, second)
 
+    for i, n in enumerate(calc_equinoxes_solstices(year)):
+        if math.floor(n) == math.floor(julian_day_number):
+            return i
+
+    return -1
+
+
+def calc_equinoxes_solstices(year):
+    """
+    March equinox, june solstice, september equinox and december solstice of a year in days since J2000.
+    """
     Y = (year-2000)/1000
     Y2 = Y*Y
     Y3 = Y*Y2
     Y4 = Y*Y3
 
-    for i, (a, b, c, d, e) in enumerate(equinox_solstices):
+    events = []
+    for i in range(4):
+        a, b, c, d, e = struct.unpack_from('<5f', equinox_solstices, 20 * i)
         JDE0 = a+b*Y+c*Y2+d*Y3+e*Y4
-        JDE = calc_equinox_solstice(JDE0)
-        n = JDE - 2451545.
-        if math.floor(n) == math.floor(julian_day_number):
-            return i
-
-    return -1
+        events.append(calc_equinox_solstice(JDE0))
+    return events
 
 
 def calc_equinox_solstice(JDE0):
-    T = (JDE0-2451545.0)/36525.0
+    # JDE0 and the result are in days since J2000 to keep the precision on single precision floats
+    T = JDE0/36525.0
     W = 35999.373 * T - 2.47
     W_rad = math.radians(W)
     delta_lambda = 1 + 0.00334 * math.cos(W_rad) + 0.0007 * math.cos(2*W_rad)
 
     S = 0.
-    for row in table_27c:
-        A, B, C = row
-        S += A * math.cos(math.radians(B + C * T))
+    for k in range(0, len(table_27c), 8):
+        A, B, C = struct.unpack_from('<HHI', table_27c, k)
+        S += A * math.cos(math.radians(B / 100. + C / 1000. * T))
 
     JDE = JDE0 + (0.00001*S)/delta_lambda
 
@@ -111,22 +219,23 @@ def get_sidereal_time(d, long):
 
 
 def calc_azim_elev(lat, ha, delta):
+    return azim_elev(math.sin(lat), math.cos(lat), ha, delta)
+
+
+def azim_elev(sin_lat, cos_lat, ha, delta):
     # finally calculate azimuth and elevation
-    azim = math.atan2(math.sin(ha), math.cos(ha) * math.sin(lat) - math.tan(delta) * math.cos(lat))
-    elev = math.asin(math.cos(delta) * math.cos(ha) * math.cos(lat) + math.sin(delta) * math.sin(lat))
+    cos_ha = math.cos(ha)
+    azim = math.atan2(math.sin(ha), cos_ha * sin_lat - math.tan(delta) * cos_lat)
+    elev = math.asin(math.cos(delta) * cos_ha * cos_lat + math.sin(delta) * sin_lat)
     # move to north clockwise convention
     azim = wrap_to_pi(azim + math.pi)
     return azim, elev
 
 
-def calc_lunar_position(coords, date_time):
-    # convert coords to radians
-    rlat, rlong = math.radians(coords[0]), math.radians(coords[1])
-    # unpack date time
-    year, month, day, hour, minute, second, weekday, yearday = date_time
-    # julian date, number of days since Jan 1st 2000, 12 UTC, julian centuries since 2000
-    d = calc_julian_date(year, month, day, hour, minute, second)
-
+def calc_lunar_equatorial(d):
+    """
+    Right ascension and declination of the moon in radians, d in days since J2000.
+    """
     # geocentric ecliptic longitude
     L = math.radians(218.316) + math.radians(13.176396) * d
     L = wrap_to_0_2pi(L)
@@ -154,28 +263,14 @@ def calc_lunar_position(coords, date_time):
 
     # declination
     delta = math.asin(math.sin(beta) * math.cos(epsilon) + math.cos(beta) * math.sin(epsilon) * math.sin(lmda))
-    delta = wrap_to_0_2pi(delta)
 
-    # Greenwich hour angle at vernal equinox plus local offset
-    theta = get_sidereal_time(d, rlong)
-    # subtract right ascension of the moon to get hour angle
-    tau = theta - alpha
-    tau = wrap_to_0_2pi(tau)
-
-    # finally calculate azimuth and elevation
-    azim, elev = calc_azim_elev(rlat, tau, delta)
-
-    return azim, elev
+    return alpha, delta
 
 
-def calc_solar_position(coords, date_time):
-    # convert coords to radians
-    rlat, rlong = math.radians(coords[0]), math.radians(coords[1])
-    # unpack date time
-    year, month, day, hour, minute, second, weekday, yearday = date_time
-    # julian date, number of days since Jan 1st 2000, 12 UTC, julian centuries since 2000
-    d = calc_julian_date(year, month, day, hour, minute, second)
-
+def calc_solar_equatorial(d):
+    """
+    Right ascension and declination of the sun in radians, d in days since J2000.
+    """
     # mean ecliptical length
     L = math.radians(280.460) + math.radians(0.9856474) * d
     L = wrap_to_0_2pi(L)
@@ -198,15 +293,679 @@ def calc_solar_position(coords, date_time):
 
     # declination
     delta = math.asin(math.sin(i) * math.sin(A))
-    delta = wrap_to_0_2pi(delta)
+
+    return alpha, delta
+
+
+def calc_obliquity(T):
+    # mean obliquity of the ecliptic in degrees, T in julian centuries since J2000 (Meeus, 22.2)
+    return 23.4392911 - 0.0130042 * T - 1.64e-7 * T * T + 5.04e-7 * T * T * T
+
+
+def calc_nutation(T):
+    # nutation in longitude and obliquity in degrees (Meeus, chapter 22, 0.5" accuracy)
+    omega = math.radians(125.04452 - 1934.136261 * T)
+    L = math.radians(280.4665 + 36000.7698 * T)
+    Lm = math.radians(218.3165 + 481267.8813 * T)
+    dpsi = -17.20 * math.sin(omega) - 1.32 * math.sin(2. * L) - 0.23 * math.sin(2. * Lm) + 0.21 * math.sin(2. * omega)
+    deps = 9.20 * math.cos(omega) + 0.57 * math.cos(2. * L) + 0.10 * math.cos(2. * Lm) - 0.09 * math.cos(2. * omega)
+    return dpsi / 3600., deps / 3600.
+
+
+def ecliptic2equatorial(lmda, beta, eps):
+    # all in radians
+    alpha = math.atan2(math.sin(lmda) * math.cos(eps) - math.tan(beta) * math.sin(eps), math.cos(lmda))
+    delta = math.asin(math.sin(beta) * math.cos(eps) + math.cos(beta) * math.sin(eps) * math.sin(lmda))
+    return wrap_to_0_2pi(alpha), delta
+
+
+def calc_lunar_arguments(T):
+    # mean elongation, solar anomaly, lunar anomaly and argument of latitude in radians (Meeus, 47.2-47.5)
+    T2 = T * T
+    D = math.radians((297.8501921 + 445267.1114034 * T - 0.0018819 * T2) % 360.)
+    M = math.radians((357.5291092 + 35999.0502909 * T - 0.0001536 * T2) % 360.)
+    Mp = math.radians((134.9633964 + 477198.8675055 * T + 0.0087414 * T2) % 360.)
+    F = math.radians((93.2720950 + 483202.0175233 * T - 0.0036539 * T2) % 360.)
+    return D, M, Mp, F
+
+
+def calc_lunar_equatorial_meeus(d, tier):
+    """
+    Right ascension and declination of the moon from the Meeus series (chapter 47) truncated for the given tier.
+    """
+    T = d / 36525.
+    Lp = (218.3164477 + 481267.88123421 * T - 0.0015786 * T * T) % 360.
+    D, M, Mp, F = calc_lunar_arguments(T)
+    E = 1. - 0.002516 * T - 0.0000074 * T * T  # decreasing eccentricity of the earth's orbit
+
+    n_l, n_b = lunar_terms[tier]
+    sl = 0.
+    for k in range(n_l):
+        cD, cM, cMp, cF, l, r = struct.unpack_from('<bbbbii', table_47a, 12 * k)
+        sl += l * E ** abs(cM) * math.sin(cD * D + cM * M + cMp * Mp + cF * F)
+    sb = 0.
+    for k in range(n_b):
+        cD, cM, cMp, cF, b = struct.unpack_from('<bbbbi', table_47b, 8 * k)
+        sb += b * E ** abs(cM) * math.sin(cD * D + cM * M + cMp * Mp + cF * F)
+
+    eps = calc_obliquity(T)
+    if tier >= 2:
+        # venus, jupiter and the flattening of the earth
+        A1 = math.radians(119.75 + 131.849 * T)
+        A2 = math.radians(53.09 + 479264.290 * T)
+        A3 = math.radians(313.45 + 481266.484 * T)
+        rLp = math.radians(Lp)
+        sl += 3958. * math.sin(A1) + 1962. * math.sin(rLp - F) + 318. * math.sin(A2)
+        sb += (-2235. * math.sin(rLp) + 382. * math.sin(A3) + 175. * math.sin(A1 - F) + 175. * math.sin(A1 + F)
+               + 127. * math.sin(rLp - Mp) - 115. * math.sin(rLp + Mp))
+        dpsi, deps = calc_nutation(T)
+        Lp += dpsi
+        eps += deps
+
+    return ecliptic2equatorial(math.radians(Lp + sl / 1e6), math.radians(sb / 1e6), math.radians(eps))
+
+
+def calc_lunar_distance(d):
+    # distance in km from the leading terms of table 47.A
+    D, M, Mp, F = calc_lunar_arguments(d / 36525.)
+    return 385000.56 - 20905.355 * math.cos(Mp) - 3699.111 * math.cos(2. * D - Mp) - 2955.968 * math.cos(2. * D)
+
+
+def calc_solar_equatorial_meeus(d, tier):
+    """
+    Right ascension and declination of the sun (Meeus, chapter 25, low accuracy).
+    """
+    T = d / 36525.
+    L0 = 280.46646 + 36000.76983 * T + 0.0003032 * T * T
+    M = math.radians((357.52911 + 35999.05029 * T - 0.0001537 * T * T) % 360.)
+    # equation of the center
+    C = ((1.914602 - 0.004817 * T - 0.000014 * T * T) * math.sin(M) + (0.019993 - 0.000101 * T) * math.sin(2. * M)
+         + 0.000289 * math.sin(3. * M))
+    lmda = (L0 + C) % 360.
+    eps = calc_obliquity(T)
+    if tier >= 2:
+        dpsi, deps = calc_nutation(T)
+        lmda += dpsi - 0.00569  # nutation and aberration
+        eps += deps
+    return ecliptic2equatorial(math.radians(lmda), 0., math.radians(eps))
+
+
+def get_sidereal_time_meeus(d, long, tier):
+    # mean sidereal time (Meeus, 12.4), apparent for the full tier
+    T = d / 36525.
+    theta0 = (280.46061837 + 360.98564736629 * d + 0.000387933 * T * T) % 360.
+    if tier >= 2:
+        dpsi, deps = calc_nutation(T)
+        theta0 += dpsi * math.cos(math.radians(calc_obliquity(T) + deps))
+    return wrap_to_0_2pi(math.radians(theta0) + long)
+
+
+def lunar_equatorial(d):
+    return calc_lunar_equatorial(d) if precision == 0 else calc_lunar_equatorial_meeus(d, precision)
+
+
+def solar_equatorial(d):
+    return calc_solar_equatorial(d) if precision == 0 else calc_solar_equatorial_meeus(d, precision)
+
+
+def local_sidereal_time(d, rlong):
+    return get_sidereal_time(d, rlong) if precision == 0 else get_sidereal_time_meeus(d, rlong, precision)
+
+
+def calc_horizontal(coords, d, alpha, delta):
+    """
+    Azimuth (north clockwise) and elevation in radians of a body at right ascension alpha and declination delta.
+    """
+    # convert coords to radians
+    rlat, rlong = math.radians(coords[0]), math.radians(coords[1])
 
     # Greenwich hour angle at vernal equinox plus local offset
-    theta = get_sidereal_time(d, rlong)
-    # subtract right ascension of the sun to get hour angle
+    theta = local_sidereal_time(d, rlong)
+    # subtract right ascension of the body to get hour angle
     tau = theta - alpha
     tau = wrap_to_0_2pi(tau)
 
     # finally calculate azimuth and elevation
-    azim, elev = calc_azim_elev(rlat, tau, delta)
+    return calc_azim_elev(rlat, tau, delta)
+
+
+def chebyshev_fit(f, a, b, order):
+    """
+    Coefficients of the Chebyshev series of the given order approximating f on [a, b].
+    f returns a tuple, one series is fitted per element.
+    """
+    N = order + 1
+    samples = [f(0.5 * (b - a) * math.cos(math.pi * (k + 0.5) / N) + 0.5 * (b + a)) for k in range(N)]
+    coeffs = []
+    for e in range(len(samples[0])):
+        c = []
+        for j in range(N):
+            s = 0.
+            for k in range(N):
+                s += samples[k][e] * math.cos(math.pi * j * (k + 0.5) / N)
+            c.append(2. * s / N)
+        coeffs.append(c)
+    return coeffs
+
+
+def clenshaw(c, x):
+    """
+    Evaluate the Chebyshev series c at x in [-1, 1].
+    """
+    b1, b2 = 0., 0.
+    for j in range(len(c) - 1, 0, -1):
+        b1, b2 = 2. * x * b1 - b2 + c[j], b1
+    return x * b1 - b2 + 0.5 * c[0]
+
+
+class ChebyshevFit:
+    """
+    Right ascension and declination of a body from Chebyshev polynomials
+    fitted over a window of days. The fit is redone when a date outside the
+    current window is requested, only the coefficients are kept.
+    """
+
+    def __init__(self, equatorial, order, window=1.):
+        self.equatorial = equatorial
+        self.order = order
+        self.window = window
+        self.a, self.b = 0., -1.
+        self.center = 0.  # right ascension at the window center
+        self.alpha = []
+        self.delta = []
+        self.fits = 0
+
+    def _unwrapped(self, d):
+        # right ascension continuous around the window center, the body moves less than pi per window
+        alpha, delta = self.equatorial(d)
+        return self.center + wrap_to_pi(alpha - self.center), delta
+
+    def fit(self, d):
+        self.a = math.floor(d / self.window) * self.window
+        self.b = self.a + self.window
+        self.center = self.equatorial(0.5 * (self.a + self.b))[0]
+        self.alpha, self.delta = chebyshev_fit(self._unwrapped, self.a, self.b, self.order)
+        self.fits += 1
+
+    def __call__(self, d):
+        if not self.a <= d < self.b:
+            self.fit(d)
+        x = (2. * d - self.a - self.b) / (self.b - self.a)
+        return clenshaw(self.alpha, x), clenshaw(self.delta, x)
+
+
+# evaluate positions from the chebyshev fits instead of the series, change with set_use_fits()
+use_fits = False
+lunar_fit = ChebyshevFit(lunar_equatorial, 6)
+solar_fit = ChebyshevFit(solar_equatorial, 3)
+
+
+def set_precision(tier):
+    global precision
+    precision = tier
+    # fits of the previous tier are stale
+    lunar_fit.a, lunar_fit.b = 0., -1.
+    solar_fit.a, solar_fit.b = 0., -1.
+    ephemeris.clear()
+
+
+def set_use_fits(enabled):
+    global use_fits
+    use_fits = enabled
+    # cached positions come from the other model
+    ephemeris.clear()
+
+
+def _calc_lunar_position(coords, date_time):
+    # unpack date time
+    year, month, day, hour, minute, second, weekday, yearday = date_time
+    # julian date, number of days since Jan 1st 2000, 12 UTC, julian centuries since 2000
+    return lunar_horizontal(coords, calc_julian_date(year, month, day, hour, minute, second))
+
 
+def lunar_horizontal(coords, d):
+    alpha, delta = lunar_fit(d) if use_fits else lunar_equatorial(d)
+    azim, elev = calc_horizontal(coords, d, alpha, delta)
+    if precision:
+        # parallax, the moon is seen from the surface and not the center of the earth
+        elev -= math.asin(6378.14 / calc_lunar_distance(d)) * math.cos(elev)
     return azim, elev
+
+
+def _calc_solar_position(coords, date_time):
+    # unpack date time
+    year, month, day, hour, minute, second, weekday, yearday = date_time
+    # julian date, number of days since Jan 1st 2000, 12 UTC, julian centuries since 2000
+    return solar_horizontal(coords, calc_julian_date(year, month, day, hour, minute, second))
+
+
+def solar_horizontal(coords, d):
+    alpha, delta = solar_fit(d) if use_fits else solar_equatorial(d)
+    return calc_horizontal(coords, d, alpha, delta)
+
+
+# orbital elements of the planets, valid from 1800 to 2050 (JPL, Approximate Positions of the Planets,
+# table 1), tuples of a [au], e, I, L, longitude of perihelion, longitude of the ascending node [deg]
+# at J2000 and their rates per julian century
+planet_elements = {
+    'earth': ((1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.),
+              (0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.)),
+    'venus': ((0.72333566, 0.00677672, 3.39467605, 181.97909950, 131.60246718, 76.67984255),
+              (0.00000390, -0.00004107, -0.00078890, 58517.81538729, 0.00268329, -0.27769418)),
+    'mars': ((1.52371034, 0.09339410, 1.84969142, -4.55343205, -23.94362959, 49.55953891),
+             (0.00001847, 0.00007882, -0.00813131, 19140.30268499, 0.44441088, -0.29257343)),
+    'jupiter': ((5.20288700, 0.04838624, 1.30439695, 34.39644051, 14.72847983, 100.47390909),
+                (-0.00011607, -0.00013253, -0.00183714, 3034.74612775, 0.21252668, 0.20469106)),
+}
+
+
+class Orbit:
+    """
+    Keplerian orbit of a planet around the sun.
+
+    Only the mean anomaly moves fast, the shape and orientation of the orbit are
+    updated once a year of the given times, which saves most of the trigonometry.
+    """
+
+    def __init__(self, elements, rates):
+        self.elements = elements
+        self.rates = rates
+        self.T = None  # time the orientation was computed for
+
+    def orient(self, T):
+        a, e, I, L, varpi, node = [x + r * T for x, r in zip(self.elements, self.rates)]
+        I, node, omega = math.radians(I), math.radians(node), math.radians(varpi - node)
+        cw, sw, cn, sn, ci = math.cos(omega), math.sin(omega), math.cos(node), math.sin(node), math.cos(I)
+        # ecliptic directions of perihelion and of the point 90 deg ahead
+        self.p = (cw * cn - sw * sn * ci, cw * sn + sw * cn * ci, sw * math.sin(I))
+        self.q = (-sw * cn - cw * sn * ci, -sw * sn + cw * cn * ci, cw * math.sin(I))
+        self.a, self.e = a, e
+        self.b = a * math.sqrt(1. - e * e)
+        self.T = T
+
+    def position(self, T):
+        """
+        Heliocentric ecliptic coordinates in au, T in julian centuries since J2000.
+        """
+        if self.T is None or abs(T - self.T) > 0.01:
+            self.orient(T)
+        # mean anomaly, L - varpi
+        M = math.radians((self.elements[3] - self.elements[4] + (self.rates[3] - self.rates[4]) * T) % 360.)
+        e = self.e
+        E = M + e * math.sin(M)
+        for _ in range(2):  # newton, e < 0.1
+            E -= (E - e * math.sin(E) - M) / (1. - e * math.cos(E))
+        x, y = self.a * (math.cos(E) - e), self.b * math.sin(E)
+        p, q = self.p, self.q
+        return p[0] * x + q[0] * y, p[1] * x + q[1] * y, p[2] * x + q[2] * y
+
+
+orbits = {name: Orbit(*planet_elements[name]) for name in planet_elements}
+cos_epsilon, sin_epsilon = math.cos(epsilon), math.sin(epsilon)
+
+
+def planet_equatorial(orbit, earth, T):
+    """
+    Right ascension and declination of a planet in radians, seen from the earth at heliocentric position earth.
+    """
+    x, y, z = orbit.position(T)
+    x, y, z = x - earth[0], y - earth[1], z - earth[2]
+    # ecliptic to equatorial
+    ye = y * cos_epsilon - z * sin_epsilon
+    ze = y * sin_epsilon + z * cos_epsilon
+    return math.atan2(ye, x) % (2. * math.pi), math.atan2(ze, math.sqrt(x * x + ye * ye))
+
+
+# bodies a sky snapshot knows
+bodies = ('sun', 'moon', 'venus', 'mars', 'jupiter')
+
+
+def sky_horizontal(coords, d, names=bodies):
+    """
+    Horizontal positions of several bodies at one instant, the coordinates, sidereal time
+    and earth position are computed once for all of them.
+
+    Returns:
+    ----------------
+    list : (float, float)
+        azimuth (north clockwise) and elevation in radians per body in the order of names
+    """
+    rlat, rlong = math.radians(coords[0]), math.radians(coords[1])
+    sin_lat, cos_lat = math.sin(rlat), math.cos(rlat)
+    theta = local_sidereal_time(d, rlong)
+    earth = None
+    positions = []
+    for name in names:
+        if name == 'sun':
+            alpha, delta = solar_fit(d) if use_fits else solar_equatorial(d)
+        elif name == 'moon':
+            alpha, delta = lunar_fit(d) if use_fits else lunar_equatorial(d)
+        else:
+            if earth is None:
+                T = d / 36525.
+                earth = orbits['earth'].position(T)
+            alpha, delta = planet_equatorial(orbits[name], earth, T)
+        azim, elev = azim_elev(sin_lat, cos_lat, wrap_to_0_2pi(theta - alpha), delta)
+        if name == 'moon' and precision:
+            elev -= math.asin(6378.14 / calc_lunar_distance(d)) * math.cos(elev)
+        positions.append((azim, elev))
+    return positions
+
+
+def _calc_sky(coords, date_time, names=bodies):
+    year, month, day, hour, minute, second, weekday, yearday = date_time
+    return sky_horizontal(coords, calc_julian_date(year, month, day, hour, minute, second), names)
+
+
+class EphemerisCache(LRU):
+    """
+    LRU cache of horizontal positions keyed by location, body and time bucket.
+
+    All times within a bucket of bucket_s seconds share the position computed
+    for the start of the bucket. Coordinates have to be hashable, i.e. tuples.
+    Least recently used positions are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=16, bucket_s=60):
+        LRU.__init__(self)
+        self.max_entries = max_entries
+        self.bucket_s = bucket_s
+        self.enabled = True
+
+    def get(self, coords, body, date_time):
+        """
+        Parameters:
+        ----------------
+        coords : tuple
+            latitude and longitude in degrees
+        body : int or tuple
+            0 for the sun, 1 for the moon or a tuple of names of bodies for a sky snapshot
+        date_time : tuple
+            utc time as returned by utime.localtime()
+
+        Returns:
+        ----------------
+        tuple : float, float
+            azimuth and elevation in radians, a list of them for a sky snapshot
+        """
+        if not self.enabled:
+            return self.compute(coords, body, date_time)
+        year, month, day, hour, minute, second, weekday, yearday = date_time
+        bucket = (hour * 3600 + minute * 60 + second) // self.bucket_s
+        key = (coords, body, year, month, day, bucket)
+        position = self.lookup(key)
+        if position is not None:
+            return position
+        s = bucket * self.bucket_s
+        position = self.compute(coords, body, (year, month, day, s // 3600, s // 60 % 60, s % 60, weekday, yearday))
+        while self.entries and len(self.entries) >= self.max_entries:
+            self.evict()
+        self.store(key, position)
+        return position
+
+    @staticmethod
+    def compute(coords, body, date_time):
+        if isinstance(body, tuple):
+            return _calc_sky(coords, date_time, body)
+        return _calc_lunar_position(coords, date_time) if body else _calc_solar_position(coords, date_time)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'uses': self.uses, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate()}
+
+
+ephemeris = EphemerisCache()
+
+
+def calc_lunar_position(coords, date_time):
+    return ephemeris.get(coords, 1, date_time)
+
+
+def calc_solar_position(coords, date_time):
+    return ephemeris.get(coords, 0, date_time)
+
+
+def calc_sky(coords, date_time, names=bodies):
+    """
+    Azimuth and elevation in radians of each of the bodies names at utc date_time, see sky_horizontal().
+    """
+    return ephemeris.get(coords, names, date_time)
+
+
+class Almanac:
+    """
+    Everything about one local day that only has to be computed once: rise and
+    set times of sun and moon, lunar phase and illumination and whether the day
+    is an equinox or solstice. Times are minutes after local midnight, -1 if
+    the body does not rise or set that day.
+    """
+
+    FORMAT = '<4sHBBffbbbhhhhff'
+    MAGIC = b'ALM2'
+
+    step = 10  # minutes between samples of the elevation
+    sun_horizon = math.radians(-0.833)  # upper limb at the horizon, with refraction
+    # geocentric elevation at precision 0, above lunar_horizontal() corrects for parallax
+    moon_horizons = (math.radians(0.125), math.radians(-0.833))
+
+    def __init__(self, coords, date, utc_offset=0):
+        self.coords = coords
+        self.date = date  # local year, month, day
+        self.utc_offset = utc_offset
+        self.precision = precision
+        self.event = -1
+        self.sunrise = self.sunset = -1
+        self.moonrise = self.moonset = -1
+        self.phase = 0.  # 0 new moon, 0.5 full moon
+        self.illumination = 0.
+
+    def matches(self, coords, date, utc_offset=0):
+        return (tuple(date) == tuple(self.date) and self.utc_offset == utc_offset and self.precision == precision
+                and abs(coords[0] - self.coords[0]) < 1e-4 and abs(coords[1] - self.coords[1]) < 1e-4)
+
+    def compute(self):
+        for _ in self.steps():
+            pass
+
+    def steps(self, batch=16):
+        """
+        compute() as generator yielding after every batch elevation samples, for callers that must not block.
+        """
+        year, month, day = self.date
+        d0 = calc_julian_date(year, month, day) - self.utc_offset / 24.  # local midnight
+        self.sunrise, self.sunset = yield from self.crossings(solar_horizontal, d0, self.sun_horizon, batch)
+        moon_horizon = self.moon_horizons[min(self.precision, 1)]
+        self.moonrise, self.moonset = yield from self.crossings(lunar_horizontal, d0, moon_horizon, batch)
+
+        # elongation of the moon at local noon
+        d = d0 + 0.5
+        alpha_s, delta_s = solar_equatorial(d)
+        alpha_m, delta_m = lunar_equatorial(d)
+        cos_psi = (math.sin(delta_s) * math.sin(delta_m)
+                   + math.cos(delta_s) * math.cos(delta_m) * math.cos(alpha_m - alpha_s))
+        self.illumination = (1. - cos_psi) / 2.
+        self.phase = wrap_to_0_2pi(alpha_m - alpha_s) / (2. * math.pi)
+
+        # event falling within the local day
+        self.event = -1
+        for i, e in enumerate(calc_equinoxes_solstices(year)):
+            if d0 <= e < d0 + 1.:
+                self.event = i
+
+    def crossings(self, horizontal, d0, horizon, batch):
+        """
+        First rise and set of a body between d0 and d0 + 1, returned by the generator.
+        """
+        rise, down = -1, -1
+        last = horizontal(self.coords, d0)[1] - horizon
+        for m in range(self.step, 1440 + self.step, self.step):
+            if m // self.step % batch == 0:
+                yield
+            elev = horizontal(self.coords, d0 + m / 1440.)[1] - horizon
+            if (last < 0.) != (elev < 0.):
+                t = int(m - self.step * elev / (elev - last) + 0.5)  # linear between the samples
+                if elev >= 0. and rise < 0:
+                    rise = min(t, 1439)
+                elif elev < 0. and down < 0:
+                    down = min(t, 1439)
+            last = elev
+        return rise, down
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(struct.pack(self.FORMAT, self.MAGIC, self.date[0], self.date[1], self.date[2],
+                                self.coords[0], self.coords[1], int(self.utc_offset * 4), self.precision, self.event,
+                                self.sunrise, self.sunset, self.moonrise, self.moonset,
+                                self.phase, self.illumination))
+
+    @staticmethod
+    def load(path):
+        """
+        Returns:
+        ----------------
+        Almanac :
+            the almanac saved at path, None if there is none
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != struct.calcsize(Almanac.FORMAT) or data[:4] != Almanac.MAGIC:
+            return None
+        (_, year, month, day, lat, long, offset, tier, event,
+         sunrise, sunset, moonrise, moonset, phase, illumination) = struct.unpack(Almanac.FORMAT, data)
+        a = Almanac((lat, long), (year, month, day), offset / 4)
+        a.precision = tier
+        a.sunrise, a.sunset, a.moonrise, a.moonset = sunrise, sunset, moonrise, moonset
+        a.phase, a.illumination = phase, illumination
+        a.event = event
+        return a
+
+
+almanac = None
+
+
+def daily_almanac(coords, date, utc_offset=0, path='almanac'):
+    """
+    Almanac of the given local date, taken from memory or flash if already computed.
+    A new one is saved to path, which keeps it across reboots, None to only keep it in memory.
+    """
+    for a in almanac_steps(coords, date, utc_offset, path):
+        pass
+    return a
+
+
+def almanac_steps(coords, date, utc_offset=0, path='almanac', batch=16):
+    """
+    daily_almanac() as generator for callers that must not block, e.g. timer callbacks.
+    Yields None while computing and the almanac last.
+    """
+    global almanac
+    a = almanac  # one entry shared by every caller, another location may replace it while stepping
+    if a is None or not a.matches(coords, date, utc_offset):
+        a = Almanac.load(path) if path else None
+        if a is None or not a.matches(coords, date, utc_offset):
+            a = Almanac(coords, date, utc_offset)
+            yield from a.steps(batch)
+            try:
+                if path:
+                    a.save(path)
+            except OSError:
+                pass  # read-only or full flash, recomputed next boot
+        almanac = a
+    yield a
+
+
+class EphemerisStream:
+    """
+    Positions of sun and moon at regular steps from a utc start time, computed when asked for.
+
+    Frames are addressed by their index, so frames skipped by a player are never computed.
+    """
+
+    def __init__(self, coords, start, end, step_s):
+        """
+        Parameters:
+        ----------------
+        coords : tuple
+            latitude and longitude in degrees
+        start, end : tuple
+            utc year, month, day[, hour, minute, second], end excluded
+        step_s : int
+            seconds between frames
+        """
+        self.coords = coords
+        self.start = tuple(start) + (0,) * (6 - len(start))
+        self.step_s = step_s
+        self.d0 = calc_julian_date(*self.start)
+        self.count = max(0, int(round((calc_julian_date(*end) - self.d0) * 86400. / step_s)))
+
+    def day_seconds(self, k):
+        # utc seconds after midnight of frame k
+        hour, minute, second = self.start[3:]
+        return (hour * 3600 + minute * 60 + second + k * self.step_s) % 86400
+
+    def get(self, k):
+        """
+        Returns:
+        ----------------
+        tuple : float, float, float, float
+            solar azimuth and elevation, lunar azimuth and elevation of frame k in radians
+        """
+        d = self.d0 + k * self.step_s / 86400.
+        solar_azim, solar_elev = solar_horizontal(self.coords, d)
+        lunar_azim, lunar_elev = lunar_horizontal(self.coords, d)
+        return solar_azim, solar_elev, lunar_azim, lunar_elev
+
+
+class EphemerisFile(EphemerisStream):
+    """
+    Positions precomputed by save_ephemeris(), read from flash one frame at a time.
+
+    File: header (see FORMAT) followed by count records of four int16 angles in 1/SCALE radians.
+    """
+
+    FORMAT = '<4sffHBBBBBIIB'
+    MAGIC = b'EPH1'
+    SCALE = 10000.
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.header = struct.calcsize(self.FORMAT)
+        (magic, lat, long, year, month, day, hour, minute, second,
+         self.step_s, self.count, self.precision) = struct.unpack(self.FORMAT, self.f.read(self.header))
+        if magic != self.MAGIC:
+            self.f.close()
+            raise ValueError('no ephemeris file')
+        self.coords = (lat, long)
+        self.start = (year, month, day, hour, minute, second)
+        self.d0 = calc_julian_date(*self.start)
+        self.record = bytearray(8)
+
+    def close(self):
+        self.f.close()
+
+    def get(self, k):
+        r = self.record
+        self.f.seek(self.header + 8 * k)
+        self.f.readinto(r)
+        s = self.SCALE
+        solar_azim, solar_elev, lunar_azim, lunar_elev = struct.unpack('<hhhh', r)
+        return solar_azim / s, solar_elev / s, lunar_azim / s, lunar_elev / s
+
+
+def save_ephemeris(path, coords, start, end, step_s):
+    """
+    Precompute the positions of sun and moon for a time-lapse and write them to path,
+    8 bytes per frame. Meant to run on a host, the file is then copied to the flash.
+    """
+    stream = EphemerisStream(coords, start, end, step_s)
+    s = EphemerisFile.SCALE
+    year, month, day, hour, minute, second = stream.start
+    with open(path, 'wb') as f:
+        f.write(struct.pack(EphemerisFile.FORMAT, EphemerisFile.MAGIC, coords[0], coords[1],
+                            year, month, day, hour, minute, second, step_s, stream.count, precision))
+        for k in range(stream.count):
+            f.write(struct.pack('<hhhh', *[int(round(a * s)) for a in stream.get(k)]))
+    return stream.count
@@ -0,0 +1,95 @@
+# checks the kernels of fast.py against their pure python versions and times both
+#
+#   import speedcheck        (on the device, via webrepl)
+#   python speedcheck.py     (on a host both sides are the python versions)
+#
+# every kernel is run on the same random input by both versions, the outputs have to be
+# identical byte by byte. the report lists microseconds per call and the speedup.
+
+import os
+
+import fast
+from hal import utime
+
+n = 180
+rounds = 20
+
+
+def random_bytes(count):
+    return bytearray(os.urandom(count))
+
+
+def fill_case(f, leds):
+    f(leds, (12, 200, 0, 255), n)
+
+
+def fade_case(f, leds, src):
+    for t in (0, 2, 3, 64, 128, 253, 254, 256):
+        f(leds, src, n * 4, t, 128)
+    f(leds, src, n * 4, 100, 256)
+
+
+def fade_indexed_case(f, leds, index, palette):
+    for t in (0, 2, 3, 64, 128, 253, 254, 256):
+        f(leds, index, palette, n, t, 128)
+    f(leds, index, palette, n, 100, 256)
+
+
+def blend_case(f, leds, kernels):
+    for kernel, start, lo, primary in kernels:
+        f(leds, kernel, start, lo, n, primary)
+
+
+def random_kernels():
+    kernels = []
+    for k in range(12):
+        w = random_bytes(1 + k)
+        w[0] = 128
+        w[-1] = 255  # a full weight
+        if k > 1:
+            w[1] = 2  # and one below the threshold
+        start = (w[0] + k * 37) % (2 * n) - n // 2  # wraps on both ends
+        kernels.append((w, start, start - 1 + k % 3, bytes(random_bytes(4))))
+    return kernels
+
+
+def timed(case, f, *args):
+    t0 = utime.ticks_us()
+    for _ in range(rounds):
+        case(f, *args)
+    return utime.ticks_diff(utime.ticks_us(), t0) / rounds
+
+
+def run():
+    src = random_bytes(n * 4)
+    start = random_bytes(n * 4)
+    kernels = random_kernels()
+    index = bytearray(i % 16 for i in random_bytes(n))
+    palette = random_bytes(4 * 16)
+    cases = (
+        ('fill', fill_case, fast.py_fill, fast.fill, ()),
+        ('fade', fade_case, fast.py_fade, fast.fade, (src,)),
+        ('fade_indexed', fade_indexed_case, fast.py_fade_indexed, fast.fade_indexed, (index, palette)),
+        ('blend_area', blend_case, fast.py_blend_area, fast.blend_area, (kernels,)),
+    )
+    print('native' if fast.native else 'python', 'kernels')
+    print('kernel        python [us]  fast [us]  speedup  identical')
+    ok = True
+    for name, case, slow, quick, args in cases:
+        a = bytearray(start)
+        b = bytearray(start)
+        case(slow, a, *args)
+        case(quick, b, *args)
+        same = a == b
+        ok = ok and same
+        t_slow = timed(case, slow, bytearray(start), *args)
+        t_quick = timed(case, quick, bytearray(start), *args)
+        print('{:12s} {:12.0f} {:10.0f} {:8.1f}  {}'.format(name, t_slow, t_quick, t_slow / max(t_quick, 1.), same))
+    return ok
+
+
+ok = run()
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,64 @@
+# host test: the static modes drawn into an indexed frame show exactly the colors of an rgbw buffer
+#
+#   python -m pytest test_indexed.py
+
+import paris
+from indexed import IndexedFrame
+from output import Recorder
+
+
+def maps():
+    indexed = paris.Map(driver=Recorder(), almanac_path=None)
+    rgbw = paris.Map(driver=Recorder(), almanac_path=None)
+    indexed.leds1 = IndexedFrame(paris.n)
+    rgbw.leds1 = bytearray(paris.n * 4)
+    return indexed, rgbw
+
+
+def colors(leds):
+    if isinstance(leds, IndexedFrame):
+        out = bytearray(paris.n * 4)
+        leds.expand(out)
+        return out
+    return leds
+
+
+def check(mode, *args):
+    indexed, rgbw = maps()
+    getattr(indexed, mode)(*args)
+    getattr(rgbw, mode)(*args)
+    assert colors(indexed.leds1) == rgbw.leds1
+    assert indexed.leds0 == rgbw.leds0
+    return indexed
+
+
+def test_sides_gradient():
+    # four side gradients need more colors than the palette holds
+    m = check('set_sides', (200, 0, 0, 0), (0, 200, 0, 0), (0, 0, 200, 0), (0, 0, 0, 200), False)
+    assert isinstance(m.leds1, bytearray)
+
+
+def test_sides_linear():
+    m = check('set_sides', (200, 0, 0, 0), (0, 200, 0, 0), (0, 0, 200, 0), (0, 0, 0, 200), True)
+    assert isinstance(m.leds1, IndexedFrame)
+
+
+def test_circular_background():
+    check('set_circular_background', (200, 100, 50, 255))
+
+
+def test_circular_background_after_interp():
+    # the colors of the mode before are dropped, both fit the palette on their own
+    indexed, rgbw = maps()
+    for m in (indexed, rgbw):
+        m.set_vertical_interp((200, 0, 0, 0), (0, 200, 0, 0))
+        m.set_circular_background((200, 100, 50, 255))
+    assert colors(indexed.leds1) == rgbw.leds1
+    assert isinstance(indexed.leds1, IndexedFrame)
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('ok')
@@ -1,12 +1,272 @@
-import ntptime
-import utime
+try:
+    import usocket
+    import ustruct
+except ImportError:
+    import socket as usocket
+    import struct as ustruct
 
+from hal import utime, RTC
 
-def update_time():
-    while True:
+# ntp server
+host = 'pool.ntp.org'
+
+# seconds between the ntp epoch (1900) and the local epoch (2000 on the esp8266, 1970 on unix ports)
+NTP_DELTA = 3155673600 if utime.localtime(0)[0] == 2000 else 2208988800
+
+
+def ntp_address():
+    # blocks for the dns lookup
+    return usocket.getaddrinfo(host, 123)[0][-1]
+
+
+def ntp_send(addr, timeout=None):
+    """
+    Send a request to the ntp server.
+
+    Parameters:
+    ----------------
+    timeout : float
+        seconds a receive on the socket may block, None for a non-blocking socket
+
+    Returns:
+    ----------------
+    tuple : socket, int
+        socket the reply arrives on and the ticks_ms value the request was sent at
+    """
+    msg = bytearray(48)
+    msg[0] = 0x1B  # li = 0, vn = 3, mode = 3 (client)
+    s = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+    try:
+        if timeout is None:
+            s.setblocking(False)
+        else:
+            s.settimeout(timeout)
+        t0 = utime.ticks_ms()
+        s.sendto(msg, addr)
+    except OSError:
+        s.close()
+        raise
+    return s, t0
+
+
+def ntp_time(msg, t0, t1):
+    """
+    Reference time of a reply sent at t0 and received at t1 (ticks_ms).
+
+    Returns:
+    ----------------
+    tuple : int, int, int
+        epoch seconds, milliseconds within that second and the ticks_ms value they refer to
+    """
+    sec, frac = ustruct.unpack('!II', msg[40:48])
+    # fraction is in units of 2^-32 s, shift first to stay within small ints
+    ms = ((frac >> 16) * 1000 >> 16) + utime.ticks_diff(t1, t0) // 2  # assume symmetric round trip
+    return sec - NTP_DELTA + ms // 1000, ms % 1000, t1
+
+
+def query_ntp(timeout=1, addr=None):
+    """
+    Query the ntp server once and wait for the reply.
+
+    Returns:
+    ----------------
+    tuple : int, int, int
+        epoch seconds, milliseconds within that second and the ticks_ms value they refer to
+    """
+    s, t0 = ntp_send(addr or ntp_address(), timeout)
+    try:
+        msg = s.recv(48)
+        t1 = utime.ticks_ms()
+    finally:
+        s.close()
+    return ntp_time(msg, t0, t1)
+
+
+class SoftClock:
+    """
+    Millisecond clock running on ticks_ms and anchored at each ntp sync.
+
+    The rate of the local ticks against the reference is estimated from the
+    offset observed at each sync and applied to all reads in between.
+    Resyncs happen in the background via service() with exponential backoff
+    on failure. service() never waits for the server: it sends the request
+    and picks the reply up on a later call, so it can run in a timer callback.
+    The server address is looked up once and kept.
+    """
+
+    def __init__(self, interval_s=3600, min_backoff_ms=1000, max_backoff_ms=600000):
+        # reference time at the anchor
+        self.anchor_s = 0
+        self.anchor_ms = 0
+        self.anchor_ticks = utime.ticks_ms()
+
+        # reference ms per local ms
+        self.rate = 1.
+        self.max_drift = 0.01  # reject rates off by more than 1 %
+
+        self.synced = False
+        self.n_syncs = 0
+        self.last_offset_ms = 0
+
+        # sync scheduling
+        self.interval_ms = interval_s * 1000
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.backoff_ms = min_backoff_ms
+        self.next_sync = self.anchor_ticks
+
+        # request in flight
+        self.addr = None
+        self.pending = None  # socket awaiting the reply
+        self.sent = 0
+        self.timeout_ms = 1000
+
+    def now(self):
+        """
+        Returns:
+        ----------------
+        tuple : int, int
+            epoch seconds and milliseconds
+        """
+        elapsed = utime.ticks_diff(utime.ticks_ms(), self.anchor_ticks)
+        total = self.anchor_ms + int(elapsed * self.rate)
+        return self.anchor_s + total // 1000, total % 1000
+
+    def time_of_day(self, utc_offset=0):
+        """
+        Returns:
+        ----------------
+        tuple : int, int, int, int
+            hours, minutes, seconds and milliseconds
+        """
+        s, ms = self.now()
+        s = (s + utc_offset * 3600) % 86400
+        return s // 3600, s // 60 % 60, s % 60, ms
+
+    def localtime(self, utc_offset=0):
+        """
+        Same tuple as utime.localtime(): year, month, day, hour, minute, second, weekday, yearday
+        """
+        return utime.localtime(self.now()[0] + utc_offset * 3600)
+
+    @property
+    def drift_ppm(self):
+        return int((self.rate - 1.) * 1e6)
+
+    def set(self, s, ms, ticks):
+        """
+        Anchor the clock at a reference time measured at ticks and update the rate estimate.
+        """
+        if self.synced:
+            elapsed = utime.ticks_diff(ticks, self.anchor_ticks)
+            total = self.anchor_ms + int(elapsed * self.rate)
+            # offset of the reference against our prediction
+            offset = (s - self.anchor_s - total // 1000) * 1000 + ms - total % 1000
+            self.last_offset_ms = offset
+            # only long intervals and small offsets say something about the rate, everything else is a step
+            if elapsed > 60000 and abs(offset) < 5000:
+                rate = self.rate + 0.5 * offset / elapsed  # smooth out network jitter
+                if abs(rate - 1.) < self.max_drift:
+                    self.rate = rate
+        self.anchor_s, self.anchor_ms, self.anchor_ticks = s, ms, ticks
+        self.synced = True
+        self.n_syncs += 1
+
+    def sync(self):
+        """
+        Query the server and wait for the reply.
+
+        Returns:
+        ----------------
+        bool :
+            whether the clock could be synced
+        """
         try:
-            ntptime.settime()
-            break
+            if self.addr is None:
+                self.addr = ntp_address()
+            s, ms, ticks = query_ntp(self.timeout_ms / 1000., self.addr)
         except OSError:
-            utime.sleep_ms(10)
-    # print('time:', utime.localtime())
+            self.failed()
+            return False
+        self.synced_at(s, ms, ticks)
+        return True
+
+    def wait(self, timeout_ms=30000):
+        """
+        Sync, retrying with backoff for at most timeout_ms.
+
+        Returns:
+        ----------------
+        bool :
+            whether the clock could be synced
+        """
+        deadline = utime.ticks_add(utime.ticks_ms(), timeout_ms)
+        while not self.sync():
+            now = utime.ticks_ms()
+            left = utime.ticks_diff(deadline, now)
+            if left <= 0:
+                return False
+            utime.sleep_ms(min(left, utime.ticks_diff(self.next_sync, now)))
+        return True
+
+    def synced_at(self, s, ms, ticks):
+        self.set(s, ms, ticks)
+        # keep the rtc in line for everything still reading utime.localtime()
+        y, mo, d, h, mi, sec, wd, yd = utime.localtime(s)
+        RTC().datetime((y, mo, d, wd, h, mi, sec, 0))
+        self.backoff_ms = self.min_backoff_ms
+        self.next_sync = utime.ticks_add(ticks, self.interval_ms)
+
+    def failed(self):
+        self.next_sync = utime.ticks_add(utime.ticks_ms(), self.backoff_ms)
+        self.backoff_ms = min(2 * self.backoff_ms, self.max_backoff_ms)
+
+    def start_sync(self):
+        """
+        Send a request without waiting, poll_sync() takes the reply.
+        """
+        try:
+            if self.addr is None:
+                self.addr = ntp_address()  # only blocks until the first lookup succeeded
+            self.pending, self.sent = ntp_send(self.addr)
+        except OSError:
+            self.failed()
+
+    def poll_sync(self):
+        try:
+            msg = self.pending.recv(48)
+        except OSError:  # nothing received yet
+            if utime.ticks_diff(utime.ticks_ms(), self.sent) < self.timeout_ms:
+                return
+            msg = None
+        ticks = utime.ticks_ms()
+        self.pending.close()
+        self.pending = None
+        if msg is None or len(msg) < 48:
+            self.failed()
+        else:
+            self.synced_at(*ntp_time(msg, self.sent, ticks))
+
+    def service(self):
+        """
+        Resync if due, without blocking. Call periodically, e.g. from a timer.
+
+        Returns:
+        ----------------
+        bool :
+            whether a reply is awaited. the reply is timed when it is polled,
+            so call more often until it arrives (half the period is the error)
+        """
+        if self.pending is not None:
+            self.poll_sync()
+        elif utime.ticks_diff(utime.ticks_ms(), self.next_sync) >= 0:
+            self.start_sync()
+        return self.pending is not None
+
+
+clock = SoftClock()
+
+
+def update_time(timeout_ms=30000):
+    # block until the first sync or the timeout, service() keeps trying in the background
+    return clock.wait(timeout_ms)